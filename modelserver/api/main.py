@@ -3,12 +3,17 @@ ModelServer FastAPI 主应用
 提供训练、聊天、模型管理等 API 接口
 通过模块化路由实现更好的代码组织
 """
-from fastapi import FastAPI
+import asyncio
+
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
-from core import OllamaTrainer
+from core import (OllamaTrainer, disease_detector, forecast_service, context_budget,
+                  chat_sessions, conversation_summarizer, embedding_service, model_prewarmer, ollama_client)
 from utils import logger
-from api.routes import train_routes, chat_routes, model_routes, progress_routes, agricultural_routes
+from api.routes import (train_routes, chat_routes, model_routes, progress_routes, agricultural_routes,
+                        embed_routes)
 
 # 创建 FastAPI 应用
 app = FastAPI(
@@ -32,6 +37,7 @@ app.include_router(chat_routes.router)
 app.include_router(model_routes.router)
 app.include_router(progress_routes.router)
 app.include_router(agricultural_routes.router)
+app.include_router(embed_routes.router)
 
 # 初始化组件
 trainer = OllamaTrainer()
@@ -48,6 +54,12 @@ async def root():
     }
 
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus 指标"""
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
 # ==================== 启动和关闭事件 ====================
 
 @app.on_event("startup")
@@ -55,6 +67,13 @@ async def startup_event():
     """应用启动时执行"""
     logger.info("ModelServer API 启动中...")
     logger.info(f"Ollama 状态: {'可用' if trainer.check_ollama_available() else '不可用'}")
+    disease_detector.load()
+    embedding_service.load()
+    forecast_service.start()
+    # 后台预热最常用的老人模型，进度见 /health
+    model_prewarmer.start()
+    # 后台预加载分词器，避免首个聊天请求等待
+    asyncio.get_running_loop().run_in_executor(None, context_budget.counter.load)
     logger.info("ModelServer API 已启动")
 
 
@@ -65,6 +84,13 @@ async def shutdown_event():
     # 清理资源
     from core.progress_tracker import progress_tracker
     progress_tracker.cleanup_old_jobs()
+    await disease_detector.close()
+    await forecast_service.stop()
+    await conversation_summarizer.stop()
+    await model_prewarmer.stop()
+    await embedding_service.close()
+    await chat_sessions.close()
+    await ollama_client.close()
     logger.info("ModelServer API 已关闭")
 
 
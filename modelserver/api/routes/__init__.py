@@ -6,4 +6,5 @@ Each module handles a specific set of endpoints:
 - chat_routes: Chat-related endpoints
 - model_routes: Model management endpoints
 - progress_routes: Progress tracking endpoints
+- embed_routes: Text embedding endpoints
 """
\ No newline at end of file
@@ -1,8 +1,27 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from pydantic import BaseModel, ValidationError
 from typing import Optional, List
+from pathlib import PurePosixPath
+import asyncio
+import json
 import random
 import datetime
+import tempfile
+import time
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ModuleNotFoundError:
+    # python-multipart 0.0.13 之前的模块名
+    from multipart.multipart import MultipartParser, parse_options_header
+
+from core import disease_detector, knowledge_base, forecast_service, rule_engine, task_planner
+from utils.buffer_pool import UploadTooLargeError
+from utils.image_archive import (
+    ARCHIVE_CONTENT_TYPES, archive_kind, is_image_member, iter_archive_images
+)
 
 router = APIRouter(prefix="/agricultural", tags=["Agricultural AI"])
 
@@ -22,68 +41,505 @@ class DiseaseDetectionResponse(BaseModel):
     severity: Optional[str] = None
 
 
-@router.post("/disease-detect", response_model=DiseaseDetectionResponse)
-async def detect_disease(request: DiseaseDetectionRequest):
-    try:
-        disease_db = {
-            "水稻": ["稻瘟病", "白叶枯病", "纹枯病"],
-            "小麦": ["锈病", "白粉病", "赤霉病"],
-            "玉米": ["大斑病", "小斑病", "粗缩病"],
-            "番茄": ["早疫病", "晚疫病", "灰霉病"],
-            "黄瓜": ["霜霉病", "白粉病", "枯萎病"],
-            "大豆": ["根腐病", "灰斑病", "疫病"]
-        }
+# multipart 文本字段（cropName、variety 等）的长度上限
+MAX_FORM_FIELD_SIZE = 64 * 1024
 
-        treatments = {
-            "稻瘟病": "使用三环唑、富士一号等药剂防治，注意田间水肥管理",
-            "白叶枯病": "使用叶枯唑、噻森铜等药剂防治，避免淹灌",
-            "纹枯病": "使用井冈霉素、己唑醇等药剂防治，适当稀植",
-            "锈病": "使用三唑类杀菌剂喷雾防治，注意抗药性管理",
-            "白粉病": "使用醚菌酯、苯醚甲环唑等药剂防治",
-            "赤霉病": "在扬花期使用多菌灵、戊唑醇等药剂防治",
-            "大斑病": "使用代森锰锌、苯醚甲环唑等药剂防治",
-            "小斑病": "使用甲基硫菌灵、嘧菌酯等药剂防治",
-            "早疫病": "使用代森锰锌、百菌清等药剂防治",
-            "晚疫病": "使用甲霜灵、烯酰吗啉等药剂防治",
-            "灰霉病": "使用嘧霉胺、异菌脲等药剂防治",
-            "霜霉病": "使用甲霜灵、烯酰吗啉等药剂防治",
-            "白粉病": "使用三唑类、醚菌酯等药剂防治"
+# 同一路径支持三种请求体：JSON（base64，兼容旧客户端）、multipart 表单、原始二进制
+DISEASE_DETECT_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {"schema": DiseaseDetectionRequest.model_json_schema()},
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["image", "cropName"],
+                    "properties": {
+                        "image": {"type": "string", "format": "binary"},
+                        "cropName": {"type": "string"},
+                        "variety": {"type": "string"}
+                    }
+                }
+            },
+            "application/octet-stream": {"schema": {"type": "string", "format": "binary"}}
         }
+    },
+    "parameters": [
+        {"name": "cropName", "in": "query", "required": False, "schema": {"type": "string"},
+         "description": "作物名称（application/octet-stream 上传时必填）"},
+        {"name": "variety", "in": "query", "required": False, "schema": {"type": "string"}}
+    ]
+}
+
+
+async def _read_stream_into(chunks, buffer: bytearray) -> int:
+    """把异步数据块流按块写入复用缓冲区，返回数据长度"""
+    size = 0
+    async for chunk in chunks:
+        if chunk:
+            size = disease_detector.upload_buffers.write(buffer, size, chunk)
+    return size
+
 
-        descriptions = {
-            "稻瘟病": "真菌性病害，叶片上出现梭形病斑，严重时导致整株枯死",
-            "白叶枯病": "细菌性病害，叶片边缘出现黄白色枯斑，后卷曲枯萎",
-            "纹枯病": "真菌性病害，茎基部出现水渍状病斑，后形成云纹状斑",
-            "锈病": "真菌性病害，叶片上出现铁锈色粉末状孢子堆",
-            "白粉病": "真菌性病害，叶片表面出现白色粉状物",
-            "赤霉病": "真菌性病害，穗部出现粉红色霉状物"
+class _MultipartImageReader:
+    """
+    流式解析 multipart 请求体：文件字段 image 的数据块直接写入复用缓冲区，
+    其余文本字段收集到 fields（不经过 Starlette 的临时文件，也不额外复制整张图片）
+    """
+
+    def __init__(self, buffer: bytearray):
+        self.buffer = buffer
+        self.size = 0
+        self.has_image = False
+        self.fields = {}
+        self._headers = {}
+        self._header_field = bytearray()
+        self._header_value = bytearray()
+        self._name = ""
+        self._is_file = False
+        self._writing = False
+        self._text = bytearray()
+
+    def callbacks(self):
+        return {
+            'on_part_begin': self._on_part_begin,
+            'on_header_field': lambda data, start, end: self._header_field.extend(data[start:end]),
+            'on_header_value': lambda data, start, end: self._header_value.extend(data[start:end]),
+            'on_header_end': self._on_header_end,
+            'on_headers_finished': self._on_headers_finished,
+            'on_part_data': self._on_part_data,
+            'on_part_end': self._on_part_end
         }
 
-        detected = random.random() > 0.3
+    def _on_part_begin(self):
+        self._headers.clear()
+        self._text.clear()
+
+    def _on_header_end(self):
+        self._headers[bytes(self._header_field).lower()] = bytes(self._header_value)
+        self._header_field.clear()
+        self._header_value.clear()
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        self._name = options.get(b"name", b"").decode("utf-8", "replace")
+        self._is_file = b"filename" in options
+        # 只读取第一个 image 文件，其余文件字段忽略
+        self._writing = self._is_file and self._name == "image" and not self.has_image
+        self.has_image = self.has_image or self._writing
+
+    def _on_part_data(self, data, start, end):
+        if self._writing:
+            self.size = disease_detector.upload_buffers.write(self.buffer, self.size, memoryview(data)[start:end])
+        elif not self._is_file:
+            if len(self._text) + end - start > MAX_FORM_FIELD_SIZE:
+                raise ValueError(f"表单字段 {self._name} 过长")
+            self._text.extend(data[start:end])
+
+    def _on_part_end(self):
+        if not self._is_file:
+            self.fields[self._name] = self._text.decode("utf-8", "replace")
+        self._writing = False
+
+    async def read(self, http_request: Request):
+        """读取并解析整个请求体"""
+        _, params = parse_options_header(http_request.headers.get("content-type", ""))
+        boundary = params.get(b"boundary")
+        if not boundary:
+            raise ValueError("multipart 请求缺少 boundary")
+        parser = MultipartParser(boundary, self.callbacks())
+        async for chunk in http_request.stream():
+            parser.write(chunk)
+        parser.finalize()
+
+
+@router.post("/disease-detect", response_model=DiseaseDetectionResponse,
+             openapi_extra=DISEASE_DETECT_OPENAPI)
+async def detect_disease(http_request: Request):
+    content_type = http_request.headers.get("content-type", "").split(";")[0].strip().lower()
+    
+    try:
+        # JSON + base64（兼容旧客户端）
+        if content_type in ("", "application/json"):
+            request = DiseaseDetectionRequest.model_validate_json(await http_request.body())
+            image_bytes = await disease_detector.decode_base64(request.image)
+            return await _detect_and_describe(image_bytes, request.cropName, request.variety)
+        
+        if content_type not in ("multipart/form-data", "application/octet-stream") \
+                and not content_type.startswith("image/"):
+            raise HTTPException(status_code=415, detail=f"不支持的 Content-Type: {content_type}")
+        
+        upload_buffers = disease_detector.upload_buffers
+        content_length = int(http_request.headers.get("content-length") or 0)
+        if content_length > upload_buffers.max_size:
+            raise UploadTooLargeError(f"上传内容超过 {upload_buffers.max_size // 1024 // 1024}MB 限制")
         
-        if detected and request.cropName in disease_db:
-            disease_name = random.choice(disease_db[request.cropName])
-            confidence = round(random.uniform(0.7, 0.98), 2)
+        # 二进制上传：按块读入复用缓冲区，直接从缓冲区解码
+        buffer = upload_buffers.acquire()
+        reusable = True
+        try:
+            if content_type == "multipart/form-data":
+                reader = _MultipartImageReader(buffer)
+                await reader.read(http_request)
+                if not reader.has_image:
+                    raise HTTPException(status_code=422, detail="缺少图片文件字段 image")
+                crop_name = reader.fields.get("cropName")
+                variety = reader.fields.get("variety")
+                size = reader.size
+            else:
+                crop_name = http_request.query_params.get("cropName")
+                variety = http_request.query_params.get("variety")
+                size = await _read_stream_into(http_request.stream(), buffer)
             
-            return DiseaseDetectionResponse(
-                detected=True,
-                diseaseName=disease_name,
-                confidence=confidence,
-                description=descriptions.get(disease_name, "植物病害"),
-                treatment=treatments.get(disease_name, "建议咨询农业专家"),
-                severity=random.choice(["轻微", "中等", "严重"])
-            )
-        else:
-            return DiseaseDetectionResponse(
-                detected=False,
-                confidence=0.95,
-                description="植物健康，未检测到病害"
-            )
+            if not crop_name:
+                raise HTTPException(status_code=422, detail="缺少 cropName")
+            if size == 0:
+                raise HTTPException(status_code=422, detail="图片内容为空")
             
+            view = memoryview(buffer)[:size]
+            try:
+                return await _detect_and_describe(view, crop_name, variety)
+            finally:
+                view.release()
+        
+        except asyncio.CancelledError:
+            # 解码线程可能仍在读取缓冲区，取消时不归还复用
+            reusable = False
+            raise
+        finally:
+            if reusable:
+                upload_buffers.release(buffer)
+    
+    except HTTPException:
+        raise
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=json.loads(e.json()))
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _detect_and_describe(image_bytes, crop_name: str,
+                               variety: Optional[str] = None) -> DiseaseDetectionResponse:
+    """执行检测并补充病害描述与防治建议"""
+    crop = knowledge_base.resolve_crop(crop_name) or crop_name
+    candidates = list(knowledge_base.diseases_for(crop))
+    result = await disease_detector.detect(image_bytes, candidates, crop, variety)
+    
+    if result['detected']:
+        disease_name = result['diseaseName']
+        confidence = result['confidence']
+        
+        if disease_detector.is_model_loaded:
+            # 分类模型不直接输出严重程度，按置信度粗分
+            severity = "严重" if confidence >= 0.9 else "中等" if confidence >= 0.75 else "轻微"
+        else:
+            severity = random.choice(["轻微", "中等", "严重"])
+        
+        info = knowledge_base.disease_info(disease_name, crop)
+        return DiseaseDetectionResponse(
+            detected=True,
+            diseaseName=disease_name,
+            confidence=confidence,
+            description=info.description,
+            treatment=info.treatment,
+            severity=severity
+        )
+    else:
+        return DiseaseDetectionResponse(
+            detected=False,
+            confidence=result['confidence'],
+            description="植物健康，未检测到病害"
+        )
+
+
+@router.get("/disease-detect/cache-stats")
+async def disease_cache_stats():
+    """病害检测结果缓存的命中率统计"""
+    if disease_detector.cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **disease_detector.cache.stats()}
+
+
+# 批量检测：multipart 多文件，或整个 zip / tar(.gz) 压缩包
+BULK_DETECT_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["images"],
+                    "properties": {
+                        "images": {
+                            "type": "array",
+                            "items": {"type": "string", "format": "binary"},
+                            "description": "图片文件，也可以是 zip / tar 压缩包"
+                        },
+                        "cropName": {"type": "string"},
+                        "variety": {"type": "string"}
+                    }
+                }
+            },
+            "application/zip": {"schema": {"type": "string", "format": "binary"}},
+            "application/x-tar": {"schema": {"type": "string", "format": "binary"}},
+            "application/gzip": {"schema": {"type": "string", "format": "binary"}}
+        }
+    },
+    "parameters": [
+        {"name": "cropName", "in": "query", "required": False, "schema": {"type": "string"},
+         "description": "所有图片的作物名称；不填时取图片所在目录名（压缩包按“作物名/图片”组织）"},
+        {"name": "variety", "in": "query", "required": False, "schema": {"type": "string"}}
+    ]
+}
+
+SPOOL_MEMORY_SIZE = 16 * 1024 * 1024
+
+
+def _crop_from_path(name: str, default_crop: Optional[str]) -> Optional[str]:
+    """确定图片的作物：优先使用请求中的 cropName，否则取所在目录名（统一为标准作物名）"""
+    crop_name = default_crop or PurePosixPath(name).parent.name
+    if not crop_name:
+        return None
+    return knowledge_base.resolve_crop(crop_name) or crop_name
+
+
+async def _spool_body(http_request: Request, max_size: int):
+    """把请求体按块写入临时文件（小包留在内存），供压缩包随机读取"""
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_SIZE)
+    size = 0
+    try:
+        async for chunk in http_request.stream():
+            size += len(chunk)
+            if size > max_size:
+                raise UploadTooLargeError(f"上传内容超过 {max_size // 1024 // 1024}MB 限制")
+            spool.write(chunk)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+
+async def _iterate_in_thread(iterator):
+    """在线程池中推进同步迭代器（解压与读盘不阻塞事件循环）"""
+    loop = asyncio.get_running_loop()
+    done = object()
+    while True:
+        item = await loop.run_in_executor(None, next, iterator, done)
+        if item is done:
+            return
+        yield item
+
+
+async def _iter_form_images(form, max_image_size: int):
+    """依次产出 multipart 表单中的图片，压缩包文件会被展开"""
+    for _, upload in form.multi_items():
+        if isinstance(upload, str):
+            continue
+        kind = archive_kind(upload.filename)
+        if kind:
+            async for item in _iterate_in_thread(iter_archive_images(upload.file, kind, max_image_size)):
+                yield item
+            continue
+
+        name = upload.filename or "image"
+        if not is_image_member(name) and not (upload.content_type or "").startswith("image/"):
+            continue
+        if upload.size is not None and upload.size > max_image_size:
+            yield name, None, UploadTooLargeError(f"图片超过 {max_image_size // 1024 // 1024}MB 限制")
+            continue
+        yield name, await upload.read(), None
+
+
+async def _stream_bulk_results(images, default_crop: Optional[str], variety: Optional[str],
+                               concurrency: int, max_images: int, cleanup):
+    """
+    以有限并发检测图片，按完成顺序逐行输出 NDJSON，最后输出按作物汇总的统计
+
+    :param images: 产出 (名称, 图片字节, 错误) 的异步迭代器
+    :param default_crop: 请求指定的作物名称
+    :param variety: 品种
+    :param concurrency: 同时检测的图片数（也限制了内存中的图片数）
+    :param max_images: 单次请求最多处理的图片数
+    :param cleanup: 结束后释放上传资源的协程函数（可重复调用）
+    """
+    started = time.perf_counter()
+    semaphore = asyncio.Semaphore(concurrency)
+    lines: asyncio.Queue = asyncio.Queue()
+    tasks = set()
+
+    async def detect_one(index: int, name: str, data: Optional[bytes], error: Optional[Exception]):
+        crop_name = _crop_from_path(name, default_crop)
+        try:
+            if error is not None:
+                raise error
+            if not crop_name:
+                raise ValueError("无法确定作物名称（请提供 cropName 或按“作物名/图片”组织压缩包）")
+            response = await _detect_and_describe(data, crop_name, variety)
+            line = {"type": "result", "index": index, "name": name, "cropName": crop_name,
+                    **response.model_dump()}
+        except Exception as e:
+            line = {"type": "error", "index": index, "name": name, "cropName": crop_name, "error": str(e)}
+        finally:
+            semaphore.release()
+        await lines.put(line)
+
+    async def produce():
+        index = 0
+        try:
+            while True:
+                # 先占用并发名额再读取下一张，未处理的图片不会堆积在内存中
+                await semaphore.acquire()
+                item = await anext(images, None)
+                if item is None:
+                    semaphore.release()
+                    break
+                if index >= max_images:
+                    semaphore.release()
+                    await lines.put({"type": "error", "index": index,
+                                     "error": f"超过单次最多 {max_images} 张图片的限制，其余图片未处理"})
+                    break
+                tasks.add(asyncio.create_task(detect_one(index, *item)))
+                index += 1
+        except Exception as e:
+            await lines.put({"type": "error", "index": index, "error": str(e)})
+        if tasks:
+            await asyncio.gather(*tasks)
+        await lines.put(None)
+
+    crops = {}
+    totals = {"total": 0, "succeeded": 0, "failed": 0}
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            line = await lines.get()
+            if line is None:
+                break
+
+            if "name" in line:
+                totals["total"] += 1
+                crop_stats = crops.setdefault(line.get("cropName") or "未知", {
+                    "images": 0, "healthy": 0, "diseased": 0, "failed": 0, "diseases": {}
+                })
+                crop_stats["images"] += 1
+                if line["type"] == "error":
+                    totals["failed"] += 1
+                    crop_stats["failed"] += 1
+                elif line["detected"]:
+                    totals["succeeded"] += 1
+                    crop_stats["diseased"] += 1
+                    diseases = crop_stats["diseases"]
+                    diseases[line["diseaseName"]] = diseases.get(line["diseaseName"], 0) + 1
+                else:
+                    totals["succeeded"] += 1
+                    crop_stats["healthy"] += 1
+
+            yield json.dumps(line, ensure_ascii=False) + "\n"
+
+        yield json.dumps({
+            "type": "summary",
+            **totals,
+            "crops": crops,
+            "elapsedMs": round((time.perf_counter() - started) * 1000, 1)
+        }, ensure_ascii=False) + "\n"
+    finally:
+        # 客户端断开时取消尚未完成的检测
+        producer.cancel()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(producer, *tasks, return_exceptions=True)
+        await cleanup()
+
+
+@router.post("/disease-detect/bulk", openapi_extra=BULK_DETECT_OPENAPI)
+async def detect_disease_bulk(http_request: Request):
+    """
+    批量病害检测（无人机/巡田图片）
+
+    接受 multipart 多文件或 zip / tar 压缩包，以 application/x-ndjson 流式返回：
+    每张图片检测完成即输出一行结果（type=result/error），最后一行为按作物汇总的 summary
+    """
+    content_type = http_request.headers.get("content-type", "").split(";")[0].strip().lower()
+    bulk_config = disease_detector.detection_config.get('bulk', {})
+    max_upload = int(bulk_config.get('max_upload_mb', 512) * 1024 * 1024)
+    max_images = bulk_config.get('max_images', 1000)
+    max_image_size = disease_detector.upload_buffers.max_size
+
+    default_crop = http_request.query_params.get("cropName")
+    variety = http_request.query_params.get("variety")
+    resources = []
+
+    async def cleanup():
+        # 流结束时与响应的后台任务各调用一次（客户端在开始读取前断开时只有后者会执行）
+        while resources:
+            result = resources.pop().close()
+            if asyncio.iscoroutine(result):
+                await result
+
+    try:
+        content_length = int(http_request.headers.get("content-length") or 0)
+        if content_length > max_upload:
+            raise UploadTooLargeError(f"上传内容超过 {max_upload // 1024 // 1024}MB 限制")
+
+        if content_type == "multipart/form-data":
+            form = await http_request.form(max_files=max_images, max_fields=max_images + 10)
+            resources.append(form)
+            default_crop = form.get("cropName") or default_crop
+            variety = form.get("variety") or variety
+            images = _iter_form_images(form, max_image_size)
+        elif content_type in ARCHIVE_CONTENT_TYPES:
+            spool = await _spool_body(http_request, max_upload)
+            resources.append(spool)
+            images = _iterate_in_thread(
+                iter_archive_images(spool, ARCHIVE_CONTENT_TYPES[content_type], max_image_size)
+            )
+        else:
+            raise HTTPException(status_code=415, detail=f"不支持的 Content-Type: {content_type}")
+    except HTTPException:
+        await cleanup()
+        raise
+    except UploadTooLargeError as e:
+        await cleanup()
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        await cleanup()
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return StreamingResponse(
+        _stream_bulk_results(
+            images, default_crop, variety,
+            concurrency=bulk_config.get('concurrency', 16),
+            max_images=max_images,
+            cleanup=cleanup
+        ),
+        media_type="application/x-ndjson",
+        background=BackgroundTask(cleanup)
+    )
+
+
+@router.get("/knowledge")
+async def knowledge_info():
+    """农业知识库概况（版本、作物与病害）"""
+    return knowledge_base.info()
+
+
+@router.post("/knowledge/reload")
+async def reload_knowledge():
+    """立即重新加载农业知识库文件"""
+    try:
+        snapshot = knowledge_base.reload()
+    except ValueError as e:
+        # 新内容未通过校验，旧版本仍在使用
+        raise HTTPException(status_code=422, detail=f"知识库校验失败，继续使用旧版本: {e}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"知识库加载失败: {e}")
+    return {"success": True, "version": snapshot.version}
+
+
 class WeatherPredictionRequest(BaseModel):
     location: str
     historicalData: List[dict]
@@ -99,45 +555,58 @@ class WeatherPredictionResponse(BaseModel):
 @router.post("/weather-predict", response_model=WeatherPredictionResponse)
 async def predict_weather(request: WeatherPredictionRequest):
     try:
-        conditions = ["晴朗", "多云", "阴天", "小雨", "中雨", "雷阵雨"]
-        next24h_condition = random.choice(conditions)
-        
-        next24h_temp = round(random.uniform(15, 35), 1)
-        
-        trend = random.choice(["升温", "降温", "稳定"])
-        avg_temp = round(random.uniform(18, 30), 1)
-        total_precip = round(random.uniform(0, 100), 1)
+        forecast = await forecast_service.get_forecast(request.location, request.historicalData)
         
+        next24h = forecast["next24h"]
         recommendations = []
-        if next24h_condition in ["小雨", "中雨", "雷阵雨"]:
+        if next24h["condition"] in ["小雨", "中雨", "大雨", "雷阵雨"]:
             recommendations.extend(["注意排水防涝", "推迟施肥", "检查温室大棚"])
-        if next24h_temp > 30:
+        if next24h["temperatureMax"] > 30:
             recommendations.extend(["增加灌溉频率", "做好防晒措施", "注意病虫害防治"])
-        if next24h_temp < 15:
+        if next24h["temperatureMin"] < 15:
             recommendations.extend(["做好保温措施", "适当延迟浇水", "检查防寒设施"])
         
         if len(recommendations) == 0:
             recommendations.append("适合进行常规农业操作")
         
         return WeatherPredictionResponse(
-            next24h={
-                "condition": next24h_condition,
-                "temperature": next24h_temp,
-                "humidity": round(random.uniform(40, 90), 0)
-            },
-            next7days={
-                "trend": trend,
-                "avgTemperature": avg_temp,
-                "totalPrecipitation": total_precip
-            },
-            confidence=round(random.uniform(0.75, 0.92), 2),
+            next24h=next24h,
+            next7days=forecast["next7days"],
+            confidence=forecast["confidence"],
             recommendations=recommendations[:5]
         )
         
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/weather-predict/cache-stats")
+async def weather_cache_stats():
+    """天气预报缓存的命中率与热门地点"""
+    return {"enabled": forecast_service.enabled, **forecast_service.stats()}
+
+
+@router.get("/rules")
+async def rules_info():
+    """农事规则概况（版本、规则与谓词数）"""
+    return rule_engine.info()
+
+
+@router.post("/rules/reload")
+async def reload_rules():
+    """立即重新编译农事规则文件"""
+    try:
+        compiled = rule_engine.reload()
+    except ValueError as e:
+        # 新内容未通过校验，旧版本仍在使用
+        raise HTTPException(status_code=422, detail=f"规则校验失败，继续使用旧版本: {e}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"规则加载失败: {e}")
+    return {"success": True, "version": compiled.version}
+
+
 class TaskRecommendationRequest(BaseModel):
     tasks: Optional[List[dict]] = None
     task: Optional[dict] = None
@@ -162,40 +631,14 @@ async def recommend_tasks(request: TaskRecommendationRequest):
         
         task_type = task.get("type", "custom")
         
-        task_scenarios = {
-            "irrigation": {
-                "reasoning": "根据土壤湿度和天气预报，建议在傍晚进行灌溉，减少蒸发损失",
-                "suggestedActions": ["检查灌溉设备", "测试水质", "记录灌溉量", "观察灌溉后土壤状态"],
-                "optimalTiming": {"hour": 17, "duration": "2-3小时"}
-            },
-            "fertilization": {
-                "reasoning": "根据作物生长阶段和天气预报，建议在无雨天气施肥，避免肥料流失",
-                "suggestedActions": ["选择合适的肥料类型", "控制施肥量", "均匀撒施", "施肥后浇水"],
-                "optimalTiming": {"hour": 9, "condition": "无雨"}
-            },
-            "pesticide": {
-                "reasoning": "根据病虫害情况和天气预报，建议在无风无雨天气施药，提高效果",
-                "suggestedActions": ["选择合适药剂", "配比浓度正确", "佩戴防护装备", "避免施药后立即浇水"],
-                "optimalTiming": {"hour": 16, "condition": "无风"}
-            },
-            "harvest": {
-                "reasoning": "根据作物成熟度和天气预报，建议在晴朗干燥的天气收获",
-                "suggestedActions": ["检查成熟度", "准备收获工具", "及时晾晒", "做好储存准备"],
-                "optimalTiming": {"hour": 8, "condition": "晴朗"}
-            },
-            "planting": {
-                "reasoning": "根据土壤温度和天气预报，建议在温度适宜且无强风天气播种",
-                "suggestedActions": ["整理土地", "选择优质种子", "控制播种深度", "及时浇水"],
-                "optimalTiming": {"hour": 10, "temperature": "15-25°C"}
-            },
-            "monitoring": {
-                "reasoning": "定期监测是及时发现问题的关键，建议建立监测计划",
-                "suggestedActions": ["记录生长状态", "检查病虫害", "测量环境指标", "拍照存档"],
-                "optimalTiming": {"frequency": "每2-3天"}
-            }
-        }
+        scenario = knowledge_base.task_scenario(task_type)
         
-        scenario = task_scenarios.get(task_type, task_scenarios["monitoring"])
+        # 按最近一条天气预报评分，命中的规则说明追加到推荐理由
+        weather = dict(request.weatherData[0]) if request.weatherData else {}
+        weather.setdefault("precipitation", weather.get("rainfall", weather.get("rain")))
+        weather.setdefault("windSpeed", weather.get("wind"))
+        score, notes = rule_engine.score_task(task_type, weather)
+        reasoning = "；".join([scenario["reasoning"], *notes])
         
         resource_req = [
             {"type": "人力", "quantity": random.randint(1, 3), "unit": "人"},
@@ -203,10 +646,10 @@ async def recommend_tasks(request: TaskRecommendationRequest):
         ]
         
         return TaskRecommendationResponse(
-            score=round(random.uniform(0.75, 0.95), 2),
-            reasoning=scenario["reasoning"],
-            suggestedActions=scenario["suggestedActions"],
-            optimalTiming=scenario["optimalTiming"],
+            score=score,
+            reasoning=reasoning,
+            suggestedActions=list(scenario["suggestedActions"]),
+            optimalTiming=dict(scenario["optimalTiming"]),
             resourceRequirements=resource_req
         )
         
@@ -227,72 +670,64 @@ class TaskGenerationResponse(BaseModel):
 @router.post("/generate-tasks", response_model=TaskGenerationResponse)
 async def generate_tasks(request: TaskGenerationRequest):
     try:
-        temperature = request.conditions.get("temperature", 25)
-        humidity = request.conditions.get("humidity", 60)
-        soilMoisture = request.conditions.get("soilMoisture", 50)
-        
-        tasks = []
+        tasks = task_planner.plan(request.conditions)
         
-        if soilMoisture < 40:
-            tasks.append({
-                "type": "irrigation",
-                "title": "紧急灌溉",
-                "description": "土壤湿度偏低，需要立即灌溉",
-                "priority": "urgent",
-                "location": "主要种植区",
-                "estimatedDuration": 2
-            })
-        elif soilMoisture < 60:
-            tasks.append({
-                "type": "irrigation",
-                "title": "计划灌溉",
-                "description": "土壤湿度较低，建议进行灌溉",
-                "priority": "medium",
-                "location": "主要种植区",
-                "estimatedDuration": 2
-            })
-        
-        if temperature > 30:
-            tasks.append({
-                "type": "monitoring",
-                "title": "高温监测",
-                "description": "温度较高，注意作物状态和病虫害",
-                "priority": "high",
-                "location": "全区域",
-                "estimatedDuration": 1
-            })
-            tasks.append({
-                "type": "irrigation",
-                "title": "增加灌溉",
-                "description": "高温天气增加灌溉频率",
-                "priority": "high",
-                "location": "主要种植区",
-                "estimatedDuration": 1
-            })
-        
-        if humidity > 80:
-            tasks.append({
-                "type": "pesticide",
-                "title": "防病喷药",
-                "description": "高湿度环境易发真菌病害，建议预防性喷药",
-                "priority": "medium",
-                "location": "易感病区域",
-                "estimatedDuration": 1.5
-            })
+        return TaskGenerationResponse(
+            tasks=tasks,
+            summary=_plot_summary(request.conditions, len(tasks))
+        )
         
-        tasks.append({
-            "type": "monitoring",
-            "title": "常规监测",
-            "description": "进行日常作物监测，记录生长状态",
-            "priority": "low",
-            "location": "全区域",
-            "estimatedDuration": 2
-        })
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _plot_summary(conditions: dict, task_count: int) -> str:
+    """单个地块的任务摘要"""
+    temperature = conditions.get("temperature", 25)
+    humidity = conditions.get("humidity", 60)
+    soilMoisture = conditions.get("soilMoisture", 50)
+    return f"根据当前环境条件（温度:{temperature}°C，湿度:{humidity}%，土壤湿度:{soilMoisture}%），生成了{task_count}个农事任务"
+
+
+class PlotConditions(BaseModel):
+    plotId: str
+    conditions: dict
+
+
+class BulkTaskGenerationRequest(BaseModel):
+    userId: str
+    plots: List[PlotConditions]
+
+
+class PlotTasks(BaseModel):
+    plotId: str
+    tasks: List[dict]
+    summary: str
+
+
+class BulkTaskGenerationResponse(BaseModel):
+    plots: List[PlotTasks]
+    summary: dict
+
+
+@router.post("/generate-tasks/bulk", response_model=BulkTaskGenerationResponse)
+async def generate_tasks_bulk(request: BulkTaskGenerationRequest):
+    """合作社多地块批量生成农事任务：所有地块的条件整列评估，返回按地块分组的任务与整体汇总"""
+    try:
+        conditions_list = [plot.conditions for plot in request.plots]
+        plans, summary = task_planner.plan_bulk(conditions_list)
         
-        summary = f"根据当前环境条件（温度:{temperature}°C，湿度:{humidity}%，土壤湿度:{soilMoisture}%），生成了{len(tasks)}个农事任务"
+        plot_ids = [plot.plotId for plot in request.plots]
+        summary["totalPlots"] = len(plot_ids)
+        summary["urgentPlots"] = [plot_ids[i] for i in summary.pop("urgentPlotIndices")]
+        summary["text"] = (f"共 {len(plot_ids)} 个地块，生成 {summary['totalTasks']} 个农事任务，"
+                           f"其中 {len(summary['urgentPlots'])} 个地块需要紧急处理")
         
-        return TaskGenerationResponse(
-            tasks=tasks,
+        return BulkTaskGenerationResponse(
+            plots=[
+                PlotTasks(plotId=plot_id, tasks=tasks, summary=_plot_summary(conditions, len(tasks)))
+                for plot_id, conditions, tasks in zip(plot_ids, conditions_list, plans)
+            ],
             summary=summary
         )
         
@@ -1,14 +1,18 @@
 """
 聊天相关的 API 路由
 """
-from fastapi import APIRouter, HTTPException
+import asyncio
+import time
+
+from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
-import requests
+from ollama import ResponseError
 
-from core import ModelManager
-from utils import logger
-from config.config_loader import config
+from core import (ModelManager, AdmissionRejected, admission_controller, context_budget, chat_sessions,
+                  conversation_summarizer, memory_retriever, model_prewarmer, ollama_client, response_cache)
+from core.context_budget import ContextWindow
+from utils import logger, RequestAborted, deadline_after, run_until_disconnected
 
 # 创建路由器实例
 router = APIRouter()
@@ -20,10 +24,14 @@ model_manager = ModelManager()
 # ==================== Pydantic 模型定义 ====================
 
 class ChatRequest(BaseModel):
-    """聊天请求模型"""
+    """聊天请求模型（提供 session_id 时历史由服务端保存，无需再提交 conversation_history）"""
     elder_id: str
     message: str
     conversation_history: Optional[List[Dict[str, str]]] = None
+    session_id: Optional[str] = None
+    summarize: Optional[bool] = None  # 会话中是否把早期轮次压缩为摘要（默认读取配置）
+    cache: Optional[bool] = None  # 是否使用回复缓存（默认读取配置）
+    timeout_ms: Optional[int] = None  # 客户端愿意等待的毫秒数，超过后中止生成并返回 504
 
 
 class ChatResponse(BaseModel):
@@ -32,63 +40,268 @@ class ChatResponse(BaseModel):
     message: str
     response: str
     model_name: str
+    prompt_tokens: int
+    dropped_turns: int
+    session_id: Optional[str] = None
+    summarized_turns: Optional[int] = None
+    memories_used: int = 0
+    cached: bool = False
+
+
+class CreateSessionRequest(BaseModel):
+    """创建会话请求模型"""
+    elder_id: str
+
+
+# ==================== 工具函数 ====================
+
+async def _ensure_model(elder_id: str) -> str:
+    """检查老人模型是否存在，返回模型名称"""
+    exists = await asyncio.get_running_loop().run_in_executor(None, model_manager.model_exists, elder_id)
+    if not exists:
+        raise HTTPException(
+            status_code=404,
+            detail=f"老人 {elder_id} 的模型不存在，请先训练模型"
+        )
+    return f"{model_manager.model_prefix}{elder_id}"
+
+
+def _build_prompt(elder_id: str, history: Optional[List[Dict[str, str]]], message: str):
+    """检索相关记忆并按上下文预算裁剪历史，返回 (裁剪结果, 注入的记忆条数)"""
+    context, memories_used = '', 0
+    if memory_retriever.enabled:
+        context, memories_used = memory_retriever.memory_context(elder_id, message)
+    try:
+        return context_budget.fit(history, message, context), memories_used
+    except ValueError:
+        if not context:
+            raise
+        # 加上记忆后超出预算时不注入记忆
+        return context_budget.fit(history, message), 0
+
+
+async def _generate(elder_id: str, model_name: str, history: Optional[List[Dict[str, str]]], message: str,
+                    use_cache: bool = False, deadline: Optional[float] = None):
+    """
+    检索记忆、按上下文预算裁剪历史并调用 Ollama
+
+    :param use_cache: 是否先查询回复缓存，未命中时写回生成结果
+    :param deadline: 请求截止时刻（time.monotonic()，用于排队时的准入判断）
+    :return: (回复内容, 裁剪结果, 注入的记忆条数, 是否命中缓存)
+    """
+    lookup = None
+    if use_cache:
+        lookup = await response_cache.lookup(elder_id, message)
+        if lookup.response is not None:
+            return lookup.response, ContextWindow([], 0, 0, 0), 0, True
+
+    if memory_retriever.enabled:
+        memory_retriever.schedule_refresh(elder_id)
+
+    # 首次调用会加载分词器并打开索引，放到线程中执行
+    try:
+        window, memories_used = await asyncio.get_running_loop().run_in_executor(
+            None, _build_prompt, elder_id, history, message
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    started = time.perf_counter()
+    try:
+        async with model_manager.residency.use(model_name) as keep_alive:
+            result = await ollama_client.chat(model_name, window.messages, options={"num_ctx": context_budget.num_ctx},
+                                              keep_alive=keep_alive, deadline=deadline)
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except ResponseError as e:
+        raise HTTPException(status_code=500, detail=f"Ollama API 调用失败: {e.error}")
+    except ConnectionError as e:
+        raise HTTPException(status_code=503, detail=f"Ollama 服务不可用: {e}")
+
+    model_prewarmer.record(elder_id)
+    if lookup is not None:
+        response_cache.store(lookup, result['content'], time.perf_counter() - started)
+    return result['content'], window, memories_used, False
 
 
 # ==================== 聊天相关端点 ====================
 
 @router.post("/chat")
-async def chat_with_elder(request: ChatRequest):
+async def chat_with_elder(request: ChatRequest, http_request: Request):
     """
     与老人模型聊天
+
+    客户端断开或超过 timeout_ms 时中止生成（Ollama 随即停止），会话中不会记录这一轮
     """
+    deadline = deadline_after(request.timeout_ms)
     try:
-        # 检查模型是否存在
-        if not model_manager.model_exists(request.elder_id):
-            raise HTTPException(
-                status_code=404,
-                detail=f"老人 {request.elder_id} 的模型不存在，请先训练模型"
-            )
-        
-        model_name = f"{model_manager.model_prefix}{request.elder_id}"
-        
-        # 调用 Ollama API 进行推理
-        ollama_api = config.get_ollama_config().get('api_base', 'http://localhost:11434')
-        
-        # 构建消息历史
-        messages = []
-        if request.conversation_history:
-            messages.extend(request.conversation_history)
-        messages.append({"role": "user", "content": request.message})
-        
-        # 调用 Ollama chat API
-        response = requests.post(
-            f"{ollama_api}/api/chat",
-            json={
-                "model": model_name,
-                "messages": messages,
-                "stream": False
-            },
-            timeout=60
-        )
-        
-        if response.status_code != 200:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Ollama API 调用失败: {response.text}"
-            )
-        
-        result = response.json()
-        assistant_message = result.get('message', {}).get('content', '')
-        
-        return {
-            "elder_id": request.elder_id,
-            "message": request.message,
-            "response": assistant_message,
-            "model_name": model_name
-        }
-    
+        return await run_until_disconnected(http_request, _chat(request, deadline), deadline)
+
+    except RequestAborted as e:
+        logger.info(f"聊天请求已中止（{e.reason}）: elder_id={request.elder_id}")
+        raise HTTPException(status_code=504 if e.reason == 'deadline' else 499, detail=str(e))
     except HTTPException:
         raise
     except Exception as e:
         logger.exception(f"聊天失败: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def _chat(request: ChatRequest, deadline: Optional[float]) -> Dict[str, Any]:
+    """处理一轮聊天"""
+    if request.session_id:
+        return await _chat_in_session(request, deadline)
+
+    model_name = await _ensure_model(request.elder_id)
+    use_cache = response_cache.applies(request.elder_id, request.conversation_history, request.cache)
+    assistant_message, window, memories_used, cached = await _generate(
+        request.elder_id, model_name, request.conversation_history, request.message, use_cache, deadline
+    )
+
+    return {
+        "elder_id": request.elder_id,
+        "message": request.message,
+        "response": assistant_message,
+        "model_name": model_name,
+        "prompt_tokens": window.prompt_tokens,
+        "dropped_turns": window.dropped_turns,
+        "memories_used": memories_used,
+        "cached": cached
+    }
+
+
+async def _chat_in_session(request: ChatRequest, deadline: Optional[float]) -> Dict[str, Any]:
+    """在服务端会话中聊天（同一会话的请求按顺序处理）"""
+    if request.conversation_history:
+        raise HTTPException(status_code=400, detail="使用 session_id 时历史由服务端保存，请勿同时提交 conversation_history")
+
+    async with chat_sessions.lock(request.session_id):
+        session = await chat_sessions.get(request.session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail=f"会话 {request.session_id} 不存在或已过期")
+        if session.elder_id != request.elder_id:
+            raise HTTPException(status_code=400, detail=f"会话 {request.session_id} 不属于老人 {request.elder_id}")
+
+        # 会话固定使用创建时的模型，不再逐轮检查
+        history = await conversation_summarizer.history(session)
+        use_cache = response_cache.applies(session.elder_id, history, request.cache)
+        assistant_message, window, memories_used, cached = await _generate(
+            session.elder_id, session.model_name, history, request.message, use_cache, deadline
+        )
+        await chat_sessions.append_turn(session, request.message, assistant_message)
+
+    # 回复先返回，早期轮次在后台折叠进摘要
+    summarize = conversation_summarizer.enabled if request.summarize is None else request.summarize
+    if summarize and conversation_summarizer.needs_update(session):
+        conversation_summarizer.schedule(session.session_id)
+
+    return {
+        "elder_id": request.elder_id,
+        "message": request.message,
+        "response": assistant_message,
+        "model_name": session.model_name,
+        "prompt_tokens": window.prompt_tokens,
+        "dropped_turns": session.dropped_turns + window.dropped_turns,
+        "session_id": session.session_id,
+        "summarized_turns": session.summarized_turns,
+        "memories_used": memories_used,
+        "cached": cached
+    }
+
+
+@router.post("/chat/sessions")
+async def create_chat_session(request: CreateSessionRequest):
+    """
+    创建聊天会话
+    """
+    model_name = await _ensure_model(request.elder_id)
+    session = await chat_sessions.create(request.elder_id, model_name)
+    return {
+        "session_id": session.session_id,
+        "elder_id": session.elder_id,
+        "model_name": session.model_name
+    }
+
+
+@router.get("/chat/sessions")
+async def chat_session_stats():
+    """
+    会话存储统计
+    """
+    return {**await chat_sessions.stats(), 'summarization': conversation_summarizer.stats(),
+            'coalescing': ollama_client.stats(), 'admission': admission_controller.stats()}
+
+
+@router.get("/chat/sessions/{session_id}")
+async def get_chat_session(session_id: str):
+    """
+    获取会话历史
+    """
+    session = await chat_sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"会话 {session_id} 不存在或已过期")
+    return session.to_dict()
+
+
+@router.delete("/chat/sessions/{session_id}")
+async def delete_chat_session(session_id: str):
+    """
+    结束会话
+    """
+    if not await chat_sessions.delete(session_id):
+        raise HTTPException(status_code=404, detail=f"会话 {session_id} 不存在或已过期")
+    return {"success": True, "session_id": session_id}
+
+
+# ==================== 回复缓存 ====================
+
+@router.get("/chat/cache")
+async def response_cache_stats():
+    """
+    回复缓存统计（命中率与省去的生成耗时）
+    """
+    return response_cache.stats()
+
+
+@router.delete("/chat/cache/{elder_id}")
+async def clear_response_cache(elder_id: str):
+    """
+    清空老人的回复缓存（如修改了 Modelfile 的 SYSTEM 但未重新训练时）
+    """
+    response_cache.invalidate(elder_id)
+    return {"success": True, "elder_id": elder_id}
+
+
+# ==================== 记忆检索 ====================
+
+@router.get("/chat/memory/{elder_id}")
+async def get_memory_index(elder_id: str):
+    """
+    老人记忆索引概况
+    """
+    return memory_retriever.info(elder_id)
+
+
+@router.post("/chat/memory/{elder_id}/refresh")
+async def refresh_memory_index(elder_id: str, rebuild: bool = False):
+    """
+    立即从 MongoDB 同步老人的问答（rebuild=true 时清空后全量重建）
+    """
+    try:
+        return await asyncio.get_running_loop().run_in_executor(None, memory_retriever.refresh, elder_id, rebuild)
+    except Exception as e:
+        logger.exception(f"记忆索引同步失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/chat/memory/{elder_id}/search")
+async def search_memory(elder_id: str, q: str, top_k: int = 5):
+    """
+    检索老人的相关记忆（调试用）
+    """
+    results = await asyncio.get_running_loop().run_in_executor(None, memory_retriever.search, elder_id, q, top_k)
+    return {
+        "elder_id": elder_id,
+        "query": q,
+        "results": [{"score": round(score, 4), **memory} for score, memory in results]
+    }
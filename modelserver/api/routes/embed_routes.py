@@ -0,0 +1,76 @@
+"""
+文本向量 API 路由
+"""
+import base64
+from typing import List
+
+from fastapi import APIRouter, HTTPException, Response
+from pydantic import BaseModel
+
+from core import embedding_service
+from utils import logger
+
+# 创建路由器实例
+router = APIRouter()
+
+
+# ==================== Pydantic 模型定义 ====================
+
+class EmbedRequest(BaseModel):
+    """向量请求模型"""
+    texts: List[str]
+    encoding: str = "base64"  # base64 | binary | float
+    normalize: bool = True
+
+
+# ==================== 文本向量端点 ====================
+
+@router.post("/embed")
+async def embed_texts(request: EmbedRequest):
+    """
+    批量计算文本向量
+
+    - base64：embeddings 为按行拼接的 little-endian float32 数组的 base64（N × dim）
+    - binary：响应体即该数组的原始字节，维度与条数见 X-Embedding-Dim / X-Embedding-Count
+    - float：embeddings 为浮点数二维列表（体积最大，仅供调试）
+    """
+    if request.encoding not in ("base64", "binary", "float"):
+        raise HTTPException(status_code=422, detail=f"不支持的编码: {request.encoding}")
+    if len(request.texts) > embedding_service.max_texts:
+        raise HTTPException(status_code=413, detail=f"单次最多 {embedding_service.max_texts} 条文本")
+
+    try:
+        matrix = await embedding_service.embed(request.texts, normalize=request.normalize)
+    except Exception as e:
+        logger.exception(f"文本向量计算失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    count, dim = (matrix.shape if matrix.size else (len(request.texts), 0))
+    data = matrix.astype('<f4', copy=False).tobytes()
+    if request.encoding == "binary":
+        return Response(
+            content=data,
+            media_type="application/octet-stream",
+            headers={
+                "X-Embedding-Model": embedding_service.model_name,
+                "X-Embedding-Dim": str(dim),
+                "X-Embedding-Count": str(count)
+            }
+        )
+
+    return {
+        "model": embedding_service.model_name,
+        "dim": dim,
+        "count": count,
+        "dtype": "float32",
+        "encoding": request.encoding,
+        "embeddings": base64.b64encode(data).decode('ascii') if request.encoding == "base64" else matrix.tolist()
+    }
+
+
+@router.get("/embed/stats")
+async def embed_stats():
+    """
+    向量后端与缓存统计
+    """
+    return embedding_service.stats()
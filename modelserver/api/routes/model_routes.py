@@ -4,7 +4,7 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
-from core import ModelManager
+from core import ModelManager, model_prewarmer, response_cache
 from utils import logger, JSONLBuilder
 
 # 创建路由器实例
@@ -33,6 +33,27 @@ async def list_models(filter_afs_only: bool = True):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/models/residency")
+async def get_model_residency():
+    """
+    已加载模型与内存预算使用情况
+    """
+    try:
+        await model_manager.residency.refresh(force=True)
+    except Exception as e:
+        logger.warning(f"查询已加载模型失败: {e}")
+    return {**model_manager.residency.stats(), 'prewarm': model_prewarmer.stats()}
+
+
+@router.post("/models/prewarm")
+async def prewarm_models():
+    """
+    立即在后台预热最常用的老人模型（进度见 /health 的 warmup）
+    """
+    started = model_prewarmer.schedule_warm('manual')
+    return {"success": True, "started": started, "warmup": model_prewarmer.progress}
+
+
 @router.get("/models/{elder_id}")
 async def get_model_info(elder_id: str):
     """
@@ -64,6 +85,8 @@ async def delete_model(elder_id: str):
         if not success:
             raise HTTPException(status_code=500, detail="删除模型失败")
         
+        response_cache.invalidate(elder_id)
+        
         return {
             "success": True,
             "message": f"模型 {elder_id} 已删除"
@@ -3,11 +3,11 @@
 """
 from fastapi import APIRouter, BackgroundTasks, HTTPException
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, List
 import threading
 import requests
 
-from core import OllamaTrainer, ModelManager, progress_tracker
+from core import OllamaTrainer, ModelManager, model_prewarmer, progress_tracker, training_queue
 from utils import logger
 from config.config_loader import config
 
@@ -26,6 +26,19 @@ class TrainRequest(BaseModel):
     elder_id: str
     elder_name: str = "长辈"
     force_retrain: bool = False  # 是否强制重新训练（即使模型已存在）
+    batch: bool = False  # 是否加入批量队列，与其他老人共享一次基础模型加载
+
+
+class MergeRequest(BaseModel):
+    """合并量化请求模型"""
+    elder_id: str
+    elder_name: str = "长辈"
+    adapter_path: Optional[str] = None  # Adapter 目录（默认 adapters_output/<elder_id>）
+
+
+class PopulationTrainRequest(BaseModel):
+    """群体 Adapter 训练请求模型"""
+    elder_ids: Optional[List[str]] = None  # 参与汇总的老人（默认全部）
 
 
 # ==================== 训练相关端点 ====================
@@ -50,6 +63,17 @@ async def start_training(request: TrainRequest, background_tasks: BackgroundTask
                 "model_name": f"{model_manager.model_prefix}{request.elder_id}"
             }
         
+        # 批量模式：交给队列合批训练 LoRA Adapter
+        if request.batch:
+            job_id = training_queue.submit(request.elder_id, request.elder_name)
+            return {
+                "success": True,
+                "message": "训练任务已加入批量队列",
+                "job_id": job_id,
+                "elder_id": request.elder_id,
+                "queued": training_queue.pending_count()
+            }
+        
         # 创建进度跟踪任务
         total_epochs = config.get_training_config().get('epochs', 3)
         job_id = progress_tracker.start_tracking(request.elder_id, total_epochs)
@@ -84,6 +108,91 @@ async def start_training(request: TrainRequest, background_tasks: BackgroundTask
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/train/merge")
+async def start_merge(request: MergeRequest, background_tasks: BackgroundTasks):
+    """
+    将老人的 LoRA Adapter 合并进基础模型并量化为 GGUF
+    
+    量化类型取自配置 ollama.quantization，完成后注册为 Ollama 专属模型
+    """
+    try:
+        logger.info(f"收到合并量化请求: elder_id={request.elder_id}")
+        
+        job_id = progress_tracker.start_tracking(request.elder_id, total_epochs=1)
+        
+        def merge_task():
+            try:
+                progress_tracker.update_progress(job_id, status='training')
+                result = trainer.merge_and_quantize(
+                    request.elder_id, request.elder_name, request.adapter_path
+                )
+                
+                if result['success']:
+                    progress_tracker.add_log(job_id, f"GGUF: {result['gguf_path']} sha256: {result['sha256']}")
+                    progress_tracker.complete_tracking(job_id, success=True)
+                else:
+                    progress_tracker.complete_tracking(job_id, success=False, error=result.get('error'))
+            
+            except Exception as e:
+                logger.exception(f"合并量化任务执行失败: {e}")
+                progress_tracker.complete_tracking(job_id, success=False, error=str(e))
+        
+        background_tasks.add_task(merge_task)
+        
+        return {
+            "success": True,
+            "message": "合并量化任务已启动",
+            "job_id": job_id,
+            "elder_id": request.elder_id,
+            "quantization": config.get_ollama_config().get('quantization', 'q8_0')
+        }
+    
+    except Exception as e:
+        logger.exception(f"启动合并量化失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/train/population")
+async def start_population_training(request: PopulationTrainRequest, background_tasks: BackgroundTasks):
+    """
+    用匿名化的汇总回答训练群体 Adapter
+    
+    配置 training.population.enabled 后，新老人的 Adapter 将从群体 Adapter 热启动
+    """
+    try:
+        population = config.get_training_config().get('population', {})
+        job_id = progress_tracker.start_tracking('_population', population.get('epochs', 3))
+        
+        def population_task():
+            try:
+                progress_tracker.update_progress(job_id, status='training')
+                progress_file = trainer.progress_file_path(job_id)
+                progress_tracker.monitor_event_file(job_id, progress_file)
+                result = trainer.train_population_adapter(request.elder_ids, progress_file)
+                
+                if result['success']:
+                    progress_tracker.complete_tracking(job_id, success=True)
+                else:
+                    progress_tracker.complete_tracking(job_id, success=False, error=result.get('error'))
+            
+            except Exception as e:
+                logger.exception(f"群体 Adapter 训练任务执行失败: {e}")
+                progress_tracker.complete_tracking(job_id, success=False, error=str(e))
+        
+        background_tasks.add_task(population_task)
+        
+        return {
+            "success": True,
+            "message": "群体 Adapter 训练任务已启动",
+            "job_id": job_id,
+            "adapter_path": population.get('adapter_path')
+        }
+    
+    except Exception as e:
+        logger.exception(f"启动群体 Adapter 训练失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/health")
 async def health_check():
     """健康检查端点"""
@@ -91,7 +200,8 @@ async def health_check():
     return {
         "status": "healthy" if ollama_ok else "degraded",
         "ollama": "available" if ollama_ok else "unavailable",
-        "active_jobs": len(progress_tracker.list_active_jobs())
+        "active_jobs": len(progress_tracker.list_active_jobs()),
+        "warmup": model_prewarmer.progress
     }
 
 
@@ -0,0 +1,96 @@
+"""
+生成准入控制基准
+用一个按处理器共享模拟的后端（同时生成的请求越多，每个请求越慢）施加超出容量的突发负载，
+对比不做准入控制与开启准入控制时的成功数、429 数、超时数与成功请求的延迟分位数
+
+用法: python benchmarks/bench_admission.py [--requests 200] [--rate 20] [--timeout 20]
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from core.admission_control import AdmissionController, AdmissionRejected  # noqa: E402
+
+
+class SharedBackend:
+    """处理器共享后端：超过 parallel 个并发后，每步耗时按并发数线性变长"""
+
+    def __init__(self, parallel: int, step_ms: float, steps: int):
+        self.parallel = parallel
+        self.step = step_ms / 1000
+        self.steps = steps
+        self.active = 0
+
+    async def generate(self):
+        self.active += 1
+        try:
+            for _ in range(self.steps):
+                await asyncio.sleep(self.step * max(1.0, self.active / self.parallel))
+        finally:
+            self.active -= 1
+
+
+async def run(args, admission: bool):
+    backend = SharedBackend(args.parallel, args.step_ms, args.steps)
+    controller = AdmissionController()
+    controller.enabled = admission
+    controller.max_concurrent = args.parallel
+    controller.max_concurrent_per_model = args.parallel
+    controller.max_queue = args.queue
+    controller.max_wait = args.timeout
+    controller.avg_service_seconds = args.step_ms * args.steps / 1000
+
+    latencies, outcome = [], {'ok': 0, 'rejected': 0, 'timeout': 0}
+
+    async def one():
+        started = time.monotonic()
+        deadline = started + args.timeout
+        try:
+            async with controller.slot('elder', deadline):
+                await asyncio.wait_for(backend.generate(), deadline - time.monotonic())
+            outcome['ok'] += 1
+            latencies.append(time.monotonic() - started)
+        except AdmissionRejected:
+            outcome['rejected'] += 1
+        except asyncio.TimeoutError:
+            outcome['timeout'] += 1
+
+    rng = random.Random(0)
+    tasks = []
+    for _ in range(args.requests):
+        tasks.append(asyncio.create_task(one()))
+        await asyncio.sleep(rng.expovariate(args.rate))
+    await asyncio.gather(*tasks)
+
+    latencies.sort()
+    p50 = statistics.median(latencies) if latencies else 0
+    p99 = latencies[int(len(latencies) * 0.99) - 1] if latencies else 0
+    name = "准入控制" if admission else "直接转发"
+    print(f"{name:<8} 成功 {outcome['ok']:>4}  429 {outcome['rejected']:>4}  超时 {outcome['timeout']:>4}  "
+          f"p50 {p50:>6.2f}s  p99 {p99:>6.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成准入控制基准")
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--rate', type=float, default=20, help="每秒到达的请求数")
+    parser.add_argument('--parallel', type=int, default=4, help="后端满速并发数")
+    parser.add_argument('--steps', type=int, default=50, help="每次生成的步数（token 数）")
+    parser.add_argument('--step-ms', type=float, default=20)
+    parser.add_argument('--queue', type=int, default=16)
+    parser.add_argument('--timeout', type=float, default=20)
+    args = parser.parse_args()
+
+    print(f"后端容量约 {args.parallel / (args.steps * args.step_ms / 1000):.1f} 请求/秒，到达 {args.rate} 请求/秒")
+    asyncio.run(run(args, admission=False))
+    asyncio.run(run(args, admission=True))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+农事任务批量生成性能基准
+对比逐个地块调用 /agricultural/generate-tasks 与一次调用 /generate-tasks/bulk
+（直接调用路由函数，包含请求/响应模型校验，不含 HTTP 传输）
+
+用法: python benchmarks/bench_task_generation.py [--repeat 5]
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from api.routes.agricultural_routes import (  # noqa: E402
+    BulkTaskGenerationRequest, TaskGenerationRequest, generate_tasks, generate_tasks_bulk
+)
+
+PLOT_COUNTS = [10, 100, 500, 2000]
+
+
+def make_plots(count: int, seed: int = 0):
+    """生成随机地块条件"""
+    rng = random.Random(seed)
+    return [
+        {
+            "plotId": f"plot-{i:04d}",
+            "conditions": {
+                "temperature": round(rng.uniform(10, 38), 1),
+                "humidity": round(rng.uniform(30, 95), 0),
+                "soilMoisture": round(rng.uniform(20, 80), 0)
+            }
+        }
+        for i in range(count)
+    ]
+
+
+async def loop_single(plots):
+    """逐个地块调用单地块接口"""
+    results = []
+    for plot in plots:
+        request = TaskGenerationRequest(userId="bench", conditions=plot["conditions"])
+        results.append(await generate_tasks(request))
+    return results
+
+
+async def bulk(plots):
+    """一次调用批量接口"""
+    request = BulkTaskGenerationRequest(userId="bench", plots=plots)
+    return await generate_tasks_bulk(request)
+
+
+async def timed(coro_factory, repeat: int) -> float:
+    """在同一事件循环中多次运行取中位数（毫秒）"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await coro_factory()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+async def run(repeat: int):
+    # 两种方式的结果必须一致
+    plots = make_plots(50)
+    single = await loop_single(plots)
+    combined = await bulk(plots)
+    assert [r.tasks for r in single] == [p.tasks for p in combined.plots], "批量结果与逐个调用不一致"
+
+    print(f"{'地块数':>8} {'逐个调用(ms)':>14} {'批量(ms)':>10} {'加速比':>8}")
+    for count in PLOT_COUNTS:
+        plots = make_plots(count, seed=count)
+        single_ms = await timed(lambda: loop_single(plots), repeat)
+        bulk_ms = await timed(lambda: bulk(plots), repeat)
+        print(f"{count:>8} {single_ms:>14.2f} {bulk_ms:>10.2f} {single_ms / bulk_ms:>7.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="农事任务批量生成性能基准")
+    parser.add_argument("--repeat", type=int, default=5, help="每个规模的重复次数")
+    args = parser.parse_args()
+    asyncio.run(run(args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+天气预报器性能基准
+生成带日周期、趋势与降水的逐小时模拟观测，测量不同历史长度下
+数组转换与拟合预测的耗时，并用最后 24 小时做回测对比持续性预报
+
+用法: python benchmarks/bench_weather_forecast.py [--repeat 20]
+"""
+import argparse
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from core.weather_forecaster import WeatherForecaster, to_arrays  # noqa: E402
+
+HISTORY_DAYS = [7, 30, 90, 365, 730]
+
+
+def make_history(hours: int, seed: int = 0):
+    """生成逐小时模拟观测"""
+    rng = np.random.default_rng(seed)
+    start = datetime(2024, 1, 1)
+    t = np.arange(hours)
+    temperature = 18 + 6 * np.sin(2 * np.pi * (t % 24 - 9) / 24) + 0.01 * t / 24 + rng.normal(0, 1.0, hours)
+    humidity = np.clip(70 - 15 * np.sin(2 * np.pi * (t % 24 - 9) / 24) + rng.normal(0, 5, hours), 0, 100)
+    rain = np.where(rng.random(hours) < 0.05, rng.exponential(2.0, hours), 0.0)
+    return [
+        {
+            "timestamp": (start + timedelta(hours=int(i))).isoformat(),
+            "temperature": round(float(temperature[i]), 1),
+            "humidity": round(float(humidity[i]), 0),
+            "precipitation": round(float(rain[i]), 1)
+        }
+        for i in range(hours)
+    ]
+
+
+def timed(func, repeat: int) -> float:
+    """多次运行取中位数（毫秒）"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def backtest(forecaster: WeatherForecaster, history) -> tuple:
+    """留出最后 24 小时：返回 (模型 MAE, 持续性预报 MAE)"""
+    train, actual = history[:-24], np.array([r["temperature"] for r in history[-24:]])
+    predicted = forecaster.forecast(train)
+    # 逐小时序列不在返回结果中，用 24 小时均值对比
+    model_error = abs(predicted["next24h"]["temperature"] - actual.mean())
+    persistence_error = abs(np.mean([r["temperature"] for r in train[-24:]]) - actual.mean())
+    return model_error, persistence_error
+
+
+def main():
+    parser = argparse.ArgumentParser(description="天气预报器性能基准")
+    parser.add_argument("--repeat", type=int, default=20, help="每个长度的重复次数")
+    args = parser.parse_args()
+
+    forecaster = WeatherForecaster()
+    print(f"{'历史长度':>10} {'记录数':>8} {'转换(ms)':>10} {'预测总耗时(ms)':>14} {'μs/记录':>9} {'置信度':>7}")
+    for days in HISTORY_DAYS:
+        history = make_history(days * 24, seed=days)
+        convert_ms = timed(lambda: to_arrays(history), args.repeat)
+        total_ms = timed(lambda: forecaster.forecast(history), args.repeat)
+        confidence = forecaster.forecast(history)["confidence"]
+        print(f"{days:>8}天 {len(history):>8} {convert_ms:>10.2f} {total_ms:>14.2f} "
+              f"{total_ms * 1000 / len(history):>9.2f} {confidence:>7.2f}")
+
+    model_error, persistence_error = backtest(forecaster, make_history(90 * 24, seed=1))
+    print(f"\n回测（90 天历史，最后 24 小时平均温度）: 模型误差 {model_error:.2f}°C，"
+          f"持续性预报误差 {persistence_error:.2f}°C")
+
+
+if __name__ == "__main__":
+    main()
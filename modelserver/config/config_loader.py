@@ -66,6 +66,18 @@ class ConfigLoader:
         """获取 Ollama 配置"""
         return self._config.get('ollama', {})
     
+    def get_chat_config(self) -> Dict[str, Any]:
+        """获取聊天配置"""
+        return self._config.get('chat', {})
+    
+    def get_embedding_config(self) -> Dict[str, Any]:
+        """获取文本向量配置"""
+        return self._config.get('embedding', {})
+    
+    def get_agricultural_config(self) -> Dict[str, Any]:
+        """获取农业 AI 配置"""
+        return self._config.get('agricultural', {})
+    
     def get_paths(self) -> Dict[str, str]:
         """获取所有路径配置"""
         return self._config.get('paths', {})
@@ -1,9 +1,35 @@
 """
 核心业务逻辑模块
-包含训练器、模型管理器、进度跟踪器
+包含训练器、模型管理器（含模型常驻管理与预热）、进度跟踪器、批量训练队列、病害检测器、农业知识库、天气预报、农事规则引擎、任务规划器、聊天上下文预算、聊天会话、会话摘要、老人记忆检索、文本向量、聊天回复缓存、生成准入控制与 Ollama 客户端
 """
 from .trainer import OllamaTrainer
-from .model_manager import ModelManager
+from .model_manager import ModelManager, ModelResidencyManager, model_residency
 from .progress_tracker import ProgressTracker, progress_tracker
+from .training_queue import TrainingQueue, training_queue
+from .disease_detector import DiseaseDetector, disease_detector
+from .knowledge_base import AgriculturalKnowledgeBase, knowledge_base
+from .weather_forecaster import WeatherForecaster, weather_forecaster
+from .forecast_service import ForecastService, forecast_service
+from .rule_engine import RuleEngine, rule_engine
+from .task_planner import TaskPlanner, task_planner
+from .context_budget import ContextBudget, context_budget
+from .chat_sessions import ChatSessionManager, chat_sessions
+from .admission_control import AdmissionController, AdmissionRejected, admission_controller
+from .ollama_client import OllamaClient, ollama_client
+from .conversation_summarizer import ConversationSummarizer, conversation_summarizer
+from .memory_retriever import MemoryRetriever, memory_retriever
+from .embedding_service import EmbeddingService, embedding_service
+from .response_cache import ResponseCache, response_cache
+from .model_prewarmer import ModelPrewarmer, model_prewarmer
 
-__all__ = ['OllamaTrainer', 'ModelManager', 'ProgressTracker', 'progress_tracker']
+__all__ = ['OllamaTrainer', 'ModelManager', 'ModelResidencyManager', 'model_residency', 'ProgressTracker', 'progress_tracker',
+           'TrainingQueue', 'training_queue', 'DiseaseDetector', 'disease_detector',
+           'AgriculturalKnowledgeBase', 'knowledge_base',
+           'WeatherForecaster', 'weather_forecaster', 'ForecastService', 'forecast_service',
+           'RuleEngine', 'rule_engine', 'TaskPlanner', 'task_planner',
+           'ContextBudget', 'context_budget', 'ChatSessionManager', 'chat_sessions',
+           'OllamaClient', 'ollama_client', 'ConversationSummarizer', 'conversation_summarizer',
+           'MemoryRetriever', 'memory_retriever', 'EmbeddingService', 'embedding_service',
+           'ResponseCache', 'response_cache',
+           'AdmissionController', 'AdmissionRejected', 'admission_controller',
+           'ModelPrewarmer', 'model_prewarmer']
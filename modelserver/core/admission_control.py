@@ -0,0 +1,205 @@
+"""
+生成请求准入控制
+限制同时交给 Ollama 的生成数（全局上限与每个模型的上限），超出的请求在有界队列中按先后顺序等待；
+队列已满、预计等待超过请求截止时间或等待超时的请求立即以 429 + Retry-After 拒绝，
+避免请求在 Ollama 内部堆积到全部超时，保持尾延迟有界
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from config.config_loader import config
+
+ADMISSION_QUEUE_DEPTH = Gauge(
+    'afs_admission_queue_depth',
+    '等待生成槽位的请求数'
+)
+
+ADMISSION_IN_FLIGHT = Gauge(
+    'afs_admission_in_flight',
+    '正在生成的请求数'
+)
+
+ADMISSION_WAIT_SECONDS = Histogram(
+    'afs_admission_wait_seconds',
+    '获得生成槽位前的等待时间（秒）',
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+)
+
+ADMISSION_REJECTED = Counter(
+    'afs_admission_rejected_total',
+    '被拒绝的生成请求数（queue_full 队列已满 / deadline 预计超过截止时间 / timeout 等待超时）',
+    ['reason']
+)
+
+
+class AdmissionRejected(Exception):
+    """生成请求被拒绝（调用方应返回 429 并带上 Retry-After）"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"服务繁忙（{reason}），请 {retry_after} 秒后重试")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@dataclass
+class _Waiter:
+    model: str
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class AdmissionController:
+    """生成请求准入控制"""
+
+    def __init__(self):
+        """初始化（读取配置 ollama.admission）"""
+        admission_config = config.get_ollama_config().get('admission', {})
+        self.enabled = admission_config.get('enabled', True)
+        self.max_concurrent = max(1, admission_config.get('max_concurrent', 8))
+        self.max_concurrent_per_model = max(1, admission_config.get('max_concurrent_per_model', 2))
+        self.max_queue = admission_config.get('max_queue', 32)
+        self.max_wait = admission_config.get('max_wait_seconds', 30)
+
+        # 单次生成耗时的指数滑动平均，用于估算排队时间与 Retry-After
+        self.avg_service_seconds = admission_config.get('initial_service_seconds', 5.0)
+        self._active = 0
+        self._active_per_model: Dict[str, int] = {}
+        self._waiters: Deque[_Waiter] = deque()
+
+    def _has_capacity(self, model: str) -> bool:
+        return (self._active < self.max_concurrent
+                and self._active_per_model.get(model, 0) < self.max_concurrent_per_model)
+
+    def _take(self, model: str):
+        self._active += 1
+        self._active_per_model[model] = self._active_per_model.get(model, 0) + 1
+        ADMISSION_IN_FLIGHT.set(self._active)
+
+    def estimated_wait(self, position: int) -> float:
+        """排在第 position 位（从 1 开始）的请求预计等待时间（秒）"""
+        return math.ceil(position / self.max_concurrent) * self.avg_service_seconds
+
+    def _reject(self, reason: str, position: int):
+        ADMISSION_REJECTED.labels(reason=reason).inc()
+        raise AdmissionRejected(reason, max(1, math.ceil(self.estimated_wait(position))))
+
+    async def acquire(self, model: str, deadline: Optional[float] = None):
+        """
+        获取生成槽位（全局与该模型都有空闲时立即返回，否则排队等待）
+
+        :param model: 模型名称
+        :param deadline: 请求截止时间（time.monotonic() 时刻，None 表示只受 max_wait_seconds 限制）
+        :raises AdmissionRejected: 队列已满、预计等待超过截止时间或等待超时
+        """
+        # 有空闲时排队的请求都在等各自已满的模型，新请求可以直接开始
+        if self._has_capacity(model):
+            self._take(model)
+            ADMISSION_WAIT_SECONDS.observe(0)
+            return
+
+        position = len(self._waiters) + 1
+        if len(self._waiters) >= self.max_queue:
+            self._reject('queue_full', position)
+
+        timeout = self.max_wait
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            # 排到时已来不及生成的请求不必占用队列位置
+            if remaining <= self.estimated_wait(position):
+                self._reject('deadline', position)
+            timeout = min(timeout, remaining)
+
+        waiter = _Waiter(model, asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        ADMISSION_QUEUE_DEPTH.set(len(self._waiters))
+        try:
+            await asyncio.wait_for(waiter.future, timeout)
+        except asyncio.TimeoutError:
+            self._abandon(waiter)
+            self._reject('timeout', position)
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+        ADMISSION_WAIT_SECONDS.observe(time.monotonic() - waiter.enqueued_at)
+
+    def _abandon(self, waiter: _Waiter):
+        """等待者离开队列；若槽位恰好已分配给它则归还"""
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+        ADMISSION_QUEUE_DEPTH.set(len(self._waiters))
+        if waiter.future.done() and not waiter.future.cancelled():
+            self.release(waiter.model)
+
+    def release(self, model: str, service_seconds: Optional[float] = None):
+        """
+        归还生成槽位并唤醒可以开始的等待者
+
+        :param model: 模型名称
+        :param service_seconds: 本次生成耗时（用于更新平均耗时）
+        """
+        self._active -= 1
+        remaining = self._active_per_model.get(model, 1) - 1
+        if remaining > 0:
+            self._active_per_model[model] = remaining
+        else:
+            self._active_per_model.pop(model, None)
+        if service_seconds is not None:
+            self.avg_service_seconds = 0.8 * self.avg_service_seconds + 0.2 * service_seconds
+
+        # 按先后顺序唤醒；所等模型已满的请求不阻塞排在后面的其他模型请求
+        for waiter in list(self._waiters):
+            if self._active >= self.max_concurrent:
+                break
+            if waiter.future.done():
+                self._waiters.remove(waiter)
+            elif self._has_capacity(waiter.model):
+                self._waiters.remove(waiter)
+                self._take(waiter.model)
+                waiter.future.set_result(True)
+        ADMISSION_IN_FLIGHT.set(self._active)
+        ADMISSION_QUEUE_DEPTH.set(len(self._waiters))
+
+    @asynccontextmanager
+    async def slot(self, model: str, deadline: Optional[float] = None):
+        """
+        在生成槽位内执行（未开启准入控制时直接执行）
+
+        :param model: 模型名称
+        :param deadline: 请求截止时间（time.monotonic() 时刻）
+        """
+        if not self.enabled:
+            yield
+            return
+
+        await self.acquire(model, deadline)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(model, time.monotonic() - started)
+
+    def stats(self) -> Dict[str, Any]:
+        """当前并发与排队情况"""
+        return {
+            'enabled': self.enabled,
+            'in_flight': self._active,
+            'in_flight_per_model': dict(self._active_per_model),
+            'queue_depth': len(self._waiters),
+            'max_concurrent': self.max_concurrent,
+            'max_concurrent_per_model': self.max_concurrent_per_model,
+            'max_queue': self.max_queue,
+            'avg_service_seconds': round(self.avg_service_seconds, 3)
+        }
+
+
+# 全局准入控制实例
+admission_controller = AdmissionController()
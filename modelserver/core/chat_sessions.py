@@ -0,0 +1,191 @@
+"""
+服务端聊天会话
+会话保存对话历史并固定使用创建时的模型，客户端每轮只需提交 session_id 和新消息。
+历史原样保存（不重新拼装），使每轮提示的前缀与上一轮一致，配合 keep_alive 复用 Ollama 的提示缓存。
+默认存放在进程内（LRU + 空闲过期），多实例部署时可改用 Redis
+"""
+import asyncio
+import json
+import math
+import time
+import uuid
+import weakref
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+from utils import logger, TTLCache
+from config.config_loader import config
+from .context_budget import ContextBudget, context_budget
+
+
+@dataclass
+class ChatSession:
+    """聊天会话"""
+    session_id: str
+    elder_id: str
+    model_name: str
+    messages: List[Dict[str, str]] = field(default_factory=list)
+    dropped_turns: int = 0
+    summary: str = ''
+    summarized_turns: int = 0
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ChatSession":
+        return cls(**data)
+
+
+class MemorySessionStore:
+    """进程内会话存储（LRU + 空闲过期）"""
+
+    backend = 'memory'
+
+    def __init__(self, max_sessions: int, ttl_seconds: float):
+        self._cache = TTLCache(max_size=max_sessions, ttl_seconds=ttl_seconds)
+
+    async def get(self, session_id: str) -> Optional[ChatSession]:
+        return self._cache.get(session_id)
+
+    async def save(self, session: ChatSession):
+        self._cache.set(session.session_id, session)
+
+    async def delete(self, session_id: str) -> bool:
+        return self._cache.pop(session_id) is not None
+
+    async def stats(self) -> Dict[str, Any]:
+        return self._cache.stats()
+
+
+class RedisSessionStore:
+    """Redis 会话存储（每个会话一个 JSON 值，写入时刷新过期时间）"""
+
+    backend = 'redis'
+
+    def __init__(self, url: str, ttl_seconds: float, key_prefix: str = 'afs:chat:session:'):
+        import redis.asyncio as aioredis
+        self._redis = aioredis.from_url(url, decode_responses=True)
+        self.ttl_seconds = int(ttl_seconds)
+        self.key_prefix = key_prefix
+
+    async def get(self, session_id: str) -> Optional[ChatSession]:
+        data = await self._redis.get(self.key_prefix + session_id)
+        return ChatSession.from_dict(json.loads(data)) if data else None
+
+    async def save(self, session: ChatSession):
+        await self._redis.set(self.key_prefix + session.session_id,
+                              json.dumps(session.to_dict(), ensure_ascii=False),
+                              ex=self.ttl_seconds or None)
+
+    async def delete(self, session_id: str) -> bool:
+        return bool(await self._redis.delete(self.key_prefix + session_id))
+
+    async def stats(self) -> Dict[str, Any]:
+        return {'ttl_seconds': self.ttl_seconds, 'key_prefix': self.key_prefix}
+
+    async def close(self):
+        await self._redis.close()
+
+
+class ChatSessionManager:
+    """聊天会话管理器"""
+
+    def __init__(self, budget: ContextBudget = None):
+        """
+        初始化（读取配置 chat.sessions）
+
+        :param budget: 上下文预算（用于按轮次整块裁剪保存的历史）
+        """
+        session_config = config.get_chat_config().get('sessions', {})
+        self.budget = budget or context_budget
+        self.max_messages = session_config.get('max_messages', 200)
+        ttl_seconds = session_config.get('ttl_seconds', 3600)
+
+        self.store = None
+        if session_config.get('backend', 'memory') == 'redis':
+            try:
+                self.store = RedisSessionStore(session_config.get('redis_url', 'redis://localhost:6379/0'),
+                                               ttl_seconds)
+            except ImportError:
+                logger.warning("未安装 redis，聊天会话改为存放在进程内")
+        if self.store is None:
+            self.store = MemorySessionStore(session_config.get('max_sessions', 10000), ttl_seconds)
+
+        # 同一会话的多个请求按顺序执行，避免历史交错
+        self._locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    def lock(self, session_id: str) -> asyncio.Lock:
+        """获取会话锁（仅在本进程内互斥）"""
+        lock = self._locks.get(session_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[session_id] = lock
+        return lock
+
+    async def create(self, elder_id: str, model_name: str) -> ChatSession:
+        """
+        创建会话
+
+        :param elder_id: 老人 ID
+        :param model_name: 会话固定使用的模型
+        :return: 新会话
+        """
+        session = ChatSession(session_id=uuid.uuid4().hex, elder_id=elder_id, model_name=model_name)
+        await self.store.save(session)
+        return session
+
+    async def get(self, session_id: str) -> Optional[ChatSession]:
+        """获取会话（不存在或已过期返回 None）"""
+        return await self.store.get(session_id)
+
+    async def save(self, session: ChatSession):
+        """保存会话"""
+        session.updated_at = time.time()
+        await self.store.save(session)
+
+    async def delete(self, session_id: str) -> bool:
+        """删除会话"""
+        return await self.store.delete(session_id)
+
+    async def append_turn(self, session: ChatSession, user_message: str, assistant_message: str):
+        """
+        追加一轮对话并保存
+
+        历史超过 max_messages 时丢弃最早的轮次，丢弃数取 drop_block_turns 的整数倍，
+        使上下文预算的整块丢弃边界保持不变
+
+        :param session: 会话
+        :param user_message: 用户消息
+        :param assistant_message: 模型回复
+        """
+        session.messages.append({"role": "user", "content": user_message})
+        session.messages.append({"role": "assistant", "content": assistant_message})
+
+        if len(session.messages) > self.max_messages:
+            turns = self.budget.split_turns(session.messages)
+            excess, size = 0, len(session.messages)
+            while size > self.max_messages:
+                size -= len(turns[excess])
+                excess += 1
+            block = self.budget.drop_block_turns
+            excess = min(len(turns) - 1, math.ceil(excess / block) * block)
+            session.messages = [m for turn in turns[excess:] for m in turn]
+            session.dropped_turns += excess
+
+        await self.save(session)
+
+    async def stats(self) -> Dict[str, Any]:
+        """会话存储统计"""
+        return {'backend': self.store.backend, 'max_messages': self.max_messages, **await self.store.stats()}
+
+    async def close(self):
+        """关闭存储连接"""
+        if hasattr(self.store, 'close'):
+            await self.store.close()
+
+
+# 全局聊天会话管理器实例
+chat_sessions = ChatSessionManager()
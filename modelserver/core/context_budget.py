@@ -0,0 +1,214 @@
+"""
+聊天上下文预算
+用基础模型的分词器计算 token 数（进程内只加载一次），每轮只保留 system prompt、
+当前消息以及预算内最近的若干轮对话，超出的最早轮次整块丢弃，
+使每轮的预填充（prefill）长度不超过预算，也不会被 Ollama 按 num_ctx 静默截断
+"""
+import math
+import re
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+from utils import logger, TTLCache
+from config.config_loader import config
+
+# 聊天模板为每条消息增加的 token（如 <|im_start|>role\n ... <|im_end|>\n）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# 估算时按一个 token 计的字符（中日韩文字与全角标点）
+_WIDE_CHARS = re.compile(r'[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]')
+
+
+class TokenCounter:
+    """基于基础模型分词器的 token 计数器（分词器不可用时按字符估算）"""
+
+    def __init__(self, tokenizer_path: Optional[str] = None, cache_size: int = 4096):
+        """
+        初始化计数器（首次计数时加载分词器）
+
+        :param tokenizer_path: 分词器目录（HuggingFace 格式）
+        :param cache_size: 缓存计数结果的文本条数（历史消息每轮都会重复出现）
+        """
+        self.tokenizer_path = tokenizer_path
+        self._tokenizer = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._counts = TTLCache(max_size=cache_size, ttl_seconds=3600)
+
+    @property
+    def backend(self) -> str:
+        """计数方式：tokenizer | estimate"""
+        return 'tokenizer' if self._tokenizer is not None else 'estimate'
+
+    def load(self):
+        """加载分词器（只执行一次，失败时退回字符估算）"""
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            if self.tokenizer_path:
+                try:
+                    from transformers import AutoTokenizer
+                    self._tokenizer = AutoTokenizer.from_pretrained(self.tokenizer_path)
+                    logger.info(f"上下文预算使用分词器: {self.tokenizer_path}")
+                except Exception as e:
+                    logger.warning(f"分词器加载失败，按字符估算 token 数: {e}")
+            else:
+                logger.warning("未配置分词器，按字符估算 token 数")
+            self._loaded = True
+
+    @staticmethod
+    def estimate(text: str) -> int:
+        """
+        按字符估算 token 数（中文约每字一个 token，其他字符约四个一个，偏保守）
+
+        :param text: 文本
+        :return: 估算的 token 数
+        """
+        wide = len(_WIDE_CHARS.findall(text))
+        return wide + math.ceil((len(text) - wide) / 4)
+
+    def count(self, text: str) -> int:
+        """
+        计算文本的 token 数
+
+        :param text: 文本
+        :return: token 数
+        """
+        if not text:
+            return 0
+        cached = self._counts.get(text)
+        if cached is not None:
+            return cached
+
+        self.load()
+        if self._tokenizer is not None:
+            tokens = len(self._tokenizer.encode(text, add_special_tokens=False))
+        else:
+            tokens = self.estimate(text)
+        self._counts.set(text, tokens)
+        return tokens
+
+    def count_message(self, message: Dict[str, Any]) -> int:
+        """计算单条聊天消息的 token 数（含模板开销）"""
+        return self.count(str(message.get('content') or '')) + MESSAGE_OVERHEAD_TOKENS
+
+
+@dataclass
+class ContextWindow:
+    """按预算裁剪后的消息"""
+    messages: List[Dict[str, Any]]
+    prompt_tokens: int
+    kept_turns: int
+    dropped_turns: int
+
+
+class ContextBudget:
+    """聊天上下文预算"""
+
+    def __init__(self):
+        """初始化（读取配置 chat）"""
+        chat_config = config.get_chat_config()
+        self.num_ctx = int(chat_config.get('num_ctx', 4096))
+        self.reserve_output_tokens = int(chat_config.get('reserve_output_tokens', 512))
+        self.budget_tokens = min(
+            int(chat_config.get('context_budget_tokens', 3072)),
+            self.num_ctx - self.reserve_output_tokens
+        )
+        self.drop_block_turns = max(1, int(chat_config.get('drop_block_turns', 4)))
+
+        tokenizer_path = chat_config.get('tokenizer_path') or config.get_current_model().get('hf_path')
+        self.counter = TokenCounter(tokenizer_path)
+        self._modelfile_system_tokens: Optional[int] = None
+
+    def modelfile_system_tokens(self) -> int:
+        """
+        Modelfile 中 SYSTEM 指令的 token 数
+
+        请求未携带 system 消息时 Ollama 会自动加上它；姓名在请求中未知，按模板估计
+        """
+        if self._modelfile_system_tokens is None:
+            template = config.get_prompt_template().replace('{{elder_name}}', '某某某')
+            self._modelfile_system_tokens = self.counter.count(template) + MESSAGE_OVERHEAD_TOKENS
+        return self._modelfile_system_tokens
+
+    @staticmethod
+    def split_turns(history: Sequence[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """
+        把历史消息按轮次分组（每个 user 消息开始新的一轮）
+
+        :param history: 不含 system 的历史消息
+        :return: 轮次列表
+        """
+        turns: List[List[Dict[str, Any]]] = []
+        for message in history:
+            if message.get('role') == 'user' or not turns:
+                turns.append([])
+            turns[-1].append(message)
+        return turns
+
+    def fit(self, history: Optional[Sequence[Dict[str, Any]]], message: str, context: str = '') -> ContextWindow:
+        """
+        保留 system prompt 与当前消息，并按预算从最近的轮次往前保留历史
+
+        丢弃的轮次数向上取整到 drop_block_turns 的整数倍，这样保留历史的起点
+        在若干轮内保持不变，Ollama 可以复用已缓存的前缀，而不是每轮都从头预填充；
+        对齐后会丢掉全部历史时不对齐，只丢弃放不下的轮次
+
+        :param history: 客户端提交的历史消息
+        :param message: 当前用户消息
+        :param context: 附在当前消息之前的参考内容（如检索到的记忆）
+        :return: 裁剪后的消息
+        :raises ValueError: 当前消息本身已超出预算
+        """
+        history = list(history or [])
+        system_messages = [m for m in history if m.get('role') == 'system']
+        dialogue = [m for m in history if m.get('role') != 'system']
+        user_message = {"role": "user", "content": f"{context}\n\n{message}" if context else message}
+
+        if system_messages:
+            fixed = sum(self.counter.count_message(m) for m in system_messages)
+        else:
+            fixed = self.modelfile_system_tokens()
+        fixed += self.counter.count_message(user_message)
+        if fixed > self.budget_tokens:
+            raise ValueError(f"消息过长：约 {fixed} tokens，超出上下文预算 {self.budget_tokens}")
+
+        turns = self.split_turns(dialogue)
+        turn_tokens = [sum(self.counter.count_message(m) for m in turn) for turn in turns]
+
+        # 找到最小的起点，使其后的所有轮次都能放进预算
+        start, used = len(turns), fixed
+        while start > 0 and used + turn_tokens[start - 1] <= self.budget_tokens:
+            start -= 1
+            used += turn_tokens[start]
+        # 对齐后会丢掉全部放得下的历史时，不对齐，保留能放下的轮次
+        aligned = math.ceil(start / self.drop_block_turns) * self.drop_block_turns
+        if 0 < start < aligned < len(turns):
+            used -= sum(turn_tokens[start:aligned])
+            start = aligned
+
+        kept = [m for turn in turns[start:] for m in turn]
+        return ContextWindow(
+            messages=system_messages + kept + [user_message],
+            prompt_tokens=used,
+            kept_turns=len(turns) - start,
+            dropped_turns=start
+        )
+
+    def info(self) -> Dict[str, Any]:
+        """预算配置与计数方式"""
+        return {
+            'num_ctx': self.num_ctx,
+            'budget_tokens': self.budget_tokens,
+            'reserve_output_tokens': self.reserve_output_tokens,
+            'drop_block_turns': self.drop_block_turns,
+            'tokenizer': self.counter.tokenizer_path,
+            'backend': self.counter.backend
+        }
+
+
+# 全局上下文预算实例
+context_budget = ContextBudget()
@@ -0,0 +1,151 @@
+"""
+会话滚动摘要
+会话中超过阈值的早期轮次在回复返回后由后台任务压缩进摘要，只保留最近若干轮原文。
+摘要随会话保存并追加在 system prompt 之后；摘要只在整块折叠时变化，
+其间每轮提示的前缀保持不变，提示长度与首 token 延迟不随会话变长而增长
+"""
+import asyncio
+from typing import Any, Dict, List, Set
+
+from prometheus_client import Counter
+
+from utils import logger
+from config.config_loader import config
+from .chat_sessions import ChatSession, ChatSessionManager, chat_sessions
+from .context_budget import ContextBudget, context_budget
+from .ollama_client import OllamaClient, ollama_client
+
+SUMMARY_UPDATES = Counter(
+    'afs_chat_summary_updates_total',
+    '会话摘要更新次数（按结果分类）',
+    ['result']
+)
+
+SUMMARY_INSTRUCTION = (
+    "你是对话摘要助手。下面是家人与老人数字分身的对话记录，以及此前的摘要。"
+    "请把它们合并成一份新的摘要，保留人名、时间、地点、事件、家人提到的近况与约定，"
+    "用第三人称、按时间顺序简洁叙述，不超过 {max_chars} 字，只输出摘要本身。"
+)
+
+
+class ConversationSummarizer:
+    """会话滚动摘要"""
+
+    def __init__(self, sessions: ChatSessionManager = None, budget: ContextBudget = None,
+                 client: OllamaClient = None):
+        """初始化（读取配置 chat.summarization）"""
+        summary_config = config.get_chat_config().get('summarization', {})
+        self.enabled = summary_config.get('enabled', False)
+        self.model = summary_config.get('model', '')
+        self.keep_recent_turns = max(1, summary_config.get('keep_recent_turns', 6))
+        self.chunk_turns = max(1, summary_config.get('chunk_turns', 4))
+        self.max_summary_chars = summary_config.get('max_summary_chars', 600)
+
+        self.sessions = sessions or chat_sessions
+        self.budget = budget or context_budget
+        self.client = client or ollama_client
+        self._in_flight: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def history(self, session: ChatSession) -> List[Dict[str, str]]:
+        """
+        组装会话的提示历史：system prompt + 摘要、最近的轮次原文
+
+        :param session: 会话
+        :return: 消息列表
+        """
+        if not session.summary:
+            return list(session.messages)
+
+        # 携带 system 消息会替换 Modelfile 的 SYSTEM，因此在其基础上追加摘要
+        try:
+            system = await self.client.system_prompt(session.model_name)
+        except Exception as e:
+            logger.warning(f"读取模型 {session.model_name} 的 SYSTEM 失败: {e}")
+            system = ''
+        content = f"{system}\n\n此前的对话摘要：\n{session.summary}".strip()
+        return [{"role": "system", "content": content}] + session.messages
+
+    def needs_update(self, session: ChatSession) -> bool:
+        """未折叠的轮次是否已超过阈值"""
+        return len(self.budget.split_turns(session.messages)) >= self.keep_recent_turns + self.chunk_turns
+
+    def schedule(self, session_id: str):
+        """
+        在后台更新会话摘要（同一会话同时只有一个更新任务）
+
+        :param session_id: 会话 ID
+        """
+        if session_id in self._in_flight:
+            return
+        self._in_flight.add(session_id)
+        task = asyncio.create_task(self._update(session_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _update(self, session_id: str):
+        """把最早的 chunk_turns 轮折叠进摘要"""
+        try:
+            session = await self.sessions.get(session_id)
+            if session is None or not self.needs_update(session):
+                return
+
+            turns = self.budget.split_turns(session.messages)[:self.chunk_turns]
+            folded = [m for turn in turns for m in turn]
+            summary = await self._summarize(session, folded)
+
+            # 生成摘要期间会话可能继续对话，只在被折叠的轮次仍位于最前面时替换
+            async with self.sessions.lock(session_id):
+                session = await self.sessions.get(session_id)
+                if session is None or session.messages[:len(folded)] != folded:
+                    SUMMARY_UPDATES.labels(result='stale').inc()
+                    return
+                session.summary = summary
+                session.summarized_turns += len(turns)
+                session.messages = session.messages[len(folded):]
+                await self.sessions.save(session)
+            SUMMARY_UPDATES.labels(result='updated').inc()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            SUMMARY_UPDATES.labels(result='failed').inc()
+            logger.warning(f"会话 {session_id} 摘要更新失败: {e}")
+        finally:
+            self._in_flight.discard(session_id)
+
+    async def _summarize(self, session: ChatSession, messages: List[Dict[str, str]]) -> str:
+        """调用模型生成新摘要"""
+        transcript = "\n".join(
+            f"{'家人' if m.get('role') == 'user' else '老人'}：{m.get('content', '')}" for m in messages
+        )
+        prompt = f"此前的摘要：\n{session.summary or '（无）'}\n\n新的对话记录：\n{transcript}"
+        result = await self.client.chat(
+            self.model or session.model_name,
+            [
+                {"role": "system", "content": SUMMARY_INSTRUCTION.format(max_chars=self.max_summary_chars)},
+                {"role": "user", "content": prompt}
+            ],
+            options={"num_ctx": self.budget.num_ctx, "temperature": 0.2,
+                     "num_predict": self.max_summary_chars * 2}
+        )
+        return result['content'].strip()
+
+    async def stop(self):
+        """取消进行中的摘要任务"""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """配置与进行中的任务数"""
+        return {
+            'enabled': self.enabled,
+            'model': self.model or '（会话模型）',
+            'keep_recent_turns': self.keep_recent_turns,
+            'chunk_turns': self.chunk_turns,
+            'in_flight': len(self._in_flight)
+        }
+
+
+# 全局会话摘要实例
+conversation_summarizer = ConversationSummarizer()
@@ -0,0 +1,141 @@
+"""
+病害检测结果缓存
+按“图片内容哈希 + 作物 + 品种”缓存检测结果，重复提交的同一张照片直接命中；
+可选的感知哈希（dHash）用于匹配重新压缩、轻微裁剪等近似重复图片
+"""
+import hashlib
+from typing import Any, Dict, Optional, Tuple
+
+from prometheus_client import Counter, Gauge
+
+from utils.ttl_cache import TTLCache
+
+DETECTION_CACHE_REQUESTS = Counter(
+    'afs_disease_cache_requests_total',
+    '病害检测结果缓存查询次数',
+    ['result']
+)
+DETECTION_CACHE_SIZE = Gauge(
+    'afs_disease_cache_entries',
+    '病害检测结果缓存条目数'
+)
+
+# dHash 使用 9x8 灰度缩略图，得到 64 位指纹
+DHASH_SIZE = 8
+
+
+def content_hash(image_bytes) -> str:
+    """
+    计算图片字节的内容哈希（直接读取 memoryview，不拷贝）
+
+    :param image_bytes: 图片字节
+    :return: 十六进制摘要
+    """
+    return hashlib.blake2b(image_bytes, digest_size=16).hexdigest()
+
+
+def dhash(image) -> int:
+    """
+    计算感知哈希（差值哈希）
+
+    :param image: 已解码的 PIL 图片
+    :return: 64 位整数指纹
+    """
+    from PIL import Image
+
+    pixels = list(image.convert('L').resize((DHASH_SIZE + 1, DHASH_SIZE), Image.BILINEAR).getdata())
+    value = 0
+    for row in range(DHASH_SIZE):
+        offset = row * (DHASH_SIZE + 1)
+        for col in range(DHASH_SIZE):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+class DetectionCache:
+    """病害检测结果缓存"""
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600,
+                 perceptual_hash: bool = False, max_distance: int = 4):
+        """
+        初始化缓存
+
+        :param max_entries: 最大条目数
+        :param ttl_seconds: 条目存活时间（秒）
+        :param perceptual_hash: 是否启用近似重复匹配
+        :param max_distance: 判定为近似重复的最大汉明距离（0-64）
+        """
+        self.entries = TTLCache(max_size=max_entries, ttl_seconds=ttl_seconds)
+        self.perceptual_hash = perceptual_hash
+        self.max_distance = max_distance
+        self.near_hits = 0
+
+    @staticmethod
+    def make_key(digest: str, crop_name: str, variety: Optional[str]) -> Tuple[str, str, str]:
+        """生成缓存键：同一张图在不同作物/品种下的候选病害不同，需分开缓存"""
+        return crop_name, variety or '', digest
+
+    def get(self, key: Tuple[str, str, str]) -> Optional[Dict[str, Any]]:
+        """
+        按内容哈希精确查找
+
+        :param key: make_key 生成的键
+        :return: 检测结果副本，未命中返回 None
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        DETECTION_CACHE_REQUESTS.labels(result='hit').inc()
+        return dict(entry['result'])
+
+    def find_similar(self, key: Tuple[str, str, str], fingerprint: int) -> Optional[Dict[str, Any]]:
+        """
+        在同一作物/品种的条目中查找感知哈希相近的图片
+
+        :param key: make_key 生成的键
+        :param fingerprint: 待查图片的 dHash
+        :return: 检测结果副本，未命中返回 None
+        """
+        scope = key[:2]
+        best, best_distance = None, self.max_distance + 1
+        for cached_key, entry in self.entries.items():
+            if cached_key[:2] != scope or entry['dhash'] is None:
+                continue
+            distance = (entry['dhash'] ^ fingerprint).bit_count()
+            if distance < best_distance:
+                best, best_distance = entry, distance
+
+        if best is None:
+            return None
+        self.near_hits += 1
+        DETECTION_CACHE_REQUESTS.labels(result='near_hit').inc()
+        return dict(best['result'])
+
+    def set(self, key: Tuple[str, str, str], result: Dict[str, Any], fingerprint: Optional[int] = None):
+        """
+        写入检测结果
+
+        :param key: make_key 生成的键
+        :param result: 检测结果
+        :param fingerprint: 图片 dHash（未启用感知哈希时为 None）
+        """
+        self.entries.set(key, {'result': dict(result), 'dhash': fingerprint})
+        DETECTION_CACHE_SIZE.set(len(self.entries))
+
+    def record_miss(self):
+        """记录一次完整推理（精确与近似均未命中）"""
+        DETECTION_CACHE_REQUESTS.labels(result='miss').inc()
+
+    def clear(self):
+        """清空缓存（如更换模型后）"""
+        self.entries.clear()
+        DETECTION_CACHE_SIZE.set(0)
+
+    def stats(self) -> Dict[str, Any]:
+        """命中率统计（hit_rate 仅含精确命中，effective_hit_rate 含近似命中）"""
+        stats = self.entries.stats()
+        lookups = stats['hits'] + stats['misses']
+        stats['near_hits'] = self.near_hits
+        stats['effective_hit_rate'] = round((stats['hits'] + self.near_hits) / lookups, 4) if lookups else 0.0
+        stats['perceptual_hash'] = self.perceptual_hash
+        return stats
@@ -0,0 +1,261 @@
+"""
+农作物病害检测器
+可插拔的 CPU 图像分类后端：模型在启动时加载一次，并发请求在毫秒级窗口内
+合并为一次前向推理；图片解码与缩放在线程池中执行，不阻塞事件循环
+"""
+import asyncio
+import base64
+import random
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from utils.logger import logger
+from utils.micro_batcher import MicroBatcher
+from utils.buffer_pool import BufferPool, BufferReader
+from config.config_loader import config
+from .detection_cache import DetectionCache, content_hash, dhash
+
+# 标签文件中表示“无病害”的类别名
+HEALTHY_LABELS = {'健康', 'healthy'}
+
+IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+IMAGENET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+
+class OnnxClassifierBackend:
+    """ONNX Runtime 图像分类后端"""
+
+    def __init__(self, model_path: str, labels_path: str, input_size: int = 224,
+                 intra_op_threads: int = 0):
+        """
+        加载 ONNX 模型与标签
+
+        :param model_path: ONNX 模型路径（输入 NCHW float32，输出各类别 logits）
+        :param labels_path: 标签文件，每行一个病害名（健康类写“健康”）
+        :param input_size: 模型输入边长
+        :param intra_op_threads: ONNX Runtime 算子内线程数（0 表示自动）
+        """
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+
+        self.session = ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # 固定 batch 维度为 1 的模型只能逐条推理
+        self.supports_batch = not isinstance(model_input.shape[0], int) or model_input.shape[0] != 1
+        self.input_size = input_size
+
+        with open(labels_path, 'r', encoding='utf-8') as f:
+            self.labels = [line.strip() for line in f if line.strip()]
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        """
+        批量推理
+
+        :param batch: 形状为 (N, 3, H, W) 的输入
+        :return: 形状为 (N, 类别数) 的概率
+        """
+        if self.supports_batch:
+            logits = self.session.run(None, {self.input_name: batch})[0]
+        else:
+            logits = np.concatenate([
+                self.session.run(None, {self.input_name: batch[i:i + 1]})[0]
+                for i in range(len(batch))
+            ])
+
+        logits = logits - logits.max(axis=1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=1, keepdims=True)
+
+
+class DiseaseDetector:
+    """农作物病害检测器"""
+
+    def __init__(self):
+        """初始化检测器（模型在 load 时加载）"""
+        self.detection_config = config.get_agricultural_config().get('disease_detection', {})
+        self.backend: Optional[OnnxClassifierBackend] = None
+        self.batcher: Optional[MicroBatcher] = None
+        self.decode_pool = ThreadPoolExecutor(
+            max_workers=self.detection_config.get('decode_workers', 4),
+            thread_name_prefix='image-decode'
+        )
+        self.inference_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='disease-infer')
+        # 二进制上传使用的复用缓冲区
+        self.upload_buffers = BufferPool(
+            max_buffers=self.detection_config.get('upload_buffers', 8),
+            max_size=int(self.detection_config.get('max_upload_mb', 10) * 1024 * 1024)
+        )
+        # 重复提交的同一张照片直接返回缓存结果
+        cache_config = self.detection_config.get('cache', {})
+        self.cache: Optional[DetectionCache] = None
+        if cache_config.get('enabled', True):
+            self.cache = DetectionCache(
+                max_entries=cache_config.get('max_entries', 1024),
+                ttl_seconds=cache_config.get('ttl_seconds', 3600),
+                perceptual_hash=cache_config.get('perceptual_hash', False),
+                max_distance=cache_config.get('phash_max_distance', 4)
+            )
+
+    def load(self):
+        """加载配置的推理后端，失败时退回模拟后端"""
+        backend_name = self.detection_config.get('backend', 'onnx')
+        if backend_name != 'onnx':
+            logger.info("病害检测使用模拟后端")
+            return
+
+        model_path = self.detection_config.get('model_path', '')
+        labels_path = self.detection_config.get('labels_path', '')
+        if not Path(model_path).exists() or not Path(labels_path).exists():
+            logger.warning(f"病害检测模型不存在，使用模拟后端: {model_path}")
+            return
+
+        try:
+            self.backend = OnnxClassifierBackend(
+                model_path,
+                labels_path,
+                input_size=self.detection_config.get('input_size', 224),
+                intra_op_threads=self.detection_config.get('intra_op_threads', 0)
+            )
+            self.batcher = MicroBatcher(
+                self._predict_batch,
+                max_batch_size=self.detection_config.get('max_batch_size', 16),
+                max_wait_ms=self.detection_config.get('batch_window_ms', 5),
+                executor=self.inference_pool,
+                name='病害检测'
+            )
+            logger.info(f"病害检测模型已加载: {model_path}（{len(self.backend.labels)} 个类别）")
+        except Exception as e:
+            self.backend = None
+            logger.exception(f"病害检测模型加载失败，使用模拟后端: {e}")
+
+    @property
+    def is_model_loaded(self) -> bool:
+        """是否已加载真实模型"""
+        return self.backend is not None
+
+    async def decode_base64(self, data: str) -> bytes:
+        """
+        在线程池中解码 base64 图片（兼容 data URL 前缀）
+
+        :param data: base64 字符串
+        :return: 图片字节
+        """
+        def _decode():
+            payload = data.split(',', 1)[1] if data.startswith('data:') else data
+            try:
+                return base64.b64decode(payload, validate=False)
+            except Exception as e:
+                raise ValueError(f"图片 base64 解码失败: {e}")
+
+        return await asyncio.get_running_loop().run_in_executor(self.decode_pool, _decode)
+
+    async def detect(self, image_bytes, candidates: List[str], crop_name: str = '',
+                     variety: Optional[str] = None) -> Dict[str, Any]:
+        """
+        检测图片中的病害
+
+        :param image_bytes: 图片字节（bytes、bytearray 或 memoryview，解码时不会整体拷贝）
+        :param candidates: 该作物可能的病害列表（模型只在这些类别与健康类中选择）
+        :param crop_name: 作物名称（缓存键的一部分）
+        :param variety: 品种（缓存键的一部分）
+        :return: {'detected': bool, 'diseaseName': str|None, 'confidence': float}
+        """
+        loop = asyncio.get_running_loop()
+
+        cache_key = None
+        if self.cache is not None:
+            digest = await loop.run_in_executor(self.decode_pool, content_hash, image_bytes)
+            cache_key = DetectionCache.make_key(digest, crop_name, variety)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        fingerprint = None
+        if self.backend is None:
+            result = self._mock_detect(candidates)
+        else:
+            with_dhash = self.cache is not None and self.cache.perceptual_hash
+            tensor, fingerprint = await loop.run_in_executor(
+                self.decode_pool, self._preprocess, image_bytes, with_dhash
+            )
+            if fingerprint is not None:
+                similar = self.cache.find_similar(cache_key, fingerprint)
+                if similar is not None:
+                    self.cache.set(cache_key, similar, fingerprint)
+                    return similar
+
+            probs = await self.batcher.submit(tensor)
+            result = self._interpret(probs, candidates)
+
+        if self.cache is not None:
+            self.cache.record_miss()
+            self.cache.set(cache_key, result, fingerprint)
+        return result
+
+    def _preprocess(self, image_bytes, with_dhash: bool = False) -> Tuple[np.ndarray, Optional[int]]:
+        """解码、缩放并归一化为 (3, H, W) 的 float32 输入，按需同时计算感知哈希"""
+        from PIL import Image, UnidentifiedImageError
+
+        size = self.backend.input_size
+        try:
+            with BufferReader(image_bytes) as reader, Image.open(reader) as source:
+                # JPEG 在解码阶段直接降采样，手机大图可大幅减少解码耗时
+                source.draft('RGB', (size, size))
+                image = source.convert('RGB').resize((size, size), Image.BILINEAR)
+        except (UnidentifiedImageError, OSError) as e:
+            raise ValueError(f"无法识别的图片: {e}")
+
+        fingerprint = dhash(image) if with_dhash else None
+        array = np.asarray(image, dtype=np.float32) / 255.0
+        array = (array - IMAGENET_MEAN) / IMAGENET_STD
+        return np.ascontiguousarray(array.transpose(2, 0, 1)), fingerprint
+
+    def _predict_batch(self, tensors: List[np.ndarray]) -> List[np.ndarray]:
+        """批处理函数：一次前向推理整批输入"""
+        probs = self.backend.predict(np.stack(tensors))
+        return list(probs)
+
+    def _interpret(self, probs: np.ndarray, candidates: List[str]) -> Dict[str, Any]:
+        """在候选病害与健康类中取概率最高的类别"""
+        labels = self.backend.labels
+        allowed = set(candidates) | HEALTHY_LABELS
+        indices = [i for i, label in enumerate(labels) if label in allowed] or list(range(len(labels)))
+
+        best = max(indices, key=lambda i: probs[i])
+        # 在候选类别内重新归一化置信度
+        confidence = float(probs[best] / max(float(probs[indices].sum()), 1e-8))
+        label = labels[best]
+
+        if label in HEALTHY_LABELS:
+            return {'detected': False, 'diseaseName': None, 'confidence': round(confidence, 2)}
+        return {'detected': True, 'diseaseName': label, 'confidence': round(confidence, 2)}
+
+    @staticmethod
+    def _mock_detect(candidates: List[str]) -> Dict[str, Any]:
+        """模拟后端：未配置模型时保持原有的随机结果"""
+        if candidates and random.random() > 0.3:
+            return {
+                'detected': True,
+                'diseaseName': random.choice(candidates),
+                'confidence': round(random.uniform(0.7, 0.98), 2)
+            }
+        return {'detected': False, 'diseaseName': None, 'confidence': 0.95}
+
+    async def close(self):
+        """释放资源"""
+        if self.batcher is not None:
+            await self.batcher.close()
+        self.decode_pool.shutdown(wait=False)
+        self.inference_pool.shutdown(wait=False)
+
+
+# 全局病害检测器实例
+disease_detector = DiseaseDetector()
@@ -0,0 +1,206 @@
+"""
+文本向量服务
+并发请求中的文本按短时间窗口合并成批，交给本地 CPU 向量模型（transformers）
+或 Ollama /api/embed（一次请求携带整批文本）计算；结果按文本哈希缓存，
+重复出现的文本（如 Node 端记忆系统反复写入的同一句话）不再重复计算
+"""
+import asyncio
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from prometheus_client import Counter
+
+from utils import logger, MicroBatcher, TTLCache
+from config.config_loader import config
+from .ollama_client import OllamaClient, ollama_client
+
+EMBED_TEXTS = Counter(
+    'afs_embed_texts_total',
+    '向量化文本数（按缓存结果分类）',
+    ['result']
+)
+
+
+class LocalEmbeddingBackend:
+    """本地 CPU 向量模型（transformers）"""
+
+    name = 'local'
+
+    def __init__(self, model_path: str, max_length: int = 512, threads: int = 0, pooling: str = 'cls'):
+        """
+        加载分词器与模型
+
+        :param model_path: HuggingFace 格式的模型目录（如 bge-small-zh）
+        :param max_length: 单条文本的最大 token 数（超出截断）
+        :param threads: PyTorch 线程数（0 表示自动）
+        :param pooling: 池化方式：cls（bge 系列）| mean（sentence-transformers 系列）
+        """
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        if threads:
+            torch.set_num_threads(threads)
+        self.torch = torch
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        self.model = AutoModel.from_pretrained(model_path).eval()
+        self.max_length = max_length
+        self.pooling = pooling
+        self.model_name = Path(model_path).name
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        批量计算向量
+
+        :param texts: 文本列表
+        :return: 形状为 (N, 维度) 的 float32 数组
+        """
+        # 按长度排序后再分组填充，减少同一批内的填充量
+        order = np.argsort([len(t) for t in texts])
+        sorted_texts = [texts[i] for i in order]
+        with self.torch.inference_mode():
+            encoded = self.tokenizer(sorted_texts, padding=True, truncation=True,
+                                     max_length=self.max_length, return_tensors='pt')
+            hidden = self.model(**encoded).last_hidden_state
+            if self.pooling == 'mean':
+                mask = encoded['attention_mask'].unsqueeze(-1).to(hidden.dtype)
+                pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+            else:
+                pooled = hidden[:, 0]
+
+        vectors = np.empty((len(texts), pooled.shape[1]), dtype=np.float32)
+        vectors[order] = pooled.float().numpy()
+        return vectors
+
+
+class OllamaEmbeddingBackend:
+    """Ollama /api/embed（整批文本一次请求）"""
+
+    name = 'ollama'
+
+    def __init__(self, model_name: str, client: OllamaClient = None):
+        self.model_name = model_name
+        self.client = client or ollama_client
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        response = await self.client.client.embed(model=self.model_name, input=texts,
+                                                  keep_alive=self.client.keep_alive)
+        return np.asarray(response['embeddings'], dtype=np.float32)
+
+
+class EmbeddingService:
+    """文本向量服务"""
+
+    def __init__(self):
+        """初始化服务（模型在 load 时加载）"""
+        self.embed_config = config.get_embedding_config()
+        self.backend = None
+        self.batcher: Optional[MicroBatcher] = None
+        self.inference_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='embed-infer')
+        self.max_texts = self.embed_config.get('max_texts_per_request', 256)
+
+        cache_config = self.embed_config.get('cache', {})
+        self.cache: Optional[TTLCache] = None
+        if cache_config.get('enabled', True):
+            self.cache = TTLCache(max_size=cache_config.get('max_entries', 50000),
+                                  ttl_seconds=cache_config.get('ttl_seconds', 86400))
+
+    def load(self):
+        """加载配置的后端；本地模型不可用时退回 Ollama"""
+        backend_name = self.embed_config.get('backend', 'local')
+        model_path = self.embed_config.get('model_path', '')
+
+        if backend_name == 'local':
+            if Path(model_path).exists():
+                try:
+                    self.backend = LocalEmbeddingBackend(
+                        model_path,
+                        max_length=self.embed_config.get('max_length', 512),
+                        threads=self.embed_config.get('threads', 0),
+                        pooling=self.embed_config.get('pooling', 'cls')
+                    )
+                    logger.info(f"向量模型已加载: {model_path}")
+                except Exception as e:
+                    logger.exception(f"向量模型加载失败，改用 Ollama: {e}")
+            else:
+                logger.warning(f"向量模型不存在，改用 Ollama: {model_path}")
+
+        if self.backend is None:
+            self.backend = OllamaEmbeddingBackend(self.embed_config.get('ollama_model', 'bge-m3'))
+            logger.info(f"向量使用 Ollama 模型: {self.backend.model_name}")
+
+        self.batcher = MicroBatcher(
+            self.backend.embed,
+            max_batch_size=self.embed_config.get('max_batch_size', 64),
+            max_wait_ms=self.embed_config.get('batch_window_ms', 5),
+            executor=self.inference_pool,
+            name='文本向量'
+        )
+
+    @property
+    def model_name(self) -> str:
+        return self.backend.model_name if self.backend else ''
+
+    def _key(self, text: str) -> bytes:
+        return hashlib.blake2b(f"{self.model_name}\0{text}".encode('utf-8'), digest_size=16).digest()
+
+    async def embed(self, texts: Sequence[str], normalize: bool = True) -> np.ndarray:
+        """
+        计算一组文本的向量（缓存命中的文本不再计算，请求内重复的文本只算一次）
+
+        :param texts: 文本列表
+        :param normalize: 是否做 L2 归一化（便于直接用点积计算余弦相似度）
+        :return: 形状为 (N, 维度) 的 float32 数组
+        """
+        if self.batcher is None:
+            self.load()
+
+        keys = [self._key(text) for text in texts]
+        vectors: Dict[bytes, np.ndarray] = {}
+        pending: Dict[bytes, str] = {}
+        for key, text in zip(keys, texts):
+            if key in vectors or key in pending:
+                continue
+            cached = self.cache.get(key) if self.cache is not None else None
+            if cached is not None:
+                vectors[key] = cached
+            else:
+                pending[key] = text
+
+        EMBED_TEXTS.labels(result='hit').inc(len(vectors))
+        EMBED_TEXTS.labels(result='miss').inc(len(pending))
+        if pending:
+            results = await self._submit(list(pending.values()))
+            for key, vector in zip(pending.keys(), results):
+                vectors[key] = vector
+                if self.cache is not None:
+                    self.cache.set(key, vector)
+
+        matrix = np.stack([vectors[key] for key in keys]) if keys else np.zeros((0, 0), dtype=np.float32)
+        if normalize and len(matrix):
+            matrix = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        return matrix.astype(np.float32, copy=False)
+
+    async def _submit(self, texts: List[str]) -> List[np.ndarray]:
+        """逐条提交给批处理器（与其他请求的文本合并成批）"""
+        return await asyncio.gather(*(self.batcher.submit(text) for text in texts))
+
+    async def close(self):
+        """停止批处理任务"""
+        if self.batcher is not None:
+            await self.batcher.close()
+        self.inference_pool.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """后端与缓存统计"""
+        return {
+            'backend': self.backend.name if self.backend else None,
+            'model': self.model_name,
+            'cache': self.cache.stats() if self.cache is not None else None
+        }
+
+
+# 全局文本向量服务实例
+embedding_service = EmbeddingService()
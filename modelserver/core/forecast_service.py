@@ -0,0 +1,167 @@
+"""
+按地点缓存的天气预报服务
+同一村镇的用户在几分钟内反复查询同一 location：结果按地点缓存（TTL），
+并发未命中只计算一次（single-flight）；后台任务定期为请求最多的地点
+批量预计算，高峰时段的请求基本都从内存返回
+"""
+import asyncio
+from collections import Counter as RequestCounter
+from typing import Any, Dict, List, Optional
+
+from prometheus_client import Counter, Gauge
+
+from utils.logger import logger
+from utils.single_flight import SingleFlight
+from utils.ttl_cache import TTLCache
+from config.config_loader import config
+from .weather_forecaster import WeatherForecaster, weather_forecaster
+
+FORECAST_REQUESTS = Counter(
+    'afs_forecast_requests_total',
+    '天气预报请求次数（按缓存结果分类）',
+    ['result']
+)
+FORECAST_CACHED_LOCATIONS = Gauge(
+    'afs_forecast_cached_locations',
+    '已缓存预报的地点数'
+)
+
+
+def _location_key(location: str) -> str:
+    """地点归一化（去空白）"""
+    return "".join((location or "").split())
+
+
+class ForecastService:
+    """按地点缓存的天气预报服务"""
+
+    def __init__(self, forecaster: WeatherForecaster = None):
+        """初始化服务（后台预计算在 start 时启动）"""
+        self.forecaster = forecaster or weather_forecaster
+        cache_config = config.get_agricultural_config().get('weather', {}).get('cache', {})
+        self.enabled = cache_config.get('enabled', True)
+        self.precompute_interval = cache_config.get('precompute_interval_seconds', 300)
+        self.precompute_top_n = cache_config.get('precompute_top_n', 50)
+
+        self.forecasts = TTLCache(
+            max_size=cache_config.get('max_locations', 1000),
+            ttl_seconds=cache_config.get('ttl_seconds', 600)
+        )
+        # 热门地点最近一次提交的观测数据（只保存引用），供后台预计算使用
+        self.histories = TTLCache(
+            max_size=max(self.precompute_top_n * 2, 1),
+            ttl_seconds=cache_config.get('history_ttl_seconds', 6 * 3600)
+        )
+        self.request_counts: RequestCounter = RequestCounter()
+        self.flights = SingleFlight()
+        self._precompute_task: Optional[asyncio.Task] = None
+
+    async def get_forecast(self, location: str, historical_data: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        获取地点的预报（命中缓存直接返回）
+
+        :param location: 地点
+        :param historical_data: 观测记录（缓存命中时不参与计算）
+        :return: 预报结果
+        """
+        key = _location_key(location)
+        if not self.enabled or not key:
+            return await self._compute(historical_data)
+
+        self.request_counts[key] += 1
+        if historical_data:
+            self.histories.set(key, historical_data)
+
+        cached = self.forecasts.get(key)
+        if cached is not None:
+            FORECAST_REQUESTS.labels(result='hit').inc()
+            return cached
+
+        FORECAST_REQUESTS.labels(result='coalesced' if self.flights.in_flight(key) else 'miss').inc()
+
+        async def compute():
+            result = await self._compute(historical_data)
+            self.forecasts.set(key, result)
+            FORECAST_CACHED_LOCATIONS.set(len(self.forecasts))
+            return result
+
+        return await self.flights.do(key, compute)
+
+    async def _compute(self, historical_data: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """在线程池中拟合，长历史不阻塞事件循环"""
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self.forecaster.forecast, historical_data
+        )
+
+    def _precompute_batch(self, batch: List[tuple]) -> Dict[str, Dict[str, Any]]:
+        """批量预计算（线程池中执行），单个地点失败不影响其余地点"""
+        results = {}
+        for key, historical_data in batch:
+            try:
+                results[key] = self.forecaster.forecast(historical_data)
+            except Exception as e:
+                logger.warning(f"地点 {key} 预计算失败: {e}")
+        return results
+
+    async def precompute(self) -> int:
+        """
+        为请求最多的地点批量刷新预报
+
+        :return: 刷新的地点数
+        """
+        batch = []
+        for key, _ in self.request_counts.most_common():
+            historical_data = self.histories.get(key)
+            if historical_data:
+                batch.append((key, historical_data))
+            if len(batch) >= self.precompute_top_n:
+                break
+
+        # 请求计数按周期衰减，热门地点随近期访问变化
+        self.request_counts = RequestCounter({
+            key: count // 2 for key, count in self.request_counts.items() if count > 1
+        })
+        if not batch:
+            return 0
+
+        results = await asyncio.get_running_loop().run_in_executor(None, self._precompute_batch, batch)
+        for key, result in results.items():
+            self.forecasts.set(key, result)
+        FORECAST_CACHED_LOCATIONS.set(len(self.forecasts))
+        logger.info(f"天气预报预计算完成: {len(results)}/{len(batch)} 个地点")
+        return len(results)
+
+    async def _precompute_loop(self):
+        while True:
+            await asyncio.sleep(self.precompute_interval)
+            try:
+                await self.precompute()
+            except Exception as e:
+                logger.exception(f"天气预报预计算失败: {e}")
+
+    def start(self):
+        """启动后台预计算任务"""
+        if self.enabled and self.precompute_interval > 0 and self._precompute_task is None:
+            self._precompute_task = asyncio.get_running_loop().create_task(self._precompute_loop())
+
+    async def stop(self):
+        """停止后台预计算任务"""
+        if self._precompute_task is not None:
+            self._precompute_task.cancel()
+            try:
+                await self._precompute_task
+            except asyncio.CancelledError:
+                pass
+            self._precompute_task = None
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计与当前热门地点"""
+        return {
+            **self.forecasts.stats(),
+            'precompute_interval_seconds': self.precompute_interval,
+            'top_locations': self.request_counts.most_common(10)
+        }
+
+
+# 全局天气预报服务实例
+forecast_service = ForecastService()
@@ -0,0 +1,207 @@
+"""
+农业知识库
+启动时从 config/agricultural_kb.yaml 加载一次并建立索引（作物→病害、病害→描述/防治、
+任务类型→推荐方案），请求只读取不可变快照；文件变化时原子替换快照，无需重启
+"""
+import difflib
+from dataclasses import dataclass
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from utils.hot_reload import HotReloadFile
+from config.config_loader import config
+
+DEFAULT_KB_PATH = Path(__file__).parent.parent / "config" / "agricultural_kb.yaml"
+
+# 模糊匹配的最低相似度
+FUZZY_CUTOFF = 0.6
+
+
+def _normalize(name: str) -> str:
+    """作物名称归一化：去空白、统一小写"""
+    return "".join((name or "").split()).lower()
+
+
+def _freeze(value: Any) -> Any:
+    """递归转换为只读结构"""
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+@dataclass(frozen=True)
+class DiseaseInfo:
+    """病害条目"""
+    name: str
+    description: str
+    treatment: str
+
+
+@dataclass(frozen=True)
+class KnowledgeSnapshot:
+    """知识库的不可变快照"""
+    version: Any
+    crop_diseases: Mapping[str, Tuple[str, ...]]
+    crop_treatments: Mapping[str, Mapping[str, str]]
+    diseases: Mapping[str, DiseaseInfo]
+    task_scenarios: Mapping[str, Mapping[str, Any]]
+    default_task_type: str
+    crop_index: Mapping[str, str]
+
+    @classmethod
+    def build(cls, raw: Dict[str, Any]) -> "KnowledgeSnapshot":
+        """
+        校验原始数据并建立索引
+
+        :param raw: YAML 解析结果
+        :return: 快照
+        """
+        crops = raw.get('crops') or {}
+        disease_entries = raw.get('diseases') or {}
+        scenarios = raw.get('task_scenarios') or {}
+        default_task_type = raw.get('default_task_type', 'monitoring')
+
+        diseases = {}
+        for name, entry in disease_entries.items():
+            entry = entry or {}
+            diseases[name] = DiseaseInfo(
+                name=name,
+                description=entry.get('description') or "植物病害",
+                treatment=entry.get('treatment') or "建议咨询农业专家"
+            )
+
+        crop_diseases, crop_treatments, crop_index = {}, {}, {}
+        for crop, entry in crops.items():
+            entry = entry or {}
+            names = list(entry.get('diseases') or [])
+            unknown = [d for d in names + list((entry.get('treatments') or {}).keys()) if d not in diseases]
+            if unknown:
+                raise ValueError(f"作物 {crop} 引用了未定义的病害: {unknown}")
+
+            crop_diseases[crop] = tuple(names)
+            crop_treatments[crop] = MappingProxyType(dict(entry.get('treatments') or {}))
+            for key in [crop] + list(entry.get('aliases') or []):
+                normalized = _normalize(key)
+                if crop_index.get(normalized, crop) != crop:
+                    raise ValueError(f"作物别名 {key} 同时属于 {crop_index[normalized]} 与 {crop}")
+                crop_index[normalized] = crop
+
+        # /task-recommend 直接读取这些字段，缺失时在加载阶段拒绝，保留上一版本
+        for task_type, scenario in scenarios.items():
+            scenario = scenario or {}
+            if not isinstance(scenario.get('reasoning'), str):
+                raise ValueError(f"任务场景 {task_type} 缺少 reasoning")
+            if not isinstance(scenario.get('suggestedActions'), list):
+                raise ValueError(f"任务场景 {task_type} 缺少 suggestedActions 列表")
+            if not isinstance(scenario.get('optimalTiming'), dict):
+                raise ValueError(f"任务场景 {task_type} 缺少 optimalTiming")
+
+        if default_task_type not in scenarios:
+            raise ValueError(f"default_task_type {default_task_type} 未在 task_scenarios 中定义")
+
+        return cls(
+            version=raw.get('version'),
+            crop_diseases=MappingProxyType(crop_diseases),
+            crop_treatments=MappingProxyType(crop_treatments),
+            diseases=MappingProxyType(diseases),
+            task_scenarios=_freeze(scenarios),
+            default_task_type=default_task_type,
+            crop_index=MappingProxyType(crop_index)
+        )
+
+
+class AgriculturalKnowledgeBase:
+    """农业知识库（支持热加载）"""
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        初始化知识库（首次访问时加载）
+
+        :param path: 知识库文件路径（默认读取配置 agricultural.knowledge_base.path）
+        """
+        kb_config = config.get_agricultural_config().get('knowledge_base', {})
+        self.path = Path(path or kb_config.get('path') or DEFAULT_KB_PATH)
+        self._file = HotReloadFile(
+            self.path, KnowledgeSnapshot.build, "农业知识库",
+            reload_check_seconds=kb_config.get('reload_check_seconds', 5)
+        )
+
+    @property
+    def snapshot(self) -> KnowledgeSnapshot:
+        """当前快照（文件变化时自动重新加载）"""
+        return self._file.current
+
+    def reload(self) -> KnowledgeSnapshot:
+        """
+        立即重新加载知识库文件；新内容校验失败时保留旧快照并抛出异常
+
+        :return: 新快照
+        :raises ValueError: 新内容校验失败
+        """
+        return self._file.reload(strict=True)
+
+    def resolve_crop(self, name: str) -> Optional[str]:
+        """
+        把作物名称（含别名、品种名、错别字）解析为标准作物名
+
+        :param name: 用户输入的作物名称
+        :return: 标准作物名，无法识别返回 None
+        """
+        index = self.snapshot.crop_index
+        normalized = _normalize(name)
+        if not normalized:
+            return None
+        if normalized in index:
+            return index[normalized]
+
+        # 品种名通常包含作物名，如“杂交水稻”“樱桃番茄”，取最长的匹配
+        contained = [key for key in index if len(key) >= 2 and key in normalized]
+        if contained:
+            return index[max(contained, key=len)]
+
+        matches = difflib.get_close_matches(normalized, list(index.keys()), n=1, cutoff=FUZZY_CUTOFF)
+        return index[matches[0]] if matches else None
+
+    def diseases_for(self, crop_name: str) -> Tuple[str, ...]:
+        """获取作物的常见病害（作物无法识别时为空）"""
+        crop = self.resolve_crop(crop_name)
+        return self.snapshot.crop_diseases.get(crop, ()) if crop else ()
+
+    def disease_info(self, disease_name: str, crop_name: Optional[str] = None) -> DiseaseInfo:
+        """
+        获取病害描述与防治建议（作物有专门的防治建议时优先使用）
+
+        :param disease_name: 病害名称
+        :param crop_name: 作物名称
+        :return: 病害条目（未收录的病害返回通用描述）
+        """
+        snapshot = self.snapshot
+        info = snapshot.diseases.get(disease_name) or DiseaseInfo(disease_name, "植物病害", "建议咨询农业专家")
+        crop = self.resolve_crop(crop_name) if crop_name else None
+        treatment = snapshot.crop_treatments.get(crop, {}).get(disease_name) if crop else None
+        if treatment:
+            return DiseaseInfo(info.name, info.description, treatment)
+        return info
+
+    def task_scenario(self, task_type: str) -> Mapping[str, Any]:
+        """获取任务类型的推荐方案（未知类型使用默认方案）"""
+        snapshot = self.snapshot
+        return snapshot.task_scenarios.get(task_type) or snapshot.task_scenarios[snapshot.default_task_type]
+
+    def info(self) -> Dict[str, Any]:
+        """知识库概况"""
+        snapshot = self.snapshot
+        return {
+            'version': snapshot.version,
+            'path': str(self.path),
+            'crops': {crop: list(names) for crop, names in snapshot.crop_diseases.items()},
+            'diseaseCount': len(snapshot.diseases),
+            'taskTypes': list(snapshot.task_scenarios.keys())
+        }
+
+
+# 全局农业知识库实例
+knowledge_base = AgriculturalKnowledgeBase()
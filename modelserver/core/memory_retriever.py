@@ -0,0 +1,153 @@
+"""
+老人记忆检索
+为每位老人的问答（answers/questions）维护一个磁盘上的分段 BM25 索引（内存映射），
+按 _id 水位从 MongoDB 增量同步；聊天时检索与当前消息最相关的几条记忆，
+在 token 预算内附在当前消息之前（不放进 system 消息，以免替换 Modelfile 的 SYSTEM），
+新录入的回答无需重新训练即可被想起
+"""
+import asyncio
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from utils import logger, JSONLBuilder
+from utils.bm25_index import SegmentedBM25Index
+from config.config_loader import config
+from .context_budget import ContextBudget, context_budget
+
+MEMORY_HEADER = "以下是你记得的、与家人这句话可能相关的往事（相关时自然地提起，不相关就忽略）："
+
+
+class MemoryRetriever:
+    """老人记忆检索"""
+
+    def __init__(self, budget: ContextBudget = None):
+        """初始化（读取配置 chat.memory，索引在首次使用时打开）"""
+        memory_config = config.get_chat_config().get('memory', {})
+        self.enabled = memory_config.get('enabled', True)
+        self.top_k = memory_config.get('top_k', 3)
+        self.budget_tokens = memory_config.get('budget_tokens', 512)
+        self.max_answer_chars = memory_config.get('max_answer_chars', 300)
+        self.min_score_ratio = memory_config.get('min_score_ratio', 0.4)
+        self.refresh_interval = memory_config.get('refresh_interval_seconds', 300)
+        self.max_segments = memory_config.get('max_segments', 4)
+        self.index_dir = Path(config.get_paths().get('memory_index', '/app/data/memory_index'))
+
+        self.budget = budget or context_budget
+        self._indexes: Dict[str, SegmentedBM25Index] = {}
+        self._last_refresh: Dict[str, float] = {}
+        self._refreshing: Set[str] = set()
+        self._lock = threading.Lock()
+        self._builder: Optional[JSONLBuilder] = None
+
+    def index(self, elder_id: str) -> SegmentedBM25Index:
+        """获取老人的索引（首次访问时打开磁盘上的索引）"""
+        index = self._indexes.get(elder_id)
+        if index is None:
+            with self._lock:
+                index = self._indexes.get(elder_id)
+                if index is None:
+                    path = self.index_dir / re.sub(r'[^\w-]', '_', elder_id)
+                    index = SegmentedBM25Index(path, fields=('question', 'answer'), max_segments=self.max_segments)
+                    self._indexes[elder_id] = index
+        return index
+
+    def refresh(self, elder_id: str, rebuild: bool = False) -> Dict[str, Any]:
+        """
+        从 MongoDB 增量同步老人的问答（阻塞，在线程中调用）
+
+        :param elder_id: 老人 ID
+        :param rebuild: 是否清空后全量重建（回答被修改或删除时使用）
+        :return: 同步结果
+        """
+        index = self.index(elder_id)
+        if rebuild:
+            index.clear()
+        if self._builder is None:
+            self._builder = JSONLBuilder()
+
+        added = 0
+        while True:
+            docs = self._builder.fetch_memories_since(elder_id, index.meta.get('last_id'))
+            if not docs:
+                break
+            index.add_documents(docs, meta={'last_id': docs[-1]['id']})
+            added += len(docs)
+
+        self._last_refresh[elder_id] = time.monotonic()
+        if added:
+            logger.info(f"老人 {elder_id} 的记忆索引新增 {added} 条，共 {index.doc_count} 条")
+        return {'elder_id': elder_id, 'added': added, 'documents': index.doc_count,
+                'segments': len(index.segments)}
+
+    def schedule_refresh(self, elder_id: str):
+        """距上次同步超过间隔时在后台同步（同一老人同时只有一个同步任务）"""
+        last = self._last_refresh.get(elder_id)
+        if elder_id in self._refreshing or (last is not None and time.monotonic() - last < self.refresh_interval):
+            return
+        self._refreshing.add(elder_id)
+        future = asyncio.get_running_loop().run_in_executor(None, self.refresh, elder_id)
+        future.add_done_callback(lambda f: self._refresh_done(elder_id, f))
+
+    def _refresh_done(self, elder_id: str, future: asyncio.Future):
+        self._refreshing.discard(elder_id)
+        if future.exception() is not None:
+            # 失败后同样等待一个间隔再重试，避免 MongoDB 不可用时每轮都重试
+            self._last_refresh[elder_id] = time.monotonic()
+            logger.warning(f"老人 {elder_id} 的记忆索引同步失败: {future.exception()}")
+
+    def search(self, elder_id: str, query: str, top_k: Optional[int] = None) -> List[Tuple[float, Dict[str, Any]]]:
+        """
+        检索与查询最相关的记忆
+
+        :param elder_id: 老人 ID
+        :param query: 查询文本
+        :param top_k: 返回条数（默认读取配置）
+        :return: [(得分, 记忆)]
+        """
+        return self.index(elder_id).search(query, top_k or self.top_k)
+
+    def memory_context(self, elder_id: str, query: str) -> Tuple[str, int]:
+        """
+        检索记忆并在 token 预算内组装为注入文本
+
+        :param elder_id: 老人 ID
+        :param query: 当前用户消息
+        :return: (注入文本, 记忆条数)，没有相关记忆时为 ('', 0)
+        """
+        lines = []
+        used = self.budget.counter.count(MEMORY_HEADER)
+        results = self.search(elder_id, query)
+        for score, memory in results:
+            # 只靠个别常用字命中的记忆与最相关的一条差距很大，不注入
+            if score < results[0][0] * self.min_score_ratio:
+                break
+            answer = memory.get('answer', '')
+            if len(answer) > self.max_answer_chars:
+                answer = answer[:self.max_answer_chars] + '...'
+            line = f"- 家人问过「{memory.get('question', '')}」，你说：「{answer}」"
+            tokens = self.budget.counter.count(line)
+            if used + tokens > self.budget_tokens:
+                continue
+            lines.append(line)
+            used += tokens
+
+        return ("\n".join([MEMORY_HEADER] + lines) if lines else ''), len(lines)
+
+    def info(self, elder_id: str) -> Dict[str, Any]:
+        """老人索引概况"""
+        index = self.index(elder_id)
+        return {
+            'elder_id': elder_id,
+            'path': str(index.path),
+            'documents': index.doc_count,
+            'segments': len(index.segments),
+            'last_id': index.meta.get('last_id'),
+            'refreshing': elder_id in self._refreshing
+        }
+
+
+# 全局记忆检索实例
+memory_retriever = MemoryRetriever()
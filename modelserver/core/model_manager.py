@@ -1,14 +1,41 @@
 """
 模型管理器
-管理 Ollama 模型的生命周期：创建、列出、删除、设置默认模型等
+管理 Ollama 模型的生命周期：创建、列出、删除、设置默认模型等；
+并在内存预算内管理老人模型的常驻（按使用情况决定 keep_alive，超出预算时主动卸载）
 """
 import subprocess
 import json
+import time
+from contextlib import asynccontextmanager
 from typing import List, Dict, Any, Optional
 from pathlib import Path
 
+from prometheus_client import Counter, Gauge
+
 from utils.logger import logger
 from config.config_loader import config
+from .ollama_client import OllamaClient, ollama_client
+
+MODEL_COLD_LOADS = Counter(
+    'afs_model_cold_loads_total',
+    '请求到达时模型未加载、需要冷启动加载的次数'
+)
+
+MODEL_EVICTIONS = Counter(
+    'afs_model_evictions_total',
+    '为腾出内存预算而主动卸载的模型数',
+    ['policy']
+)
+
+MODEL_RESIDENT_BYTES = Gauge(
+    'afs_model_resident_bytes',
+    '已加载模型占用的内存（显存 + 内存，字节）'
+)
+
+MODEL_RESIDENT_COUNT = Gauge(
+    'afs_model_resident_count',
+    '已加载的模型数'
+)
 
 
 class ModelManager:
@@ -19,6 +46,7 @@ class ModelManager:
         self.ollama_config = config.get_ollama_config()
         self.paths = config.get_paths()
         self.model_prefix = self.ollama_config.get('default_model_name_prefix', 'afs_elder_')
+        self.residency = model_residency
     
     def list_models(self, filter_afs_only: bool = True) -> List[Dict[str, Any]]:
         """
@@ -276,6 +304,239 @@ class ModelManager:
         return False
 
 
+
+def _full_name(model: str) -> str:
+    """补全标签（Ollama 的 /api/ps 返回带 :latest 的名称）"""
+    return model if ':' in model else f"{model}:latest"
+
+
+class ModelResidencyManager:
+    """模型常驻管理：在内存预算内决定哪些老人模型保持加载"""
+
+    def __init__(self, client: OllamaClient = None):
+        """初始化（读取配置 ollama.residency）"""
+        ollama_config = config.get_ollama_config()
+        residency_config = ollama_config.get('residency', {})
+        self.enabled = residency_config.get('enabled', True)
+        self.memory_budget = residency_config.get('memory_budget_gb', 20) * 1024 ** 3
+        self.policy = residency_config.get('policy', 'lru')
+        self.keep_alive_hot = residency_config.get('keep_alive_hot', '30m')
+        self.keep_alive_cold = residency_config.get('keep_alive_cold', '5m')
+        self.hot_uses = residency_config.get('hot_uses', 3)
+        self.frequency_half_life = residency_config.get('frequency_half_life_minutes', 30) * 60
+        self.pressure_ratio = residency_config.get('pressure_ratio', 0.8)
+        self.default_model_size = residency_config.get('default_model_gb', 6) * 1024 ** 3
+        self.refresh_interval = residency_config.get('refresh_interval_seconds', 10)
+        self.model_prefix = ollama_config.get('default_model_name_prefix', 'afs_elder_')
+
+        self.client = client or ollama_client
+        self.loaded: Dict[str, int] = {}  # 模型 -> 占用字节数
+        self.sizes: Dict[str, int] = {}  # 见过的模型加载后大小（未加载模型的估计值）
+        self.last_used: Dict[str, float] = {}
+        self.frequency: Dict[str, float] = {}  # 按半衰期衰减的使用频次
+        self.in_use: Dict[str, int] = {}
+        self.loading: Dict[str, int] = {}  # 请求中、尚未确认已加载的模型 -> 请求数（按估计大小预占预算）
+        self.cold_loads = 0
+        self.evictions = 0
+        self._refreshed_at = 0.0
+
+    @property
+    def used_bytes(self) -> int:
+        reserved = sum(self.sizes.get(name, self.default_model_size)
+                       for name in self.loading if name not in self.loaded)
+        return sum(self.loaded.values()) + reserved
+
+    async def refresh(self, force: bool = False):
+        """从 /api/ps 同步已加载的模型（间隔内不重复查询）"""
+        if not force and time.monotonic() - self._refreshed_at < self.refresh_interval:
+            return
+        # 查询失败时同样等待一个间隔，避免 Ollama 不可用时每个请求都重试
+        self._refreshed_at = time.monotonic()
+        response = await self.client.client.ps()
+        self.loaded = {item['model']: item['size'] for item in response['models']}
+        self.sizes.update(self.loaded)
+        MODEL_RESIDENT_BYTES.set(self.used_bytes)
+        MODEL_RESIDENT_COUNT.set(len(self.loaded))
+
+    def _touch(self, name: str):
+        now = time.monotonic()
+        last = self.last_used.get(name)
+        decay = 0.5 ** ((now - last) / self.frequency_half_life) if last is not None else 0.0
+        self.frequency[name] = self.frequency.get(name, 0.0) * decay + 1
+        self.last_used[name] = now
+
+    def _score(self, name: str) -> float:
+        """驱逐优先级（越小越先卸载）"""
+        if self.policy == 'lfu':
+            last = self.last_used.get(name)
+            if last is None:
+                return 0.0
+            return self.frequency.get(name, 0.0) * 0.5 ** ((time.monotonic() - last) / self.frequency_half_life)
+        return self.last_used.get(name, 0.0)
+
+    def _evictable(self, name: str, target: str) -> bool:
+        # 只卸载老人模型；向量、摘要等其他模型计入占用但不由这里卸载
+        return (name != target and name.startswith(self.model_prefix)
+                and not self.in_use.get(name) and not self.loading.get(name))
+
+    async def unload(self, name: str):
+        """立即卸载模型（keep_alive=0）"""
+        await self.client.client.generate(model=name, keep_alive=0)
+        self.loaded.pop(name, None)
+
+    def _pick_victims(self, target: str, size: int) -> List[str]:
+        """
+        按策略选出要卸载的模型，直到加载 target 后不超出预算
+
+        选中的模型立即从 loaded 中移除（不等待卸载完成），并发请求据此计算剩余预算，不会重复卸载
+        """
+        victims = []
+        while self.used_bytes + size > self.memory_budget:
+            candidates = [name for name in self.loaded if self._evictable(name, target)]
+            if not candidates:
+                logger.warning(f"内存预算不足以加载 {target}，且没有可卸载的空闲模型")
+                break
+            victim = min(candidates, key=self._score)
+            del self.loaded[victim]
+            victims.append(victim)
+        return victims
+
+    async def _make_room(self, target: str, victims: List[str]):
+        """卸载选出的模型"""
+        for victim in victims:
+            try:
+                await self.unload(victim)
+            except Exception as e:
+                logger.warning(f"卸载模型 {victim} 失败: {e}")
+                continue
+            self.evictions += 1
+            MODEL_EVICTIONS.labels(policy=self.policy).inc()
+            logger.info(f"为加载 {target} 卸载模型 {victim}（{self.policy}）")
+
+    def keep_alive_for(self, name: str) -> str:
+        """常用模型保持较久；不常用或内存紧张时较快释放"""
+        if self.used_bytes > self.memory_budget * self.pressure_ratio:
+            return self.keep_alive_cold
+        # 刚用过的几次衰减得很少，按一位小数比较，避免 2.999 次被当作不足 3 次
+        hot = round(self.frequency.get(name, 0.0), 1) >= self.hot_uses
+        return self.keep_alive_hot if hot else self.keep_alive_cold
+
+    async def prepare(self, model: str) -> Optional[str]:
+        """
+        请求模型前调用：记录使用、按估计大小预占预算、必要时腾出内存，返回本次请求的 keep_alive
+        （预占由 use() 在请求结束时释放）
+
+        不持有锁：决策与状态更新之间没有 await，查询与卸载期间其他请求照常进行
+
+        :param model: 模型名称
+        :return: keep_alive（未开启时为 None，使用默认值）
+        """
+        if not self.enabled:
+            return None
+
+        name = _full_name(model)
+        try:
+            await self.refresh()
+        except Exception as e:
+            logger.warning(f"查询已加载模型失败: {e}")
+
+        self._touch(name)
+        victims = []
+        # 正在被其他请求加载的模型不重复计为冷启动
+        if name not in self.loaded and not self.loading.get(name):
+            self.cold_loads += 1
+            MODEL_COLD_LOADS.inc()
+            victims = self._pick_victims(name, self.sizes.get(name, self.default_model_size))
+        self.loading[name] = self.loading.get(name, 0) + 1
+        try:
+            await self._make_room(name, victims)
+        except BaseException:
+            self._release(name, False)
+            raise
+        return self.keep_alive_for(name)
+
+    def _release(self, name: str, loaded: bool):
+        """释放预占；请求成功时按估计大小计入已加载（下次同步 /api/ps 时更正）"""
+        remaining = self.loading.get(name, 1) - 1
+        if remaining > 0:
+            self.loading[name] = remaining
+        else:
+            self.loading.pop(name, None)
+        if loaded and name not in self.loaded:
+            self.loaded[name] = self.sizes.get(name, self.default_model_size)
+
+    async def preload(self, model: str) -> bool:
+        """
+        预先加载模型（不卸载其他模型，放不进剩余预算时跳过）
+
+        加载期间按估计大小预占预算，不阻塞同时进行的聊天请求
+
+        :param model: 模型名称
+        :return: 模型是否已加载
+        """
+        name = _full_name(model)
+        await self.refresh(force=True)
+        if name in self.loaded or self.loading.get(name):
+            return True
+        if self.used_bytes + self.sizes.get(name, self.default_model_size) > self.memory_budget:
+            return False
+
+        self.loading[name] = 1
+        loaded = False
+        try:
+            # 不带 prompt 的 generate 只加载模型
+            await self.client.client.generate(model=name, keep_alive=self.keep_alive_hot)
+            loaded = True
+        finally:
+            self._release(name, loaded)
+        return True
+
+    @asynccontextmanager
+    async def use(self, model: str):
+        """
+        在模型使用期间执行（使用中的模型不会被卸载），产出本次请求的 keep_alive；
+        请求成功后才记为已加载，被拒绝（429）或失败的请求不占用预算
+
+        :param model: 模型名称
+        """
+        name = _full_name(model)
+        self.in_use[name] = self.in_use.get(name, 0) + 1
+        prepared = False
+        succeeded = False
+        try:
+            keep_alive = await self.prepare(model)
+            prepared = self.enabled
+            yield keep_alive
+            succeeded = True
+        finally:
+            if prepared:
+                self._release(name, succeeded)
+            self.in_use[name] -= 1
+            if not self.in_use[name]:
+                del self.in_use[name]
+
+    def stats(self) -> Dict[str, Any]:
+        """常驻情况"""
+        return {
+            'enabled': self.enabled,
+            'policy': self.policy,
+            'memory_budget_bytes': self.memory_budget,
+            'used_bytes': self.used_bytes,
+            'loading': dict(self.loading),
+            'loaded': [
+                {'model': name, 'size': size, 'in_use': self.in_use.get(name, 0),
+                 'frequency': round(self.frequency.get(name, 0.0), 2)}
+                for name, size in sorted(self.loaded.items(), key=lambda item: -self._score(item[0]))
+            ],
+            'cold_loads': self.cold_loads,
+            'evictions': self.evictions
+        }
+
+
+# 全局模型常驻管理实例
+model_residency = ModelResidencyManager()
+
+
 if __name__ == '__main__':
     # 测试模型管理器
     manager = ModelManager()
@@ -0,0 +1,197 @@
+"""
+模型预热
+记录每位老人的聊天次数（按半衰期衰减），定期写入本地文件；
+服务启动时以及每天配置的时刻（如晚间高峰前），在内存预算内预先加载最常用的几位老人模型，
+部署后第一位家人的聊天不必再等待数秒的模型冷启动
+"""
+import asyncio
+import json
+import os
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from utils import logger
+from config.config_loader import config
+from .model_manager import ModelResidencyManager, model_residency
+
+
+class ModelPrewarmer:
+    """按使用情况预热老人模型"""
+
+    def __init__(self, residency: ModelResidencyManager = None):
+        """初始化（读取配置 ollama.prewarm，并载入已保存的使用统计）"""
+        ollama_config = config.get_ollama_config()
+        prewarm_config = ollama_config.get('prewarm', {})
+        self.enabled = prewarm_config.get('enabled', True)
+        self.top_n = prewarm_config.get('top_n', 5)
+        self.on_startup = prewarm_config.get('on_startup', True)
+        self.schedule: List[str] = prewarm_config.get('schedule', ['18:00'])
+        self.half_life = prewarm_config.get('usage_half_life_days', 7) * 86400
+        self.flush_interval = prewarm_config.get('flush_interval_seconds', 60)
+        self.usage_path = Path(config.get_paths().get('usage_stats', '/app/data/usage_stats.json'))
+        self.model_prefix = ollama_config.get('default_model_name_prefix', 'afs_elder_')
+
+        self.residency = residency or model_residency
+        self.usage: Dict[str, Dict[str, float]] = self._load_usage()
+        self._dirty = False
+        self._tasks: List[asyncio.Task] = []
+        self._warming: Optional[asyncio.Task] = None
+        self.progress: Dict[str, Any] = {'state': 'idle'}
+
+    # ==================== 使用统计 ====================
+
+    def _load_usage(self) -> Dict[str, Dict[str, float]]:
+        if not self.usage_path.exists():
+            return {}
+        try:
+            with open(self.usage_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warning(f"使用统计读取失败，重新开始统计: {e}")
+            return {}
+
+    def flush(self):
+        """把使用统计写入本地文件（先写临时文件再替换，避免写到一半时进程退出）"""
+        if not self._dirty:
+            return
+        self._dirty = False
+        self.usage_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.usage_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.usage, f, ensure_ascii=False)
+        os.replace(tmp_path, self.usage_path)
+
+    def _decayed(self, stats: Dict[str, float], now: float) -> float:
+        return stats['score'] * 0.5 ** ((now - stats['last_used']) / self.half_life)
+
+    def record(self, elder_id: str):
+        """
+        记录一次聊天
+
+        :param elder_id: 老人 ID
+        """
+        now = time.time()
+        stats = self.usage.get(elder_id)
+        if stats is None:
+            stats = self.usage[elder_id] = {'score': 0.0, 'count': 0, 'last_used': now}
+        stats['score'] = self._decayed(stats, now) + 1
+        stats['count'] += 1
+        stats['last_used'] = now
+        self._dirty = True
+
+    def top_elders(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """按衰减后的使用频次排序的老人"""
+        now = time.time()
+        ranked = sorted(
+            ({'elder_id': elder_id, 'score': round(self._decayed(stats, now), 3), 'count': stats['count']}
+             for elder_id, stats in self.usage.items()),
+            key=lambda item: item['score'], reverse=True
+        )
+        return ranked[:limit or self.top_n]
+
+    # ==================== 预热 ====================
+
+    async def warm(self, reason: str = 'manual') -> Dict[str, Any]:
+        """
+        依次加载最常用的老人模型，直到达到 top_n 或剩余内存预算放不下
+
+        :param reason: 触发原因（startup | schedule | manual）
+        :return: 预热进度
+        """
+        elders = self.top_elders()
+        self.progress = {
+            'state': 'running', 'reason': reason, 'started_at': datetime.now().isoformat(),
+            'total': len(elders), 'loaded': [], 'skipped': [], 'failed': [], 'current': None
+        }
+        try:
+            for item in elders:
+                model = f"{self.model_prefix}{item['elder_id']}"
+                self.progress['current'] = model
+                try:
+                    if await self.residency.preload(model):
+                        self.progress['loaded'].append(model)
+                    else:
+                        self.progress['skipped'].append(model)
+                except Exception as e:
+                    logger.warning(f"预热模型 {model} 失败: {e}")
+                    self.progress['failed'].append(model)
+        except asyncio.CancelledError:
+            self.progress.update({'state': 'cancelled', 'current': None, 'finished_at': datetime.now().isoformat()})
+            raise
+
+        self.progress.update({'state': 'done', 'current': None, 'finished_at': datetime.now().isoformat()})
+        logger.info(f"模型预热完成（{reason}）: 加载 {len(self.progress['loaded'])} 个，"
+                    f"预算不足跳过 {len(self.progress['skipped'])} 个，失败 {len(self.progress['failed'])} 个")
+        return self.progress
+
+    def schedule_warm(self, reason: str = 'manual') -> bool:
+        """在后台开始预热（已有预热在进行时不重复开始）"""
+        if self._warming is not None and not self._warming.done():
+            return False
+        self._warming = asyncio.get_running_loop().create_task(self.warm(reason))
+        return True
+
+    def _seconds_until_next(self, now: datetime) -> float:
+        """距下一个配置时刻（本地时间 HH:MM）的秒数"""
+        candidates = []
+        for entry in self.schedule:
+            hour, minute = (int(part) for part in entry.split(':'))
+            at = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+            if at <= now:
+                at += timedelta(days=1)
+            candidates.append((at - now).total_seconds())
+        return min(candidates)
+
+    async def _schedule_loop(self):
+        while True:
+            await asyncio.sleep(self._seconds_until_next(datetime.now()))
+            self.schedule_warm('schedule')
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning(f"使用统计写入失败: {e}")
+
+    def start(self):
+        """启动定时写入统计与定时预热，并按配置在启动时预热"""
+        if self._tasks:
+            return
+        loop = asyncio.get_running_loop()
+        self._tasks.append(loop.create_task(self._flush_loop()))
+        if not self.enabled:
+            return
+        if self.schedule:
+            self._tasks.append(loop.create_task(self._schedule_loop()))
+        if self.on_startup and self.usage:
+            self.schedule_warm('startup')
+
+    async def stop(self):
+        """停止后台任务并写入使用统计"""
+        tasks = self._tasks + ([self._warming] if self._warming is not None else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        self._warming = None
+        try:
+            self.flush()
+        except Exception as e:
+            logger.warning(f"使用统计写入失败: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """预热进度与常用老人"""
+        return {
+            'enabled': self.enabled,
+            'schedule': self.schedule,
+            'progress': self.progress,
+            'top_elders': self.top_elders()
+        }
+
+
+# 全局模型预热实例
+model_prewarmer = ModelPrewarmer()
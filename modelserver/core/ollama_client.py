@@ -0,0 +1,152 @@
+"""
+Ollama 异步客户端
+进程内共用一个带连接池的客户端，避免每次请求重新建立 TCP 连接，
+并统一附带 keep_alive 让模型在对话间隙保持加载；
+同一模型、相同消息与参数的并发请求（如家庭群聊广播、客户端超时重试）合并为一次生成；
+等待结果的请求全部取消（客户端断开、超过截止时间）后中止上游请求，Ollama 随即停止生成
+"""
+import asyncio
+import re
+from typing import Any, Dict, List, Optional
+
+from prometheus_client import Counter
+
+from utils import TTLCache, SingleFlight, normalize_messages, request_key
+from config.config_loader import config
+from .admission_control import AdmissionController, admission_controller
+
+COALESCED_REQUESTS = Counter(
+    'afs_ollama_coalesced_requests_total',
+    '加入进行中的相同生成、未重复调用 Ollama 的请求数'
+)
+
+CANCELLED_GENERATIONS = Counter(
+    'afs_ollama_cancelled_generations_total',
+    '无人等待结果而中止的生成数'
+)
+
+CANCELLED_TOKENS = Counter(
+    'afs_ollama_cancelled_tokens_total',
+    '中止的生成在中止前已产生的 token 数'
+)
+
+# Modelfile 中的 SYSTEM 指令（训练器写入的格式：SYSTEM """..."""）
+_MODELFILE_SYSTEM = re.compile(r'^SYSTEM\s+"""(.*?)"""', re.DOTALL | re.MULTILINE)
+
+
+class OllamaClient:
+    """Ollama 异步客户端（连接池复用）"""
+
+    def __init__(self, admission: AdmissionController = None):
+        """初始化（首次调用时创建连接池）"""
+        ollama_config = config.get_ollama_config()
+        self.host = ollama_config.get('api_base', 'http://localhost:11434')
+        self.timeout = ollama_config.get('timeout_seconds', 120)
+        self.max_connections = ollama_config.get('max_connections', 32)
+        self.keep_alive = config.get_chat_config().get('keep_alive', '30m')
+        self.coalesce = ollama_config.get('coalesce_requests', True)
+        self._client = None
+        self._flights = SingleFlight(cancel_abandoned=True)
+        self.admission = admission or admission_controller
+        self.cancelled_generations = 0
+        self.cancelled_tokens = 0
+        self._system_prompts = TTLCache(max_size=256, ttl_seconds=600)
+
+    @property
+    def client(self):
+        """底层 ollama.AsyncClient"""
+        if self._client is None:
+            import httpx
+            from ollama import AsyncClient
+            self._client = AsyncClient(
+                host=self.host,
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections)
+            )
+        return self._client
+
+    async def chat(self, model: str, messages: List[Dict[str, Any]],
+                   options: Optional[Dict[str, Any]] = None,
+                   keep_alive: Optional[str] = None, deadline: Optional[float] = None) -> Dict[str, Any]:
+        """
+        非流式聊天（进行中的相同请求直接共享其结果；新的生成先经过准入控制）
+
+        :param model: 模型名称
+        :param messages: 消息列表
+        :param options: 推理参数（如 num_ctx）
+        :param keep_alive: 模型保持加载的时长（默认读取配置 chat.keep_alive）
+        :param deadline: 请求截止时间（time.monotonic() 时刻，用于排队时的准入判断）
+        :return: {content, prompt_eval_count, eval_count, total_duration}
+        :raises ollama.ResponseError: Ollama 返回错误
+        :raises AdmissionRejected: 生成槽位已满且无法在期限内排到
+        """
+        if not self.coalesce:
+            return await self._chat(model, messages, options, keep_alive, deadline)
+
+        key = request_key('chat', model, normalize_messages(messages), options or {})
+        if self._flights.in_flight(key):
+            COALESCED_REQUESTS.inc()
+        return await self._flights.do(key, lambda: self._chat(model, messages, options, keep_alive, deadline))
+
+    async def _chat(self, model: str, messages: List[Dict[str, Any]], options: Optional[Dict[str, Any]],
+                    keep_alive: Optional[str], deadline: Optional[float]) -> Dict[str, Any]:
+        # 内部按流式接收：取消时关闭连接即可让 Ollama 停止生成，并能统计已生成的 token 数
+        parts, final = [], {}
+        async with self.admission.slot(model, deadline):
+            try:
+                async for part in await self.client.chat(
+                    model=model,
+                    messages=messages,
+                    stream=True,
+                    options=options,
+                    keep_alive=keep_alive or self.keep_alive
+                ):
+                    parts.append(part['message']['content'])
+                    final = part
+            except asyncio.CancelledError:
+                self.cancelled_generations += 1
+                self.cancelled_tokens += len(parts)
+                CANCELLED_GENERATIONS.inc()
+                CANCELLED_TOKENS.inc(len(parts))
+                raise
+        return {
+            'content': "".join(parts),
+            'prompt_eval_count': final.get('prompt_eval_count'),
+            'eval_count': final.get('eval_count'),
+            'total_duration': final.get('total_duration')
+        }
+
+    async def system_prompt(self, model: str) -> str:
+        """
+        读取模型 Modelfile 中的 SYSTEM 指令（按模型缓存）
+
+        请求携带 system 消息时 Ollama 不再使用 Modelfile 的 SYSTEM，需要在其基础上追加内容时使用
+
+        :param model: 模型名称
+        :return: SYSTEM 内容（没有时为空字符串）
+        """
+        cached = self._system_prompts.get(model)
+        if cached is None:
+            response = await self.client.show(model)
+            match = _MODELFILE_SYSTEM.search(response['modelfile'] or '')
+            cached = match.group(1).replace('\\"', '"') if match else ''
+            self._system_prompts.set(model, cached)
+        return cached
+
+    def stats(self) -> Dict[str, Any]:
+        """请求合并统计"""
+        return {'coalesce': self.coalesce, 'coalesced_requests': self._flights.joined,
+                'cancelled_generations': self.cancelled_generations,
+                'cancelled_tokens': self.cancelled_tokens}
+
+    async def close(self):
+        """关闭连接池"""
+        if self._client is not None:
+            # 旧版本 ollama 客户端没有 close()，直接关闭底层 httpx 客户端
+            await self._client._client.aclose()
+            self._client = None
+
+
+# 全局 Ollama 客户端实例
+ollama_client = OllamaClient()
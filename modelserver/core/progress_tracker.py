@@ -1,7 +1,8 @@
 """
 训练进度跟踪器
-实时监控训练日志，计算进度并准备推送数据
+实时监控训练日志或结构化进度事件，计算进度并准备推送数据
 """
+import json
 import threading
 import time
 from typing import Dict, Any, Optional, Callable
@@ -39,6 +40,11 @@ class ProgressTracker:
                 'total_epochs': total_epochs,
                 'current_step': 0,
                 'total_steps': 0,
+                'loss': None,
+                'eval_loss': None,
+                'learning_rate': None,
+                'tokens_per_second': None,
+                'memory_mb': None,
                 'start_time': datetime.now().isoformat(),
                 'end_time': None,
                 'eta': None,
@@ -68,8 +74,10 @@ class ProgressTracker:
                 if key in job:
                     job[key] = value
             
-            # 计算进度百分比
-            if 'current_epoch' in kwargs or 'total_epochs' in kwargs:
+            # 计算进度百分比（有精确步数时优先按步数计算）
+            if job['total_steps'] > 0 and ('current_step' in kwargs or 'total_steps' in kwargs):
+                job['progress'] = min(100, int((job['current_step'] / job['total_steps']) * 100))
+            elif 'current_epoch' in kwargs or 'total_epochs' in kwargs:
                 total = job['total_epochs']
                 current = job['current_epoch']
                 if total > 0:
@@ -229,6 +237,90 @@ class ProgressTracker:
         monitor_thread = threading.Thread(target=_monitor, daemon=True)
         monitor_thread.start()
     
+    def monitor_event_file(self, job_id: str, event_file_path: str,
+                           callback: Optional[Callable] = None):
+        """
+        监控训练脚本输出的结构化进度事件（JSON Lines，由 ProgressEventCallback 写入）
+        
+        :param job_id: 任务 ID
+        :param event_file_path: 进度事件文件路径
+        :param callback: 进度更新回调函数
+        """
+        def _is_active():
+            job = self.get_progress(job_id)
+            return job is not None and job['status'] in ['preparing', 'training']
+        
+        def _monitor():
+            event_path = Path(event_file_path)
+            
+            # 训练脚本启动后才会创建文件
+            while not event_path.exists():
+                if not _is_active():
+                    return
+                time.sleep(0.5)
+            
+            with open(event_path, 'r', encoding='utf-8') as f:
+                buffer = ''
+                while True:
+                    line = f.readline()
+                    
+                    if not line:
+                        if not _is_active():
+                            break
+                        time.sleep(0.5)
+                        continue
+                    
+                    # 写入方可能只写了半行，攒满整行再解析
+                    buffer += line
+                    if not buffer.endswith('\n'):
+                        continue
+                    
+                    try:
+                        event = json.loads(buffer)
+                    except json.JSONDecodeError:
+                        logger.warning(f"无法解析进度事件: {buffer.strip()}")
+                        buffer = ''
+                        continue
+                    buffer = ''
+                    
+                    self.apply_event(job_id, event)
+                    
+                    if callback:
+                        callback(self.get_progress(job_id))
+        
+        monitor_thread = threading.Thread(target=_monitor, daemon=True)
+        monitor_thread.start()
+    
+    def apply_event(self, job_id: str, event: Dict[str, Any]):
+        """
+        应用一条结构化进度事件
+        
+        :param job_id: 任务 ID
+        :param event: 进度事件（step、total_steps、epoch、loss、learning_rate 等）
+        """
+        updates = {}
+        
+        if event.get('step') is not None:
+            updates['current_step'] = int(event['step'])
+        if event.get('total_steps'):
+            updates['total_steps'] = int(event['total_steps'])
+        if event.get('epoch') is not None:
+            updates['current_epoch'] = int(event['epoch'])
+        
+        for key in ('loss', 'eval_loss', 'learning_rate', 'tokens_per_second', 'memory_mb'):
+            if event.get(key) is not None:
+                updates[key] = event[key]
+        
+        if event.get('event') == 'train_begin':
+            updates['status'] = 'training'
+            if event.get('num_train_epochs'):
+                updates['total_epochs'] = int(event['num_train_epochs'])
+        
+        self.update_progress(job_id, **updates)
+        
+        if event.get('event') in ('epoch_end', 'train_end', 'eval'):
+            self.add_log(job_id, json.dumps(event, ensure_ascii=False))
+    
     def _parse_log_line(self, job_id: str, line: str):
         """
         解析日志行并提取进度信息
@@ -0,0 +1,208 @@
+"""
+聊天回复缓存（按老人开启）
+家人反复问老人同样的问题（如“你在哪里长大的”）时直接返回此前生成的回复：
+先按归一化后的消息精确匹配，再按文本向量的余弦相似度匹配；
+每位老人的条目数与存活时间有上限，老人模型重新训练或删除后整体失效。
+可为同一问题保留多个回复轮流返回，避免每次回答一字不差
+"""
+import random
+import threading
+import unicodedata
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from prometheus_client import Counter
+
+from utils import logger, TTLCache
+from config.config_loader import config
+from .embedding_service import EmbeddingService, embedding_service
+
+RESPONSE_CACHE_REQUESTS = Counter(
+    'afs_chat_response_cache_requests_total',
+    '回复缓存查询次数（exact 精确命中 / semantic 相似命中 / miss 未命中）',
+    ['result']
+)
+
+RESPONSE_CACHE_SAVED_SECONDS = Counter(
+    'afs_chat_response_cache_saved_seconds_total',
+    '命中回复缓存省去的生成耗时（秒，按该条回复首次生成的耗时估算）'
+)
+
+_IGNORED_CATEGORIES = ('P', 'S', 'Z', 'C')
+
+
+def normalize_message(message: str) -> str:
+    """归一化消息：全角转半角、小写，去掉标点、符号与空白"""
+    text = unicodedata.normalize('NFKC', message).lower()
+    return "".join(ch for ch in text if unicodedata.category(ch)[0] not in _IGNORED_CATEGORIES)
+
+
+@dataclass
+class CacheLookup:
+    """一次缓存查询的结果（未命中时用于写回）"""
+    elder_id: str
+    key: str
+    vector: Optional[np.ndarray]
+    generation: int
+    response: Optional[str] = None
+
+
+class ResponseCache:
+    """聊天回复缓存"""
+
+    def __init__(self, embedder: EmbeddingService = None):
+        """初始化（读取配置 chat.response_cache）"""
+        cache_config = config.get_chat_config().get('response_cache', {})
+        self.enabled = cache_config.get('enabled', False)
+        self.elder_ids = set(cache_config.get('elder_ids') or [])
+        self.first_turn_only = cache_config.get('first_turn_only', True)
+        self.semantic = cache_config.get('semantic', True)
+        self.similarity_threshold = cache_config.get('similarity_threshold', 0.92)
+        self.max_entries_per_elder = cache_config.get('max_entries_per_elder', 200)
+        self.ttl_seconds = cache_config.get('ttl_seconds', 86400)
+        self.variants = max(1, cache_config.get('variants', 1))
+
+        self.embedder = embedder or embedding_service
+        self._elders = TTLCache(max_size=cache_config.get('max_elders', 1000), ttl_seconds=0)
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.requests = {'exact': 0, 'semantic': 0, 'miss': 0}
+        self.saved_seconds = 0.0
+
+    def applies(self, elder_id: str, history: Optional[List[Dict[str, Any]]],
+                requested: Optional[bool] = None) -> bool:
+        """
+        判断本轮是否使用缓存
+
+        :param elder_id: 老人 ID
+        :param history: 本轮之前的消息
+        :param requested: 请求中的开关（None 时读取配置）
+        :return: 是否查询与写入缓存
+        """
+        if not (self.enabled if requested is None else requested):
+            return False
+        if self.elder_ids and elder_id not in self.elder_ids:
+            return False
+        # 回复可能依赖上文（如“然后呢”），默认只缓存开场的第一问
+        if self.first_turn_only and any(m.get('role') != 'system' for m in history or []):
+            return False
+        return True
+
+    def _entries(self, elder_id: str) -> TTLCache:
+        entries = self._elders.get(elder_id)
+        if entries is None:
+            entries = TTLCache(max_size=self.max_entries_per_elder, ttl_seconds=self.ttl_seconds)
+            self._elders.set(elder_id, entries)
+        return entries
+
+    async def lookup(self, elder_id: str, message: str) -> CacheLookup:
+        """
+        查询缓存
+
+        :param elder_id: 老人 ID
+        :param message: 用户消息
+        :return: 查询结果（命中时 response 不为空）
+        """
+        with self._lock:
+            generation = self._generations.get(elder_id, 0)
+        lookup = CacheLookup(elder_id, normalize_message(message), None, generation)
+        entries = self._entries(elder_id)
+
+        result = 'exact'
+        entry = entries.get(lookup.key) if lookup.key else None
+        if entry is None and lookup.key and self.semantic:
+            result = 'semantic'
+            entry = await self._nearest(lookup, entries)
+
+        if entry is None or len(entry['responses']) < self.variants:
+            self._record('miss')
+            return lookup
+
+        # 轮流返回不同的回复，不连续两次返回同一条
+        choices = [i for i in range(len(entry['responses'])) if i != entry['last_served']] or [0]
+        entry['last_served'] = random.choice(choices)
+        lookup.response = entry['responses'][entry['last_served']]
+        self._record(result, entry['generate_seconds'])
+        return lookup
+
+    def _record(self, result: str, saved_seconds: float = 0.0):
+        self.requests[result] += 1
+        self.saved_seconds += saved_seconds
+        RESPONSE_CACHE_REQUESTS.labels(result=result).inc()
+        if saved_seconds:
+            RESPONSE_CACHE_SAVED_SECONDS.inc(saved_seconds)
+
+    async def _nearest(self, lookup: CacheLookup, entries: TTLCache) -> Optional[Dict[str, Any]]:
+        """按向量相似度查找最接近的条目（命中时把 lookup.key 改为该条目的键）"""
+        try:
+            lookup.vector = (await self.embedder.embed([lookup.key]))[0]
+        except Exception as e:
+            logger.warning(f"回复缓存计算向量失败，仅使用精确匹配: {e}")
+            return None
+
+        candidates = [(key, entry) for key, entry in entries.items()
+                      if entry['vector'] is not None and entry['vector'].shape == lookup.vector.shape]
+        if not candidates:
+            return None
+        scores = np.stack([entry['vector'] for _, entry in candidates]) @ lookup.vector
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity_threshold:
+            return None
+
+        lookup.key = candidates[best][0]
+        return entries.get(lookup.key)
+
+    def store(self, lookup: CacheLookup, response: str, generate_seconds: float):
+        """
+        写入新生成的回复
+
+        :param lookup: 本轮的查询结果
+        :param response: 生成的回复
+        :param generate_seconds: 生成耗时（秒）
+        """
+        if not lookup.key or not response:
+            return
+        with self._lock:
+            # 生成期间模型被重新训练时，旧模型的回复不再写入
+            if self._generations.get(lookup.elder_id, 0) != lookup.generation:
+                return
+
+        entries = self._entries(lookup.elder_id)
+        entry = entries.get(lookup.key)
+        if entry is None:
+            entries.set(lookup.key, {
+                'vector': lookup.vector,
+                'responses': [response],
+                'last_served': 0,
+                'generate_seconds': generate_seconds
+            })
+        elif len(entry['responses']) < self.variants and response not in entry['responses']:
+            entry['responses'].append(response)
+
+    def invalidate(self, elder_id: str):
+        """
+        清空老人的缓存（模型重新训练、合并或删除后调用，可在任意线程中调用）
+
+        :param elder_id: 老人 ID
+        """
+        with self._lock:
+            self._generations[elder_id] = self._generations.get(elder_id, 0) + 1
+        if self._elders.pop(elder_id) is not None:
+            logger.info(f"老人 {elder_id} 的回复缓存已失效")
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计"""
+        total = sum(self.requests.values())
+        return {
+            'enabled': self.enabled,
+            'elders': len(self._elders),
+            'entries': sum(len(entries) for _, entries in self._elders.items()),
+            'requests': dict(self.requests),
+            'hit_rate': round((total - self.requests['miss']) / total, 4) if total else 0.0,
+            'saved_seconds': round(self.saved_seconds, 2)
+        }
+
+
+# 全局回复缓存实例
+response_cache = ResponseCache()
@@ -0,0 +1,206 @@
+"""
+农事规则引擎
+规则在 config/agricultural_rules.yaml 中声明，加载时编译为决策表：
+所有规则中出现的（字段, 运算符, 阈值）谓词去重后建立索引，规则表示为规则×谓词的关联矩阵。
+评估时每个谓词对整列只比较一次，再用一次矩阵乘法得到所有记录×规则的命中矩阵，
+单条与批量请求共用同一编译结果；文件变化时重新编译并原子替换
+"""
+from dataclasses import dataclass
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from utils.hot_reload import HotReloadFile
+from config.config_loader import config
+
+DEFAULT_RULES_PATH = Path(__file__).parent.parent / "config" / "agricultural_rules.yaml"
+
+OPERATORS = {
+    'lt': np.less,
+    'lte': np.less_equal,
+    'gt': np.greater,
+    'gte': np.greater_equal,
+    'eq': np.equal
+}
+
+
+def _freeze(value: Any) -> Any:
+    """递归转换为只读结构"""
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+@dataclass(frozen=True)
+class DecisionTable:
+    """编译后的决策表"""
+    defaults: Mapping[str, float]
+    predicates: Tuple[Tuple[str, str, float], ...]
+    incidence: np.ndarray
+    required: np.ndarray
+    rules: Tuple[Mapping[str, Any], ...]
+
+    @classmethod
+    def compile(cls, section: Dict[str, Any], name: str) -> "DecisionTable":
+        """
+        把规则配置编译为决策表
+
+        :param section: 规则配置（fields 与 rules）
+        :param name: 配置段名称（用于错误信息）
+        :return: 决策表
+        """
+        defaults = {field: float(value) for field, value in (section.get('fields') or {}).items()}
+        rules = section.get('rules') or []
+        if not defaults:
+            raise ValueError(f"{name}.fields 不能为空")
+
+        predicate_index: Dict[Tuple[str, str, float], int] = {}
+        rule_predicates: List[List[int]] = []
+        for rule in rules:
+            indices = []
+            for field, comparisons in (rule.get('when') or {}).items():
+                if field not in defaults:
+                    raise ValueError(f"{name} 规则 {rule.get('name')} 使用了未声明的字段: {field}")
+                for op, threshold in (comparisons or {}).items():
+                    if op not in OPERATORS:
+                        raise ValueError(f"{name} 规则 {rule.get('name')} 使用了未知运算符: {op}")
+                    key = (field, op, float(threshold))
+                    indices.append(predicate_index.setdefault(key, len(predicate_index)))
+            rule_predicates.append(indices)
+
+        incidence = np.zeros((len(rules), len(predicate_index)), dtype=np.int32)
+        for row, indices in enumerate(rule_predicates):
+            incidence[row, indices] = 1
+        incidence.setflags(write=False)
+        required = incidence.sum(axis=1)
+        required.setflags(write=False)
+
+        return cls(
+            defaults=MappingProxyType(defaults),
+            predicates=tuple(predicate_index.keys()),
+            incidence=incidence,
+            required=required,
+            rules=tuple(_freeze(rule) for rule in rules)
+        )
+
+    def columns(self, records: Sequence[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+        """
+        把多条记录转换为列数组（缺失或为空的字段取缺省值）
+
+        :param records: 记录列表
+        :return: {字段: float64 数组}
+        """
+        columns = {}
+        for field, default in self.defaults.items():
+            values = np.asarray([record.get(field) for record in records], dtype=np.float64)
+            values[np.isnan(values)] = default
+            columns[field] = values
+        return columns
+
+    def evaluate(self, columns: Dict[str, np.ndarray]) -> np.ndarray:
+        """
+        评估所有规则
+
+        :param columns: columns() 的结果
+        :return: 形状为 (记录数, 规则数) 的命中矩阵
+        """
+        size = len(next(iter(columns.values())))
+        if not self.predicates:
+            return np.ones((size, len(self.rules)), dtype=bool)
+
+        # 每个谓词整列比较一次，规则命中 = 满足的谓词数等于所需谓词数
+        truth = np.empty((size, len(self.predicates)), dtype=np.int32)
+        for index, (field, op, threshold) in enumerate(self.predicates):
+            truth[:, index] = OPERATORS[op](columns[field], threshold)
+        return truth @ self.incidence.T == self.required
+
+
+@dataclass(frozen=True)
+class CompiledRules:
+    """规则文件的编译结果"""
+    version: Any
+    task_generation: DecisionTable
+    task_recommendation: DecisionTable
+    base_score: float
+
+    @classmethod
+    def build(cls, raw: Dict[str, Any]) -> "CompiledRules":
+        """编译整个规则文件"""
+        recommendation = raw.get('task_recommendation') or {}
+        return cls(
+            version=raw.get('version'),
+            task_generation=DecisionTable.compile(raw.get('task_generation') or {}, 'task_generation'),
+            task_recommendation=DecisionTable.compile(recommendation, 'task_recommendation'),
+            base_score=float(recommendation.get('base_score', 0.9))
+        )
+
+
+class RuleEngine:
+    """农事规则引擎（支持热加载）"""
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        初始化规则引擎（首次访问时编译）
+
+        :param path: 规则文件路径（默认读取配置 agricultural.rules.path）
+        """
+        rules_config = config.get_agricultural_config().get('rules', {})
+        self.path = Path(path or rules_config.get('path') or DEFAULT_RULES_PATH)
+        self._file = HotReloadFile(
+            self.path, CompiledRules.build, "农事规则",
+            reload_check_seconds=rules_config.get('reload_check_seconds', 5)
+        )
+
+    @property
+    def rules(self) -> CompiledRules:
+        """当前编译结果（文件变化时自动重新编译）"""
+        return self._file.current
+
+    def reload(self) -> CompiledRules:
+        """立即重新编译规则文件；校验失败时保留旧版本并抛出异常"""
+        return self._file.reload(strict=True)
+
+    def score_task(self, task_type: str, weather: Dict[str, Any]) -> Tuple[float, List[str]]:
+        """
+        按天气为任务评分
+
+        :param task_type: 任务类型
+        :param weather: 天气字段（temperature/humidity/precipitation/windSpeed）
+        :return: (评分, 命中规则的说明)
+        """
+        compiled = self.rules
+        table = compiled.task_recommendation
+        matches = table.evaluate(table.columns([weather]))[0]
+
+        score, notes = compiled.base_score, []
+        for rule, matched in zip(table.rules, matches):
+            task_types = rule.get('task_types') or ()
+            if matched and (not task_types or task_type in task_types):
+                score += float(rule.get('score', 0))
+                if rule.get('note'):
+                    notes.append(rule['note'])
+        return round(min(max(score, 0.0), 1.0), 2), notes
+
+    def info(self) -> Dict[str, Any]:
+        """规则概况"""
+        compiled = self.rules
+        return {
+            'version': compiled.version,
+            'path': str(self.path),
+            'taskGeneration': {
+                'rules': [rule.get('name') for rule in compiled.task_generation.rules],
+                'predicates': len(compiled.task_generation.predicates)
+            },
+            'taskRecommendation': {
+                'rules': [rule.get('name') for rule in compiled.task_recommendation.rules],
+                'predicates': len(compiled.task_recommendation.predicates)
+            }
+        }
+
+
+# 全局规则引擎实例
+rule_engine = RuleEngine()
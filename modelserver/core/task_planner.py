@@ -0,0 +1,110 @@
+"""
+农事任务规划器
+按环境条件（温度、湿度、土壤湿度）生成农事任务。规则来自规则引擎编译好的决策表，
+所有地块的条件组成 NumPy 列后一次评估，单个地块与上百个地块走同一条路径
+"""
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from .rule_engine import DecisionTable, RuleEngine, rule_engine
+
+
+class TaskPlanner:
+    """农事任务规划器"""
+
+    def __init__(self, engine: RuleEngine = None):
+        """
+        初始化规划器
+
+        :param engine: 规则引擎（默认使用全局实例）
+        """
+        self.engine = engine or rule_engine
+
+    @staticmethod
+    def tasks_for(table: DecisionTable, matches: np.ndarray) -> List[List[Dict[str, Any]]]:
+        """
+        按命中矩阵展开每个地块的任务
+
+        命中规则组合相同的地块共享同一个任务列表（只读），
+        只需为每种组合展开一次，而不是逐个地块遍历规则
+
+        :param table: 决策表
+        :param matches: 命中矩阵
+        :return: 每个地块的任务列表
+        """
+        if not len(matches):
+            return []
+        if not table.rules:
+            return [[] for _ in range(len(matches))]
+
+        # 每行命中组合按位打包为定长字节串后去重（不受规则数限制，不会像 64 位整数编码那样溢出）
+        packed = np.packbits(matches.astype(bool), axis=1)
+        keys = np.ascontiguousarray(packed).view(np.dtype((np.void, packed.shape[1]))).reshape(-1)
+        patterns, inverse = np.unique(keys, return_inverse=True)
+        pattern_rows = np.unpackbits(patterns.view(np.uint8).reshape(len(patterns), -1), axis=1,
+                                     count=len(table.rules))
+        pattern_tasks = [
+            [dict(task) for index in np.flatnonzero(row) for task in table.rules[index]['tasks']]
+            for row in pattern_rows
+        ]
+        return [pattern_tasks[i] for i in inverse.reshape(-1).tolist()]
+
+    def plan(self, conditions: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        为单个地块生成任务
+
+        :param conditions: 条件字典
+        :return: 任务列表
+        """
+        table = self.engine.rules.task_generation
+        return self.tasks_for(table, table.evaluate(table.columns([conditions])))[0]
+
+    def plan_bulk(self, conditions_list: Sequence[Dict[str, Any]]
+                  ) -> Tuple[List[List[Dict[str, Any]]], Dict[str, Any]]:
+        """
+        一次评估多个地块
+
+        :param conditions_list: 每个地块的条件字典
+        :return: (每个地块的任务列表, 汇总)
+        """
+        # 整个请求使用同一版本的规则，即使评估期间发生热加载
+        table = self.engine.rules.task_generation
+        columns = table.columns(conditions_list)
+        matches = table.evaluate(columns)
+        return self.tasks_for(table, matches), self.summarize(table, matches, columns)
+
+    @staticmethod
+    def summarize(table: DecisionTable, matches: np.ndarray, columns: Dict[str, np.ndarray]) -> Dict[str, Any]:
+        """
+        按命中矩阵汇总（整列计算，不遍历地块）
+
+        :param table: 决策表
+        :param matches: 命中矩阵
+        :param columns: 条件列
+        :return: 任务类型/优先级计数、需紧急处理的地块序号与条件均值
+        """
+        rule_hits = matches.sum(axis=0)
+        by_type, by_priority = {}, {}
+        urgent_rules = np.zeros(len(table.rules), dtype=bool)
+        for index, rule in enumerate(table.rules):
+            for task in rule['tasks']:
+                by_type[task['type']] = by_type.get(task['type'], 0) + int(rule_hits[index])
+                by_priority[task['priority']] = by_priority.get(task['priority'], 0) + int(rule_hits[index])
+                urgent_rules[index] |= task['priority'] == 'urgent'
+
+        tasks_per_rule = np.array([len(rule['tasks']) for rule in table.rules])
+        return {
+            'totalTasks': int((matches @ tasks_per_rule).sum()),
+            'tasksByType': by_type,
+            'tasksByPriority': by_priority,
+            'urgentPlotIndices': np.flatnonzero(matches[:, urgent_rules].any(axis=1)).tolist(),
+            'averageConditions': {
+                field: round(float(values.mean()), 1) if len(values) else None
+                for field, values in columns.items()
+            }
+        }
+
+
+# 全局任务规划器实例
+task_planner = TaskPlanner()
@@ -3,7 +3,10 @@
 封装 Ollama 训练命令，处理 LoRA Adapter 训练流程
 """
 import subprocess
+import hashlib
+import json
 import os
+import sys
 import time
 from pathlib import Path
 from typing import Optional, Dict, Any
@@ -12,6 +15,7 @@ from datetime import datetime
 from utils.logger import logger
 from utils.jsonl_builder import JSONLBuilder
 from config.config_loader import config
+from .response_cache import response_cache
 
 
 class OllamaTrainer:
@@ -49,23 +53,26 @@ class OllamaTrainer:
             logger.exception(f"准备训练数据时发生错误: {e}")
             return None
     
-    def create_modelfile(self, elder_id: str, elder_name: str = "长辈") -> str:
+    def create_modelfile(self, elder_id: str, elder_name: str = "长辈",
+                         from_model: str = None) -> str:
         """
         创建 Ollama Modelfile
         
         :param elder_id: 老人 ID
         :param elder_name: 老人姓名
+        :param from_model: FROM 指向的模型或 GGUF 路径（可选，默认使用当前基础模型）
         :return: Modelfile 路径
         """
         from utils.system_prompt import SystemPromptGenerator
         
         # 获取当前基础模型
         current_model = config.get_current_model()
-        model_name = current_model.get('key', 'qwen2.5-14b-instruct')
+        model_name = from_model or current_model.get('key', 'qwen2.5-14b-instruct')
         
         # 生成 system prompt
         prompt_gen = SystemPromptGenerator()
         system_instruction = prompt_gen.generate_modelfile_system(elder_name)
+        num_ctx = config.get_chat_config().get('num_ctx', 4096)
         
         # 创建 Modelfile 内容
         modelfile_content = f"""# 传家之宝 - {elder_name} 专属模型
@@ -78,7 +85,7 @@ FROM {model_name}
 PARAMETER temperature 0.7
 PARAMETER top_p 0.9
 PARAMETER top_k 40
-PARAMETER num_ctx 2048
+PARAMETER num_ctx {num_ctx}
 
 # 停止词
 PARAMETER stop "<|eot_id|>"
@@ -152,6 +159,7 @@ PARAMETER stop "<|end_of_text|>"
                 return result
             
             logger.info(f"基础模型创建成功: {model_name}")
+            response_cache.invalidate(elder_id)
             
             # 5. 使用 Ollama 进行微调（如果支持）
             # 注意：Ollama 当前可能不直接支持 LoRA 微调，这里提供框架
@@ -200,6 +208,245 @@ PARAMETER stop "<|end_of_text|>"
         
         return result
     
+    def merge_and_quantize(self, elder_id: str, elder_name: str = "长辈",
+                           adapter_path: str = None) -> Dict[str, Any]:
+        """
+        将老人的 LoRA Adapter 逐层合并进基础模型，转换为 GGUF 并按
+        ollama.quantization 量化，校验后通过 ollama create 注册
+        
+        :param elder_id: 老人 ID
+        :param elder_name: 老人姓名
+        :param adapter_path: Adapter 目录（可选，默认 adapters_output/<elder_id>）
+        :return: 合并结果字典
+        """
+        start_time = time.time()
+        quantization = self.ollama_config.get('quantization', 'q8_0')
+        result = {
+            'success': False,
+            'elder_id': elder_id,
+            'quantization': quantization,
+            'gguf_path': None,
+            'sha256': None,
+            'duration': 0,
+            'error': None
+        }
+        
+        adapter_dir = Path(adapter_path or Path(self.paths.get('adapters_output', '/app/models/adapters')) / elder_id)
+        output_dir = Path(self.paths.get('merged_models', '/app/models/merged')) / elder_id
+        base_model_path = config.get_current_model().get('hf_path')
+        
+        try:
+            if not adapter_dir.exists():
+                result['error'] = f"Adapter 不存在: {adapter_dir}"
+                return result
+            
+            script_path = Path(__file__).resolve().parent.parent / 'scripts' / 'merge_quantize.py'
+            merge_cmd = [
+                sys.executable, str(script_path),
+                '--base_model', base_model_path,
+                '--adapter', str(adapter_dir),
+                '--output_dir', str(output_dir),
+                '--quant', quantization,
+                '--llama_cpp_dir', self.paths.get('llama_cpp_dir', '/app/llama.cpp')
+            ]
+            logger.info(f"执行合并量化命令: {' '.join(merge_cmd)}")
+            
+            merge_process = subprocess.run(
+                merge_cmd,
+                capture_output=True,
+                text=True,
+                timeout=self.max_training_minutes * 60
+            )
+            
+            if merge_process.returncode != 0:
+                logger.error(f"合并量化失败: {merge_process.stderr}")
+                result['error'] = f"合并量化失败: {merge_process.stderr[-500:]}"
+                return result
+            
+            # 脚本最后一行输出 JSON 结果
+            output = json.loads(merge_process.stdout.strip().splitlines()[-1])
+            gguf_path = output['gguf_path']
+            
+            # 注册前重新校验，防止文件在写入后被截断或替换
+            if self._sha256(gguf_path) != output['sha256']:
+                result['error'] = "GGUF 校验和不匹配"
+                return result
+            
+            model_prefix = self.ollama_config.get('default_model_name_prefix', 'afs_elder_')
+            model_name = f"{model_prefix}{elder_id}"
+            modelfile_path = self.create_modelfile(elder_id, elder_name, from_model=gguf_path)
+            
+            create_cmd = ['ollama', 'create', model_name, '-f', modelfile_path]
+            logger.info(f"执行命令: {' '.join(create_cmd)}")
+            create_process = subprocess.run(
+                create_cmd,
+                capture_output=True,
+                text=True,
+                timeout=self.max_training_minutes * 60
+            )
+            
+            if create_process.returncode != 0:
+                logger.error(f"Ollama create 失败: {create_process.stderr}")
+                result['error'] = f"模型注册失败: {create_process.stderr}"
+                return result
+            
+            result.update({
+                'success': True,
+                'gguf_path': gguf_path,
+                'sha256': output['sha256'],
+                'model_name': model_name,
+                'duration': round(time.time() - start_time, 2)
+            })
+            response_cache.invalidate(elder_id)
+            logger.info(f"合并量化模型已注册: {model_name} ({quantization})")
+        
+        except subprocess.TimeoutExpired:
+            logger.error(f"合并量化超时（超过 {self.max_training_minutes} 分钟）")
+            result['error'] = f"合并量化超时（超过 {self.max_training_minutes} 分钟）"
+        
+        except Exception as e:
+            logger.exception(f"合并量化过程中发生错误: {e}")
+            result['error'] = str(e)
+        
+        return result
+    
+    @staticmethod
+    def _sha256(file_path: str) -> str:
+        """
+        流式计算文件 sha256
+        
+        :param file_path: 文件路径
+        :return: 十六进制摘要
+        """
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(8 * 1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+    
+    def build_lora_command(self, task_id: str = None, dataset: str = None, output: str = None,
+                           batch_manifest: str = None, epochs: int = None,
+                           init_adapter: str = None, progress_file: str = None) -> list:
+        """
+        构建 train_lora.py 命令（单任务或批量清单）
+        
+        启用群体热启动且群体 Adapter 已存在时，自动从群体 Adapter 初始化并减少训练轮数
+        
+        :param task_id: 任务 ID（单任务模式）
+        :param dataset: 数据集路径（单任务模式）
+        :param output: 输出目录（单任务模式）
+        :param batch_manifest: 批量清单路径（批量模式）
+        :param epochs: 训练轮数（可选，默认按是否热启动决定）
+        :param init_adapter: 初始化 Adapter 目录（可选，默认按群体热启动配置决定）
+        :param progress_file: 结构化进度事件文件（单任务模式，批量模式写在清单中）
+        :return: 命令列表
+        """
+        root_dir = Path(__file__).resolve().parent.parent
+        population = self.training_config.get('population', {})
+        
+        if init_adapter is None and population.get('enabled'):
+            population_path = population.get('adapter_path')
+            if population_path and (Path(population_path) / 'adapter_config.json').exists():
+                init_adapter = population_path
+            else:
+                logger.warning(f"群体 Adapter 不存在，从零开始训练: {population_path}")
+        
+        if epochs is None:
+            epochs = (population.get('warm_start_epochs', 1) if init_adapter
+                      else self.training_config.get('epochs', 3))
+        
+        cmd = [sys.executable, str(root_dir / 'scripts' / 'train_lora.py')]
+        if batch_manifest:
+            cmd.extend(['--batch_manifest', batch_manifest])
+        else:
+            cmd.extend(['--task_id', task_id, '--dataset', dataset, '--output', output])
+        
+        cmd.extend([
+            '--base_model', config.get_current_model().get('hf_path'),
+            '--config', str(root_dir / 'configs' / 'lora_config.yaml'),
+            '--epochs', str(epochs)
+        ])
+        if init_adapter:
+            cmd.extend(['--init_adapter', init_adapter])
+        if progress_file:
+            cmd.extend(['--progress_file', progress_file])
+        
+        return cmd
+    
+    def progress_file_path(self, job_id: str) -> str:
+        """
+        获取训练任务的结构化进度事件文件路径
+        
+        :param job_id: 任务 ID
+        :return: 文件路径
+        """
+        progress_dir = Path(self.paths.get('logs', '/app/logs/training'))
+        progress_dir.mkdir(parents=True, exist_ok=True)
+        return str(progress_dir / f"{job_id}_progress.jsonl")
+    
+    def train_population_adapter(self, elder_ids: list = None,
+                                 progress_file: str = None) -> Dict[str, Any]:
+        """
+        用多位老人匿名化的汇总回答训练群体 Adapter
+        
+        :param elder_ids: 参与汇总的老人 ID 列表（默认全部）
+        :param progress_file: 结构化进度事件文件（可选）
+        :return: 训练结果字典
+        """
+        start_time = time.time()
+        population = self.training_config.get('population', {})
+        adapter_path = population.get('adapter_path', '/app/models/adapters/_population')
+        result = {
+            'success': False,
+            'adapter_path': adapter_path,
+            'duration': 0,
+            'error': None
+        }
+        
+        try:
+            with JSONLBuilder() as builder:
+                jsonl_path = builder.build_population_jsonl(elder_ids, self.paths.get('jsonl_output'))
+            
+            if not jsonl_path:
+                result['error'] = "群体数据集为空"
+                return result
+            
+            # 群体 Adapter 自身从零开始训练
+            train_cmd = self.build_lora_command(
+                task_id='population', dataset=jsonl_path, output=adapter_path,
+                epochs=population.get('epochs', 3), init_adapter='',
+                progress_file=progress_file
+            )
+            logger.info(f"执行群体 Adapter 训练命令: {' '.join(train_cmd)}")
+            
+            train_process = subprocess.run(
+                train_cmd,
+                capture_output=True,
+                text=True,
+                timeout=self.max_training_minutes * 60
+            )
+            
+            if train_process.returncode != 0:
+                logger.error(f"群体 Adapter 训练失败: {train_process.stderr[-2000:]}")
+                result['error'] = f"群体 Adapter 训练失败: {train_process.stderr[-500:]}"
+                return result
+            
+            result.update({
+                'success': True,
+                'duration': round(time.time() - start_time, 2)
+            })
+            logger.info(f"群体 Adapter 训练完成: {adapter_path}")
+        
+        except subprocess.TimeoutExpired:
+            logger.error(f"群体 Adapter 训练超时（超过 {self.max_training_minutes} 分钟）")
+            result['error'] = f"训练超时（超过 {self.max_training_minutes} 分钟），重新提交将从最新检查点恢复"
+        
+        except Exception as e:
+            logger.exception(f"群体 Adapter 训练过程中发生错误: {e}")
+            result['error'] = str(e)
+        
+        return result
+    
     def _build_train_command(self, model_name: str, jsonl_path: str) -> Optional[list]:
         """
         构建训练命令
@@ -0,0 +1,185 @@
+"""
+批量训练队列
+收集待训练的老人任务，按批次合并为一次 train_lora.py 批量运行，
+基础模型只加载一次，依次训练每位老人的独立 LoRA Adapter
+"""
+import json
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+from utils.logger import logger
+from config.config_loader import config
+from .trainer import OllamaTrainer
+from .progress_tracker import progress_tracker
+
+
+class TrainingQueue:
+    """批量训练队列"""
+
+    def __init__(self, trainer: OllamaTrainer = None):
+        """初始化队列"""
+        self.trainer = trainer or OllamaTrainer()
+        self.paths = config.get_paths()
+        self.batch_config = config.get_training_config().get('batch', {})
+        self.max_elders = self.batch_config.get('max_elders', 8)
+        self.wait_seconds = self.batch_config.get('wait_seconds', 30)
+        self.max_training_minutes = config.get_max_training_minutes()
+
+        self.pending: List[Dict[str, Any]] = []
+        self.lock = threading.Lock()
+        self.worker: Optional[threading.Thread] = None
+
+    def submit(self, elder_id: str, elder_name: str = "长辈") -> str:
+        """
+        提交训练任务，等待与其他老人合批
+
+        :param elder_id: 老人 ID
+        :param elder_name: 老人姓名
+        :return: 任务 ID
+        """
+        total_epochs = config.get_training_config().get('epochs', 3)
+        job_id = progress_tracker.start_tracking(elder_id, total_epochs)
+
+        with self.lock:
+            # 同一老人重复提交时只保留最新任务
+            for job in self.pending:
+                if job['elder_id'] == elder_id:
+                    progress_tracker.complete_tracking(job['job_id'], success=False, error="已被新的训练任务替代")
+            self.pending = [job for job in self.pending if job['elder_id'] != elder_id]
+            self.pending.append({
+                'job_id': job_id,
+                'elder_id': elder_id,
+                'elder_name': elder_name,
+                'submitted_at': time.time()
+            })
+
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self._run_worker, daemon=True)
+                self.worker.start()
+
+        logger.info(f"训练任务已加入批量队列: {job_id}")
+        return job_id
+
+    def pending_count(self) -> int:
+        """获取等待中的任务数量"""
+        with self.lock:
+            return len(self.pending)
+
+    def _next_batch(self) -> List[Dict[str, Any]]:
+        """
+        取出下一批任务：攒满 max_elders 或最早的任务已等待 wait_seconds 即出批
+
+        :return: 任务列表（为空表示队列已空）
+        """
+        while True:
+            with self.lock:
+                if not self.pending:
+                    return []
+
+                oldest_wait = time.time() - self.pending[0]['submitted_at']
+                if len(self.pending) >= self.max_elders or oldest_wait >= self.wait_seconds:
+                    batch = self.pending[:self.max_elders]
+                    self.pending = self.pending[self.max_elders:]
+                    return batch
+
+            time.sleep(1)
+
+    def _run_worker(self):
+        """后台线程：循环出批并执行"""
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                with self.lock:
+                    if not self.pending:
+                        self.worker = None
+                        return
+                continue
+
+            try:
+                self.run_batch(batch)
+            except Exception as e:
+                logger.exception(f"批量训练执行失败: {e}")
+                for job in batch:
+                    progress_tracker.complete_tracking(job['job_id'], success=False, error=str(e))
+
+    def run_batch(self, batch: List[Dict[str, Any]]):
+        """
+        执行一批训练任务
+
+        :param batch: 任务列表
+        """
+        adapters_dir = Path(self.paths.get('adapters_output', '/app/models/adapters'))
+        batch_id = f"batch_{int(time.time())}"
+        logger.info(f"开始批量训练 {batch_id}: {[job['elder_id'] for job in batch]}")
+
+        # 1. 准备每位老人的训练数据
+        manifest_jobs = []
+        for job in batch:
+            progress_tracker.update_progress(job['job_id'], status='training')
+            jsonl_path = self.trainer.prepare_training_data(job['elder_id'], job['elder_name'])
+
+            if not jsonl_path:
+                progress_tracker.complete_tracking(job['job_id'], success=False, error="训练数据准备失败")
+                continue
+
+            job['output'] = str(adapters_dir / job['elder_id'])
+            progress_file = self.trainer.progress_file_path(job['job_id'])
+            progress_tracker.monitor_event_file(job['job_id'], progress_file)
+            manifest_jobs.append({
+                'task_id': job['job_id'],
+                'dataset': jsonl_path,
+                'output': job['output'],
+                'progress_file': progress_file
+            })
+
+        if not manifest_jobs:
+            return
+
+        # 2. 写入批量清单并启动训练脚本
+        manifest_dir = Path(self.paths.get('jsonl_output', '/app/data/jsonl'))
+        manifest_dir.mkdir(parents=True, exist_ok=True)
+        manifest_path = manifest_dir / f"{batch_id}.json"
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump({'jobs': manifest_jobs}, f, ensure_ascii=False, indent=2)
+
+        train_cmd = self.trainer.build_lora_command(batch_manifest=str(manifest_path))
+        logger.info(f"执行批量训练命令: {' '.join(train_cmd)}")
+
+        # 整批的超时按人数放大
+        timeout = self.max_training_minutes * 60 * len(manifest_jobs)
+        missing_error = "批量训练未产出结果"
+        try:
+            train_process = subprocess.run(train_cmd, capture_output=True, text=True, timeout=timeout)
+            if train_process.returncode != 0:
+                logger.warning(f"批量训练存在失败任务: {train_process.stderr[-2000:]}")
+        except subprocess.TimeoutExpired:
+            # 检查点保留在各老人的输出目录中，重新提交即从最新检查点恢复
+            missing_error = f"训练超时（超过 {timeout // 60} 分钟），重新提交将从最新检查点恢复"
+            logger.error(missing_error)
+
+        # 3. 按汇总结果更新每位老人的任务状态
+        results = {}
+        results_path = manifest_path.with_suffix('.results.json')
+        if results_path.exists():
+            with open(results_path, 'r', encoding='utf-8') as f:
+                results = {r['task_id']: r for r in json.load(f)['results']}
+
+        for job in batch:
+            if 'output' not in job:
+                continue
+
+            job_result = results.get(job['job_id'])
+            if job_result and job_result['success']:
+                metrics = job_result.get('metrics', {})
+                progress_tracker.add_log(job['job_id'], f"Adapter: {job['output']} 指标: {json.dumps(metrics)}")
+                progress_tracker.complete_tracking(job['job_id'], success=True)
+            else:
+                error = job_result.get('error') if job_result else missing_error
+                progress_tracker.complete_tracking(job['job_id'], success=False, error=error)
+
+
+# 全局批量训练队列实例
+training_queue = TrainingQueue()
@@ -0,0 +1,297 @@
+"""
+轻量级天气预报器
+把 historicalData 一次性转换为 NumPy 数组，以指数加权的季节回归（线性趋势 + 日周期谐波）
+拟合温度与湿度，降水使用按日汇总的指数平滑；置信度由加权残差推算，
+一年的逐小时数据拟合耗时在毫秒级
+"""
+import math
+import warnings
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config.config_loader import config
+
+# historicalData 中各字段可能使用的键名
+FIELD_ALIASES = {
+    'timestamp': ('timestamp', 'time', 'datetime', 'date', 'ts'),
+    'temperature': ('temperature', 'temp'),
+    'humidity': ('humidity', 'rh'),
+    'precipitation': ('precipitation', 'precip', 'rainfall', 'rain')
+}
+
+# 80% 预测区间对应的正态分位数
+Z_80 = 1.2816
+
+MIN_POINTS = 3
+
+
+def _field_value(record: Dict[str, Any], aliases: Tuple[str, ...]) -> Any:
+    """按别名顺序取记录中第一个非空的字段值（每条记录可以使用不同的键名）"""
+    for key in aliases:
+        value = record.get(key)
+        if value is not None:
+            return value
+    return None
+
+
+def _parse_timestamp(value: Any) -> float:
+    """逐个解析 NumPy 无法批量解析的时间值（带时区偏移、数字与字符串混用等）"""
+    if value is None:
+        return math.nan
+    if isinstance(value, (int, float)):
+        # 毫秒时间戳
+        return value / 1000.0 if value > 1e11 else float(value)
+    try:
+        moment = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f"无法解析的时间: {value!r}")
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def _parse_timestamps(values: List[Any]) -> Optional[np.ndarray]:
+    """
+    把时间列转换为 Unix 秒
+
+    :param values: 时间值（ISO 字符串、秒或毫秒时间戳）
+    :return: float64 数组（缺失的时间为 NaN），无时间列时返回 None
+    """
+    if all(v is None for v in values):
+        return None
+
+    if all(v is None or isinstance(v, (int, float)) for v in values):
+        seconds = np.asarray(values, dtype=np.float64)
+        # 毫秒时间戳
+        return seconds / 1000.0 if np.nanmax(seconds) > 1e11 else seconds
+
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            parsed = np.asarray(values, dtype='datetime64[s]')
+        result = parsed.astype(np.int64).astype(np.float64)
+        result[np.isnat(parsed)] = np.nan
+        return result
+    except (ValueError, TypeError):
+        return np.array([_parse_timestamp(value) for value in values], dtype=np.float64)
+
+
+def to_arrays(historical_data: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """
+    把 historicalData 转换为按时间排序的列数组
+
+    :param historical_data: 观测记录列表
+    :return: {'timestamp', 'temperature', 'humidity', 'precipitation'}，缺失值为 NaN
+    :raises ValueError: 时间无法解析
+    """
+    if not historical_data:
+        return {}
+
+    arrays = {}
+    for field, aliases in FIELD_ALIASES.items():
+        values = [_field_value(record, aliases) for record in historical_data]
+        if field == 'timestamp':
+            arrays[field] = _parse_timestamps(values)
+        else:
+            # None 直接转换为 NaN
+            arrays[field] = np.asarray(values, dtype=np.float64)
+
+    # 没有时间列时按逐小时、以当前时刻结束处理
+    if arrays['timestamp'] is None:
+        now = datetime.now(timezone.utc).timestamp()
+        arrays['timestamp'] = now - 3600.0 * np.arange(len(historical_data) - 1, -1, -1)
+    else:
+        # 个别记录缺少时间时丢弃这些记录
+        known = ~np.isnan(arrays['timestamp'])
+        if not known.all():
+            arrays = {field: values[known] for field, values in arrays.items()}
+        order = np.argsort(arrays['timestamp'], kind='stable')
+        if np.any(order[1:] < order[:-1]):
+            arrays = {field: values[order] for field, values in arrays.items()}
+
+    return arrays
+
+
+class WeatherForecaster:
+    """天气预报器"""
+
+    def __init__(self):
+        """读取配置"""
+        weather_config = config.get_agricultural_config().get('weather', {})
+        self.fit_window_hours = weather_config.get('fit_window_days', 60) * 24
+        self.half_life_hours = weather_config.get('half_life_hours', 168)
+        self.daily_harmonics = weather_config.get('daily_harmonics', 2)
+        self.trend_damping = weather_config.get('trend_damping', 0.99)
+        self.temperature_tolerance = weather_config.get('temperature_tolerance', 2.0)
+
+    def _design(self, hours: np.ndarray, hour_of_day: np.ndarray, seasonal: bool) -> np.ndarray:
+        """设计矩阵：常数项、趋势（天）、日周期谐波"""
+        columns = [np.ones_like(hours), hours / 24.0]
+        if seasonal:
+            angle = 2.0 * np.pi * hour_of_day / 24.0
+            for k in range(1, self.daily_harmonics + 1):
+                columns.append(np.cos(k * angle))
+                columns.append(np.sin(k * angle))
+        return np.column_stack(columns)
+
+    def _fit(self, X: np.ndarray, y: np.ndarray, weights: np.ndarray) -> Optional[Tuple[np.ndarray, float, float]]:
+        """
+        加权最小二乘拟合
+
+        :return: (系数, 残差标准差, 有效样本数)，数据不足时返回 None
+        """
+        valid = ~np.isnan(y)
+        if valid.sum() < max(MIN_POINTS, X.shape[1] + 1):
+            return None
+
+        X, y, w = X[valid], y[valid], weights[valid]
+        sqrt_w = np.sqrt(w)
+        coef, *_ = np.linalg.lstsq(X * sqrt_w[:, None], y * sqrt_w, rcond=None)
+
+        residuals = y - X @ coef
+        n_eff = w.sum() ** 2 / (w ** 2).sum()
+        dof = max(n_eff - X.shape[1], 1.0)
+        sigma = math.sqrt(float((w * residuals ** 2).sum() / w.sum()) * n_eff / dof)
+        return coef, sigma, n_eff
+
+    def _forecast_series(self, coef: np.ndarray, future_hours: np.ndarray,
+                         future_hod: np.ndarray, seasonal: bool, span_hours: float) -> np.ndarray:
+        """外推：趋势按阻尼系数逐小时衰减，且外推长度不超过历史跨度，避免 7 天后发散"""
+        phi = self.trend_damping
+        damped = phi * (1.0 - phi ** future_hours) / (1.0 - phi) if phi < 1 else future_hours
+        X = self._design(np.minimum(damped, span_hours), future_hod, seasonal)
+        return X @ coef
+
+    def forecast(self, historical_data: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        预测未来 24 小时与 7 天天气
+
+        :param historical_data: 观测记录（timestamp/temperature/humidity/precipitation）
+        :return: {'next24h', 'next7days', 'confidence'}
+        """
+        arrays = to_arrays(historical_data)
+        if not arrays or np.count_nonzero(~np.isnan(arrays['temperature'])) < MIN_POINTS:
+            raise ValueError(f"historicalData 至少需要 {MIN_POINTS} 条包含 temperature 的记录")
+
+        timestamps = arrays['timestamp']
+        hours = (timestamps - timestamps[-1]) / 3600.0
+        window = hours >= -self.fit_window_hours
+        hours = hours[window]
+        hour_of_day = (timestamps[window] % 86400.0) / 3600.0
+        weights = 0.5 ** (-hours / self.half_life_hours)
+
+        # 采样间隔不足以体现日周期时（如逐日数据），只拟合水平与趋势
+        step = float(np.median(np.diff(hours))) if len(hours) > 1 else 1.0
+        span_hours = float(hours[-1] - hours[0])
+        seasonal = step <= 6.0 and span_hours >= 24.0
+
+        X = self._design(hours, hour_of_day, seasonal)
+        future_hours = np.arange(1.0, 24 * 7 + 1.0)
+        future_hod = ((timestamps[-1] % 86400.0) / 3600.0 + future_hours) % 24.0
+        # 预测误差随预报时效增长
+        horizon_scale = np.sqrt(1.0 + future_hours / 24.0)
+
+        temperature_fit = self._fit(X, arrays['temperature'][window], weights)
+        if temperature_fit is None:
+            raise ValueError("最近的观测窗口内温度数据不足")
+        coef, temp_sigma, n_eff = temperature_fit
+        temperature = self._forecast_series(coef, future_hours, future_hod, seasonal, span_hours)
+        temp_spread = Z_80 * temp_sigma * horizon_scale
+
+        humidity = None
+        humidity_fit = self._fit(X, arrays['humidity'][window], weights)
+        if humidity_fit is not None:
+            humidity = self._forecast_series(humidity_fit[0], future_hours, future_hod, seasonal, span_hours)
+            humidity = np.clip(humidity, 0, 100)
+
+        precip_24h, precip_7d, rain_probability = self._precipitation(arrays['precipitation'][window], hours)
+
+        # 置信度：未来 24 小时温度误差落在容差内的概率，样本不足时按比例折减
+        sigma_24h = temp_sigma * float(horizon_scale[:24].mean())
+        confidence = math.erf(self.temperature_tolerance / (max(sigma_24h, 1e-6) * math.sqrt(2)))
+        confidence *= min(1.0, n_eff / 24.0)
+
+        next24 = temperature[:24]
+        daily_temperature = temperature.reshape(7, 24)
+        recent_mean = float(np.nanmean(arrays['temperature'][window][hours > -24]))
+        week_delta = float(daily_temperature[-1].mean()) - recent_mean
+        trend = "升温" if week_delta > 1.0 else "降温" if week_delta < -1.0 else "稳定"
+
+        daily = []
+        for day in range(7):
+            daily.append({
+                "day": day + 1,
+                "avgTemperature": round(float(daily_temperature[day].mean()), 1),
+                "minTemperature": round(float(daily_temperature[day].min()), 1),
+                "maxTemperature": round(float(daily_temperature[day].max()), 1),
+                "precipitation": round(precip_7d / 7.0, 1)
+            })
+
+        humidity_24h = round(float(humidity[:24].mean()), 0) if humidity is not None else None
+        return {
+            "next24h": {
+                "condition": self._condition(precip_24h, rain_probability, humidity_24h, float(next24.max())),
+                "temperature": round(float(next24.mean()), 1),
+                "temperatureMin": round(float(next24.min()), 1),
+                "temperatureMax": round(float(next24.max()), 1),
+                "temperatureInterval": [
+                    round(float((next24 - temp_spread[:24]).min()), 1),
+                    round(float((next24 + temp_spread[:24]).max()), 1)
+                ],
+                "humidity": humidity_24h,
+                "precipitation": round(precip_24h, 1),
+                "precipitationProbability": round(rain_probability, 2)
+            },
+            "next7days": {
+                "trend": trend,
+                "avgTemperature": round(float(temperature.mean()), 1),
+                "totalPrecipitation": round(precip_7d, 1),
+                "daily": daily
+            },
+            "confidence": round(confidence, 2),
+            "samples": int(window.sum())
+        }
+
+    def _precipitation(self, precipitation: np.ndarray, hours: np.ndarray) -> Tuple[float, float, float]:
+        """
+        降水预测：按日汇总后做指数平滑
+
+        :return: (未来 24 小时降水量, 未来 7 天降水量, 降水概率)
+        """
+        valid = ~np.isnan(precipitation)
+        if not valid.any():
+            return 0.0, 0.0, 0.0
+
+        # 以最后一条观测为界向前逐 24 小时分箱，最早的不完整日不参与
+        day_index = np.floor(-hours[valid] / 24.0).astype(np.int64)
+        totals = np.bincount(day_index, weights=np.maximum(precipitation[valid], 0.0))
+        if len(totals) > 1:
+            totals = totals[:-1]
+
+        ages = np.arange(len(totals), dtype=np.float64)
+        short = 0.5 ** (ages / 3.0)
+        long = 0.5 ** (ages / 14.0)
+        precip_24h = float((totals * short).sum() / short.sum())
+        precip_7d = float((totals * long).sum() / long.sum()) * 7.0
+        rain_probability = float(((totals >= 0.1) * short).sum() / short.sum())
+        return precip_24h, precip_7d, rain_probability
+
+    @staticmethod
+    def _condition(precip_24h: float, rain_probability: float,
+                   humidity: Optional[float], max_temperature: float) -> str:
+        """根据预测降水与湿度给出天气状况"""
+        if rain_probability >= 0.5 and precip_24h >= 0.1:
+            if precip_24h >= 25:
+                return "雷阵雨" if max_temperature >= 28 else "大雨"
+            return "中雨" if precip_24h >= 10 else "小雨"
+        if humidity is not None and humidity >= 85:
+            return "阴天"
+        if (humidity is not None and humidity >= 65) or rain_probability >= 0.3:
+            return "多云"
+        return "晴朗"
+
+
+# 全局天气预报器实例
+weather_forecaster = WeatherForecaster()
@@ -1,7 +1,15 @@
 # Ollama API 代理服务
 # 用于 Chat-Beta 模型推理
+# 生成请求转发到 Ollama HTTP API；同一模型、相同输入与参数的并发请求（流式与非流式）
+# 合并为一次生成，后加入的请求从头收到同一份输出
+# 客户端断开或超过截止时间（请求头 X-Request-Timeout-Ms）时离开该生成，
+# 所有请求都离开后关闭与 Ollama 的连接，Ollama 随即停止生成
 
-from fastapi import FastAPI, HTTPException
+import asyncio
+import time
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import subprocess
 import json
@@ -10,22 +18,136 @@ from typing import Optional
 import sys
 import os
 
+import httpx
+
+from utils.single_flight import SingleFlight, normalize_messages, request_key
+from utils.deadline import RequestAborted, deadline_after, run_until_disconnected
+
 app = FastAPI(title="Ollama Proxy", version="1.0.0")
 
 OLLAMA_HOST = os.getenv('OLLAMA_HOST', 'localhost')
 OLLAMA_PORT = int(os.getenv('OLLAMA_PORT', '11435'))
 OLLAMA_BASE_URL = f"http://{OLLAMA_HOST}:{OLLAMA_PORT}"
+OLLAMA_TIMEOUT = float(os.getenv('OLLAMA_TIMEOUT', '300'))
+
+# 进行中的生成（按请求内容合并，无人等待时中止）
+flights = SingleFlight(cancel_abandoned=True)
+http_client: Optional[httpx.AsyncClient] = None
+# 中止的生成数与中止前已产生的 token 数
+cancelled = {"generations": 0, "tokens": 0}
 
 class GenerateRequest(BaseModel):
     model: str
     prompt: str
     stream: Optional[bool] = False
     options: Optional[dict] = None
+    keep_alive: Optional[str] = None
 
 class ChatRequest(BaseModel):
     model: str
     messages: list
     stream: Optional[bool] = False
+    options: Optional[dict] = None
+    keep_alive: Optional[str] = None
+
+class OllamaError(Exception):
+    """Ollama 返回的错误"""
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+def get_http_client() -> httpx.AsyncClient:
+    """共用的连接池客户端"""
+    global http_client
+    if http_client is None:
+        http_client = httpx.AsyncClient(base_url=OLLAMA_BASE_URL, timeout=OLLAMA_TIMEOUT)
+    return http_client
+
+async def ollama_stream(path: str, payload: dict):
+    """以流式方式调用 Ollama，逐个产出 NDJSON 分片"""
+    async with get_http_client().stream("POST", path, json={**payload, "stream": True}) as response:
+        if response.status_code != 200:
+            body = (await response.aread()).decode('utf-8', errors='replace')
+            try:
+                body = json.loads(body).get('error', body)
+            except ValueError:
+                pass
+            raise OllamaError(response.status_code, body)
+        tokens = 0
+        try:
+            async for line in response.aiter_lines():
+                if line.strip():
+                    chunk = json.loads(line)
+                    if 'error' in chunk:
+                        raise OllamaError(500, chunk['error'])
+                    tokens += 1
+                    yield chunk
+        except asyncio.CancelledError:
+            cancelled["generations"] += 1
+            cancelled["tokens"] += tokens
+            raise
+
+def coalesced(path: str, payload: dict, key_fields: dict):
+    """加入或发起一次生成（keep_alive 不影响输出，不参与合并键）"""
+    key = request_key(path, key_fields)
+    return flights.stream(key, lambda: ollama_stream(path, payload))
+
+def stream_response(chunks, deadline: Optional[float]):
+    """把分片转发为 NDJSON 流（中途出错或超过截止时间时按 Ollama 的格式输出 error 行）"""
+    async def body():
+        try:
+            while True:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout)
+                except StopAsyncIteration:
+                    return
+                yield json.dumps(chunk, ensure_ascii=False) + "\n"
+        except asyncio.TimeoutError:
+            yield json.dumps({"error": "request deadline exceeded"}, ensure_ascii=False) + "\n"
+        except OllamaError as e:
+            yield json.dumps({"error": e.detail}, ensure_ascii=False) + "\n"
+        except httpx.HTTPError as e:
+            yield json.dumps({"error": f"Ollama request failed: {e}"}, ensure_ascii=False) + "\n"
+        finally:
+            # 客户端断开时 Starlette 取消本生成器，这里同时离开共享的生成
+            await chunks.aclose()
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+async def respond(http_request: Request, chunks, field: str, stream: bool):
+    """按流式或非流式返回；非流式在客户端断开或超过截止时间时中止"""
+    deadline = deadline_after(float(http_request.headers.get("X-Request-Timeout-Ms", 0) or 0))
+    if stream:
+        return stream_response(chunks, deadline)
+    try:
+        return await run_until_disconnected(http_request, collect(chunks, field), deadline)
+    except RequestAborted as e:
+        raise HTTPException(status_code=504 if e.reason == 'deadline' else 499, detail=str(e))
+
+async def collect(chunks, field: str) -> dict:
+    """把分片合并为非流式响应：最后一个分片（含统计信息）加上拼接后的完整内容"""
+    parts = []
+    final = {}
+    try:
+        async for chunk in chunks:
+            if field == 'message':
+                parts.append(chunk.get('message', {}).get('content', ''))
+            else:
+                parts.append(chunk.get('response', ''))
+            final = chunk
+    except OllamaError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except httpx.TimeoutException:
+        raise HTTPException(status_code=408, detail="Generation timeout")
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=503, detail=f"Ollama request failed: {e}")
+
+    if field == 'message':
+        final = {**final, "message": {"role": "assistant", "content": "".join(parts)}}
+    else:
+        final = {**final, "response": "".join(parts)}
+    return final
 
 def check_ollama_available():
     """检查 Ollama 服务是否可用"""
@@ -41,9 +163,19 @@ async def root():
     return {
         "service": "Ollama Proxy",
         "status": "online",
-        "ollama_available": check_ollama_available()
+        "ollama_available": check_ollama_available(),
+        "in_flight": flights.active,
+        "coalesced_requests": flights.joined,
+        "cancelled_generations": cancelled["generations"],
+        "cancelled_tokens": cancelled["tokens"]
     }
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """关闭连接池"""
+    if http_client is not None:
+        await http_client.aclose()
+
 @app.get("/api/tags")
 async def list_models():
     """列出可用模型"""
@@ -74,84 +206,40 @@ async def list_models():
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/generate")
-async def generate(req: GenerateRequest):
+async def generate(req: GenerateRequest, http_request: Request):
     """生成文本"""
     if not check_ollama_available():
         raise HTTPException(status_code=503, detail="Ollama service unavailable")
     
-    try:
-        cmd = ["ollama", "run", req.model]
-        
-        if req.options:
-            for key, value in req.options.items():
-                cmd.extend([f"--{key}", str(value)])
-        
-        if req.stream:
-            return {'mode': 'stream_not_supported_yet'}
-        
-        # 非流式生成
-        result = subprocess.run(
-            cmd,
-            input=req.prompt,
-            capture_output=True,
-            text=True,
-            timeout=300
-        )
-        
-        if result.returncode != 0:
-            raise HTTPException(status_code=500, detail="Generation failed")
-        
-        return {
-            "model": req.model,
-            "response": result.stdout,
-            "done": True
-        }
-    except subprocess.TimeoutExpired:
-        raise HTTPException(status_code=408, detail="Generation timeout")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    payload = {"model": req.model, "prompt": req.prompt}
+    if req.options:
+        payload["options"] = req.options
+    if req.keep_alive is not None:
+        payload["keep_alive"] = req.keep_alive
+    
+    chunks = coalesced("/api/generate", payload,
+                       {"model": req.model, "prompt": req.prompt, "options": req.options or {}})
+    
+    # 非流式生成同样加入共享的流，结束后合并
+    return await respond(http_request, chunks, 'response', req.stream)
 
 @app.post("/api/chat")
-async def chat(req: ChatRequest):
+async def chat(req: ChatRequest, http_request: Request):
     """聊天接口"""
     if not check_ollama_available():
         raise HTTPException(status_code=503, detail="Ollama service unavailable")
     
-    try:
-        # 将消息转换为 prompt
-        prompt_parts = []
-        for msg in req.messages:
-            role = msg.get('role', 'user')
-            content = msg.get('content', '')
-            prompt_parts.append(f"{role}: {content}")
-        
-        full_prompt = "\n".join(prompt_parts)
-        
-        cmd = ["ollama", "run", req.model]
-        
-        if req.stream:
-            return {'mode': 'stream_not_supported_yet'}
-        
-        result = subprocess.run(
-            cmd,
-            input=full_prompt,
-            capture_output=True,
-            text=True,
-            timeout=300
-        )
-        
-        if result.returncode != 0:
-            raise HTTPException(status_code=500, detail="Chat failed")
-        
-        return {
-            "model": req.model,
-            "message": {
-                "role": "assistant",
-                "content": result.stdout
-            }
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    payload = {"model": req.model, "messages": req.messages}
+    if req.options:
+        payload["options"] = req.options
+    if req.keep_alive is not None:
+        payload["keep_alive"] = req.keep_alive
+    
+    chunks = coalesced("/api/chat", payload,
+                       {"model": req.model, "messages": normalize_messages(req.messages),
+                        "options": req.options or {}})
+    
+    return await respond(http_request, chunks, 'message', req.stream)
 
 if __name__ == "__main__":
     import uvicorn
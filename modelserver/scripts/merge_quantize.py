@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+合并 LoRA 并量化为 GGUF - 用于需要完整合并模型的老人
+
+逐层把 LoRA 增量合并进基础权重：基础模型与 Adapter 均通过 safetensors
+的 mmap 方式读取，每次只物化一个 transformer 层，峰值内存约等于单层大小。
+合并结果按层写成分片 safetensors，再调用 llama.cpp 转换为 GGUF 并量化，
+最后生成 sha256 校验文件。
+
+使用方法：
+python merge_quantize.py \
+    --base_model /app/models/base/qwen2.5-7b-instruct \
+    --adapter /app/models/adapters/LXM19580312M \
+    --output_dir /app/models/merged/LXM19580312M \
+    --quant q8_0
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import logging
+from collections import OrderedDict
+from contextlib import ExitStack
+from pathlib import Path
+
+try:
+    import torch
+    from safetensors import safe_open
+    from safetensors.torch import save_file
+except ImportError as e:
+    print(f"错误: {e}")
+    print("请安装依赖: pip install torch safetensors")
+    sys.exit(1)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# convert_hf_to_gguf.py 可直接输出的类型，其余类型需先导出 f16 再用 llama-quantize 量化
+DIRECT_OUTTYPES = {'f32', 'f16', 'bf16', 'q8_0'}
+
+# 需要随合并模型一起复制的非权重文件
+COPY_FILES = [
+    'config.json', 'generation_config.json', 'tokenizer.json', 'tokenizer_config.json',
+    'special_tokens_map.json', 'vocab.json', 'merges.txt', 'tokenizer.model'
+]
+
+LAYER_PATTERN = re.compile(r'^(.*?layers\.\d+)\.')
+
+
+def load_weight_map(base_model):
+    """
+    读取基础模型的 tensor -> 分片文件映射
+
+    :param base_model: HF 格式基础模型目录
+    :return: {tensor 名: 分片文件路径}
+    """
+    base_dir = Path(base_model)
+    index_file = base_dir / 'model.safetensors.index.json'
+
+    if index_file.exists():
+        with open(index_file, 'r', encoding='utf-8') as f:
+            weight_map = json.load(f)['weight_map']
+        return {name: str(base_dir / shard) for name, shard in weight_map.items()}
+
+    single_file = base_dir / 'model.safetensors'
+    if not single_file.exists():
+        raise FileNotFoundError(f"基础模型目录中没有 safetensors 权重: {base_model}")
+
+    with safe_open(str(single_file), framework='pt') as f:
+        return {name: str(single_file) for name in f.keys()}
+
+
+def load_lora_pairs(adapter_dir):
+    """
+    读取 Adapter 配置并建立 基础权重名 -> (lora_A 键, lora_B 键) 映射
+
+    :param adapter_dir: PEFT Adapter 目录
+    :return: (映射字典, 缩放系数, 是否 fan_in_fan_out, Adapter 权重文件路径)
+    """
+    adapter_path = Path(adapter_dir)
+    with open(adapter_path / 'adapter_config.json', 'r', encoding='utf-8') as f:
+        adapter_config = json.load(f)
+
+    rank = adapter_config.get('r', 8)
+    alpha = adapter_config.get('lora_alpha', rank)
+    if adapter_config.get('use_rslora'):
+        scale = alpha / (rank ** 0.5)
+    else:
+        scale = alpha / rank
+
+    adapter_file = adapter_path / 'adapter_model.safetensors'
+    if not adapter_file.exists():
+        raise FileNotFoundError(f"Adapter 权重不存在: {adapter_file}")
+
+    pairs = {}
+    with safe_open(str(adapter_file), framework='pt') as f:
+        for key in f.keys():
+            match = re.match(r'^base_model\.model\.(.+)\.lora_([AB])(?:\.[^.]+)?\.weight$', key)
+            if not match:
+                logger.warning(f"跳过无法识别的 Adapter 权重: {key}")
+                continue
+            module_name, which = match.groups()
+            pairs.setdefault(f"{module_name}.weight", {})[which] = key
+
+    incomplete = [name for name, pair in pairs.items() if len(pair) != 2]
+    if incomplete:
+        raise ValueError(f"Adapter 中存在不完整的 LoRA 权重对: {incomplete[:3]}")
+
+    lora_pairs = {name: (pair['A'], pair['B']) for name, pair in pairs.items()}
+    return lora_pairs, scale, adapter_config.get('fan_in_fan_out', False), str(adapter_file)
+
+
+def group_by_layer(tensor_names):
+    """
+    按 transformer 层分组，非层内权重（embedding、lm_head 等）各自单独成组
+
+    :param tensor_names: tensor 名列表
+    :return: 有序的 {组名: [tensor 名]}
+    """
+    groups = OrderedDict()
+    for name in sorted(tensor_names, key=_layer_sort_key):
+        match = LAYER_PATTERN.match(name)
+        group = match.group(1) if match else name
+        groups.setdefault(group, []).append(name)
+    return groups
+
+
+def _layer_sort_key(name):
+    match = re.search(r'layers\.(\d+)\.', name)
+    return (0, int(match.group(1)), name) if match else (1, 0, name)
+
+
+def merge_layers(base_model, adapter_dir, output_dir):
+    """
+    逐层合并 LoRA 增量，按层写出分片 safetensors
+
+    :param base_model: HF 格式基础模型目录
+    :param adapter_dir: PEFT Adapter 目录
+    :param output_dir: 合并模型输出目录
+    :return: 合并的模块数量
+    """
+    weight_map = load_weight_map(base_model)
+    lora_pairs, scale, fan_in_fan_out, adapter_file = load_lora_pairs(adapter_dir)
+
+    missing = [name for name in lora_pairs if name not in weight_map]
+    if missing:
+        raise ValueError(f"Adapter 目标权重在基础模型中不存在: {missing[:3]}")
+
+    output_path = Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+
+    groups = group_by_layer(weight_map.keys())
+    total_shards = len(groups)
+    new_weight_map = {}
+    total_size = 0
+    merged_count = 0
+
+    logger.info(f"共 {total_shards} 个分组，{len(lora_pairs)} 个 LoRA 模块，缩放系数 {scale:.4f}")
+
+    with ExitStack() as stack:
+        handles = {}
+
+        def get_handle(path):
+            if path not in handles:
+                handles[path] = stack.enter_context(safe_open(path, framework='pt'))
+            return handles[path]
+
+        adapter = get_handle(adapter_file)
+
+        for shard_idx, (group, names) in enumerate(groups.items(), 1):
+            tensors = {}
+            for name in names:
+                weight = get_handle(weight_map[name]).get_tensor(name)
+
+                if name in lora_pairs:
+                    key_a, key_b = lora_pairs[name]
+                    lora_a = adapter.get_tensor(key_a).to(torch.float32)
+                    lora_b = adapter.get_tensor(key_b).to(torch.float32)
+                    delta = (lora_b @ lora_a) * scale
+                    if fan_in_fan_out:
+                        delta = delta.T
+                    weight = (weight.to(torch.float32) + delta).to(weight.dtype)
+                    del lora_a, lora_b, delta
+                    merged_count += 1
+
+                tensors[name] = weight.contiguous()
+
+            shard_name = f"model-{shard_idx:05d}-of-{total_shards:05d}.safetensors"
+            save_file(tensors, str(output_path / shard_name), metadata={'format': 'pt'})
+
+            for name, tensor in tensors.items():
+                new_weight_map[name] = shard_name
+                total_size += tensor.numel() * tensor.element_size()
+
+            # 释放当前层，保证峰值内存只覆盖单层
+            del tensors
+            logger.info(f"已合并分组 {shard_idx}/{total_shards}: {group}")
+
+    with open(output_path / 'model.safetensors.index.json', 'w', encoding='utf-8') as f:
+        json.dump({'metadata': {'total_size': total_size}, 'weight_map': new_weight_map}, f, indent=2)
+
+    for filename in COPY_FILES:
+        src = Path(base_model) / filename
+        if src.exists():
+            shutil.copy2(src, output_path / filename)
+
+    logger.info(f"合并完成，共合并 {merged_count} 个模块")
+    return merged_count
+
+
+def convert_to_gguf(merged_dir, gguf_path, quantization, llama_cpp_dir):
+    """
+    调用 llama.cpp 将合并模型转换为 GGUF 并量化
+
+    :param merged_dir: 合并后的 HF 模型目录
+    :param gguf_path: 输出 GGUF 文件路径
+    :param quantization: 量化类型（如 q8_0、q4_k_m）
+    :param llama_cpp_dir: llama.cpp 目录（包含 convert_hf_to_gguf.py 与 llama-quantize）
+    """
+    quant = quantization.lower()
+    convert_script = Path(llama_cpp_dir) / 'convert_hf_to_gguf.py'
+
+    if quant in DIRECT_OUTTYPES:
+        _run([sys.executable, str(convert_script), merged_dir,
+              '--outfile', gguf_path, '--outtype', quant])
+        return
+
+    f16_path = f"{gguf_path}.f16.tmp"
+    try:
+        _run([sys.executable, str(convert_script), merged_dir,
+              '--outfile', f16_path, '--outtype', 'f16'])
+
+        quantize_bin = shutil.which('llama-quantize') or str(Path(llama_cpp_dir) / 'llama-quantize')
+        _run([quantize_bin, f16_path, gguf_path, quant.upper()])
+    finally:
+        if os.path.exists(f16_path):
+            os.remove(f16_path)
+
+
+def _run(cmd):
+    logger.info(f"执行命令: {' '.join(cmd)}")
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"命令执行失败: {result.stderr.strip()[-2000:]}")
+
+
+def write_checksum(file_path):
+    """
+    流式计算 sha256 并写入 <file>.sha256
+
+    :param file_path: 文件路径
+    :return: 十六进制摘要
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(8 * 1024 * 1024), b''):
+            digest.update(chunk)
+
+    checksum = digest.hexdigest()
+    with open(f"{file_path}.sha256", 'w', encoding='utf-8') as f:
+        f.write(f"{checksum}  {os.path.basename(file_path)}\n")
+
+    return checksum
+
+
+def main():
+    parser = argparse.ArgumentParser(description='逐层合并 LoRA 并量化为 GGUF')
+    parser.add_argument('--base_model', required=True, help='HF 格式基础模型目录')
+    parser.add_argument('--adapter', required=True, help='PEFT Adapter 目录')
+    parser.add_argument('--output_dir', required=True, help='输出目录')
+    parser.add_argument('--quant', default='q8_0', help='量化类型（q8_0、q4_k_m 等）')
+    parser.add_argument('--llama_cpp_dir', default='/app/llama.cpp', help='llama.cpp 目录')
+    parser.add_argument('--keep_merged', action='store_true', help='保留中间的合并 safetensors')
+
+    args = parser.parse_args()
+
+    for path in (args.base_model, args.adapter):
+        if not os.path.exists(path):
+            logger.error(f"路径不存在: {path}")
+            sys.exit(1)
+
+    output_dir = Path(args.output_dir)
+    merged_dir = output_dir / 'merged_hf'
+    gguf_path = output_dir / f"model-{args.quant.lower()}.gguf"
+
+    try:
+        merge_layers(args.base_model, args.adapter, str(merged_dir))
+        convert_to_gguf(str(merged_dir), str(gguf_path), args.quant, args.llama_cpp_dir)
+        checksum = write_checksum(str(gguf_path))
+    except Exception as e:
+        logger.error(f"合并量化失败: {e}")
+        sys.exit(1)
+    finally:
+        if not args.keep_merged and merged_dir.exists():
+            shutil.rmtree(merged_dir)
+
+    logger.info(f"GGUF 已生成: {gguf_path}")
+    logger.info(f"sha256: {checksum}")
+    # 最后一行输出 JSON，供调用方解析
+    print(json.dumps({'gguf_path': str(gguf_path), 'sha256': checksum}))
+
+
+if __name__ == '__main__':
+    main()
@@ -9,13 +9,43 @@ python train_lora.py \
     --output /output/path \
     --base_model Qwen/Qwen2.5-7B-Instruct \
     --epochs 3
+
+批量模式（基础模型只加载一次，依次训练多个老人的 Adapter）：
+python train_lora.py \
+    --batch_manifest /path/to/batch_manifest.json \
+    --base_model Qwen/Qwen2.5-7B-Instruct
+
+从群体 Adapter 热启动（配置了 data.validation_split 时按验证集早停）：
+python train_lora.py \
+    --task_id task_123 \
+    --dataset /path/to/sft_data.json \
+    --output /output/path \
+    --init_adapter /app/models/adapters/_population \
+    --epochs 1
+
+输出目录中已有 checkpoint-N 时自动从最新检查点恢复（--no_resume 关闭）；
+训练完成并保存 Adapter 后删除检查点，下次用新数据重新训练时从头开始。
+检查点只包含 Adapter 权重与优化器/调度器状态，由后台线程写盘。
+
+指定 --progress_file 时以 JSON Lines 输出结构化进度事件，供 ProgressTracker 直接读取。
 """
 
 import argparse
+import dataclasses
+import inspect
 import json
+import math
 import os
+import random
+import re
+import shutil
+import sys
+import threading
+import time
 import yaml
+import numpy as np
 import torch
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datasets import load_dataset
 from transformers import (
@@ -23,15 +53,248 @@ from transformers import (
     AutoModelForCausalLM,
     TrainingArguments,
     Trainer,
-    DataCollatorForLanguageModeling
+    DataCollatorForLanguageModeling,
+    EarlyStoppingCallback,
+    TrainerCallback
 )
-from peft import LoraConfig, get_peft_model
+from transformers.trainer_utils import PREFIX_CHECKPOINT_DIR, get_last_checkpoint
+from peft import LoraConfig, PeftModel, get_peft_model, get_peft_model_state_dict
+from safetensors.torch import save_file
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+def _to_cpu(obj):
+    """递归复制张量到 CPU（生成检查点快照，之后训练可继续修改 GPU 上的状态）"""
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, dict):
+        return {k: _to_cpu(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_to_cpu(v) for v in obj)
+    return obj
+
+
+class AsyncCheckpointTrainer(Trainer):
+    """
+    异步检查点 Trainer
+
+    检查点只保存 Adapter 权重、优化器/调度器状态、RNG 与 trainer_state：
+    主线程只做一次 CPU 快照，写盘交给后台线程；先写入临时目录再原子重命名，
+    恢复时不会读到半写入的检查点。保留数量遵循 save_total_limit。
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._checkpoint_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='checkpoint')
+        self._pending_checkpoint = None
+        self._checkpoint_lock = threading.Lock()
+
+    def _save_checkpoint(self, model, trial, *args, **kwargs):
+        checkpoint_folder = f"{PREFIX_CHECKPOINT_DIR}-{self.state.global_step}"
+        output_dir = os.path.join(self.args.output_dir, checkpoint_folder)
+
+        # 旧版 transformers 在这里传入 metrics 并由 _save_checkpoint 维护最优检查点
+        metrics = kwargs.get('metrics', args[0] if args else None)
+        if metrics is not None and self.args.metric_for_best_model is not None:
+            metric_name = self.args.metric_for_best_model
+            if not metric_name.startswith('eval_'):
+                metric_name = f"eval_{metric_name}"
+            metric_value = metrics.get(metric_name)
+            if metric_value is not None:
+                operator = np.greater if self.args.greater_is_better else np.less
+                if self.state.best_metric is None or operator(metric_value, self.state.best_metric):
+                    self.state.best_metric = metric_value
+                    self.state.best_model_checkpoint = output_dir
+
+        unwrapped = self.accelerator.unwrap_model(model)
+        adapter_name = unwrapped.active_adapter
+        if isinstance(adapter_name, list):
+            adapter_name = adapter_name[0]
+
+        snapshot = {
+            'adapter': _to_cpu(get_peft_model_state_dict(unwrapped, adapter_name=adapter_name)),
+            'adapter_config': unwrapped.peft_config[adapter_name],
+            'optimizer': _to_cpu(self.optimizer.state_dict()),
+            'scheduler': self.lr_scheduler.state_dict(),
+            'rng': {
+                'python': random.getstate(),
+                'numpy': np.random.get_state(),
+                'cpu': torch.random.get_rng_state(),
+                'cuda': torch.cuda.random.get_rng_state_all() if torch.cuda.is_available() else None
+            },
+            'trainer_state': json.dumps(dataclasses.asdict(self.state), indent=2, sort_keys=True)
+        }
+
+        # 同时最多一个检查点在写盘，避免快照在内存中堆积
+        self.wait_for_checkpoint()
+        with self._checkpoint_lock:
+            self._pending_checkpoint = self._checkpoint_executor.submit(
+                self._write_checkpoint, output_dir, snapshot
+            )
+
+    def _write_checkpoint(self, output_dir, snapshot):
+        tmp_dir = os.path.join(os.path.dirname(output_dir), f"tmp-{os.path.basename(output_dir)}")
+        try:
+            if os.path.exists(tmp_dir):
+                shutil.rmtree(tmp_dir)
+            os.makedirs(tmp_dir)
+
+            save_file(snapshot['adapter'], os.path.join(tmp_dir, 'adapter_model.safetensors'),
+                      metadata={'format': 'pt'})
+            snapshot['adapter_config'].save_pretrained(tmp_dir)
+            torch.save(snapshot['optimizer'], os.path.join(tmp_dir, 'optimizer.pt'))
+            torch.save(snapshot['scheduler'], os.path.join(tmp_dir, 'scheduler.pt'))
+            torch.save(snapshot['rng'], os.path.join(tmp_dir, 'rng_state.pth'))
+            with open(os.path.join(tmp_dir, 'trainer_state.json'), 'w', encoding='utf-8') as f:
+                f.write(snapshot['trainer_state'])
+
+            if os.path.exists(output_dir):
+                shutil.rmtree(output_dir)
+            os.replace(tmp_dir, output_dir)
+            logger.info(f"检查点已保存: {output_dir}")
+
+            self._rotate_async_checkpoints()
+        except Exception as e:
+            logger.error(f"检查点保存失败: {output_dir}, 错误: {e}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def _rotate_async_checkpoints(self):
+        """按 save_total_limit 删除旧检查点（始终保留最优检查点）"""
+        limit = self.args.save_total_limit
+        if not limit or limit <= 0:
+            return
+
+        checkpoints = sorted(
+            Path(self.args.output_dir).glob(f"{PREFIX_CHECKPOINT_DIR}-*"),
+            key=lambda p: int(p.name.split('-')[-1]) if p.name.split('-')[-1].isdigit() else -1
+        )
+        keep = checkpoints[-limit:]
+        best = self.state.best_model_checkpoint
+        best_path = next((p for p in checkpoints if best and os.path.abspath(p) == os.path.abspath(best)), None)
+        if best_path is not None and best_path not in keep:
+            keep = [best_path] + (checkpoints[-(limit - 1):] if limit > 1 else checkpoints[-1:])
+
+        for checkpoint in (p for p in checkpoints if p not in keep):
+            logger.info(f"删除旧检查点: {checkpoint}")
+            shutil.rmtree(checkpoint, ignore_errors=True)
+
+    def wait_for_checkpoint(self):
+        """等待正在写盘的检查点完成"""
+        with self._checkpoint_lock:
+            pending = self._pending_checkpoint
+        if pending is not None:
+            pending.result()
+
+    def _load_best_model(self, *args, **kwargs):
+        # 加载最优检查点前确保其已写盘
+        self.wait_for_checkpoint()
+        return super()._load_best_model(*args, **kwargs)
+
+    def train(self, *args, **kwargs):
+        try:
+            return super().train(*args, **kwargs)
+        finally:
+            self.wait_for_checkpoint()
+
+
+class ProgressEventCallback(TrainerCallback):
+    """
+    结构化进度事件回调
+
+    每个事件一行 JSON 追加写入进度文件（step、epoch、loss、lr、tokens/sec、显存），
+    API 侧的 ProgressTracker 逐行读取，无需解析日志文本
+    """
+
+    def __init__(self, progress_file, tokens_per_sample=512):
+        self.progress_file = progress_file
+        self.tokens_per_sample = tokens_per_sample
+        self._file = None
+        self._last_time = None
+        self._last_step = 0
+
+    def _emit(self, state, event, **fields):
+        if not state.is_world_process_zero:
+            return
+        if self._file is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.progress_file)), exist_ok=True)
+            self._file = open(self.progress_file, 'a', encoding='utf-8', buffering=1)
+
+        payload = {
+            'event': event,
+            'time': time.time(),
+            'step': state.global_step,
+            'total_steps': state.max_steps,
+            'epoch': state.epoch,
+        }
+        payload.update(fields)
+        self._file.write(json.dumps(payload, ensure_ascii=False) + '\n')
+
+    @staticmethod
+    def _memory_mb():
+        if torch.cuda.is_available():
+            return round(torch.cuda.max_memory_allocated() / 1024 / 1024, 1)
+        import resource
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+    def on_train_begin(self, args, state, control, **kwargs):
+        self._last_time = time.time()
+        self._last_step = state.global_step
+        self._emit(state, 'train_begin', num_train_epochs=args.num_train_epochs)
+
+    def on_log(self, args, state, control, logs=None, **kwargs):
+        logs = logs or {}
+        now = time.time()
+        elapsed = now - self._last_time if self._last_time else 0
+        steps = state.global_step - self._last_step
+
+        # 样本统一填充到 max_length，按每步处理的样本数估算吞吐
+        tokens_per_step = (args.per_device_train_batch_size * args.gradient_accumulation_steps
+                           * max(1, args.world_size) * self.tokens_per_sample)
+        tokens_per_second = round(steps * tokens_per_step / elapsed, 1) if elapsed > 0 and steps > 0 else None
+        self._last_time = now
+        self._last_step = state.global_step
+
+        event = 'eval' if any(k.startswith('eval_') for k in logs) else 'log'
+        self._emit(
+            state, event,
+            loss=logs.get('loss'),
+            eval_loss=logs.get('eval_loss'),
+            learning_rate=logs.get('learning_rate'),
+            tokens_per_second=tokens_per_second,
+            memory_mb=self._memory_mb()
+        )
+
+    def on_epoch_end(self, args, state, control, **kwargs):
+        self._emit(state, 'epoch_end')
+
+    def on_train_end(self, args, state, control, **kwargs):
+        self._emit(state, 'train_end', memory_mb=self._memory_mb())
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def find_resume_checkpoint(output_dir, enabled=True):
+    """查找输出目录中最新的完整检查点"""
+    if not enabled or not os.path.isdir(output_dir):
+        return None
+
+    checkpoint = get_last_checkpoint(output_dir)
+    if checkpoint:
+        logger.info(f"从检查点恢复训练: {checkpoint}")
+    return checkpoint
+
+
+def remove_checkpoints(output_dir):
+    """Adapter 保存后删除检查点（否则下次训练同一老人时会从已完成的检查点“恢复”）"""
+    for pattern in (f"{PREFIX_CHECKPOINT_DIR}-*", f"tmp-{PREFIX_CHECKPOINT_DIR}-*"):
+        for checkpoint in Path(output_dir).glob(pattern):
+            shutil.rmtree(checkpoint, ignore_errors=True)
+
+
 def load_config(config_path):
     """加载配置文件"""
     default_config = {
@@ -60,80 +323,94 @@ def load_config(config_path):
     return {**default_config, **config}
 
 
-def main():
-    parser = argparse.ArgumentParser(description='训练 Chat-Beta LoRA 模型')
-    parser.add_argument('--task_id', required=True, help='任务 ID')
-    parser.add_argument('--dataset', required=True, help='SFT 数据集路径')
-    parser.add_argument('--output', required=True, help='输出模型路径')
-    parser.add_argument('--base_model', default='Qwen/Qwen2.5-7B-Instruct', help='基础模型')
-    parser.add_argument('--config', default='configs/lora_config.yaml', help='配置文件路径')
-    parser.add_argument('--epochs', type=int, default=3, help='训练轮数')
-    parser.add_argument('--batch_size', type=int, default=4, help='批次大小')
-    parser.add_argument('--learning_rate', type=float, default=2e-4, help='学习率')
-    
-    args = parser.parse_args()
-    
-    logger.info(f"任务 {args.task_id} 开始训练")
-    logger.info(f"数据集: {args.dataset}")
-    logger.info(f"输出路径: {args.output}")
-    
-    # 加载配置
-    if os.path.exists(args.config):
-        config = load_config(args.config)
-    else:
-        logger.warning(f"配置文件不存在: {args.config}, 使用默认配置")
-        config = {}
-    
-    # 加载数据集
-    logger.info("加载数据集...")
-    dataset = load_dataset('json', data_files=args.dataset, split='train')
-    
-    # 加载 tokenizer
-    logger.info(f"加载 tokenizer: {args.base_model}")
-    tokenizer = AutoTokenizer.from_pretrained(args.base_model, trust_remote_code=True)
+def build_lora_config(config):
+    """根据配置构建 LoRA 配置"""
+    return LoraConfig(
+        r=config.get('lora', {}).get('rank', 8),
+        lora_alpha=config.get('lora', {}).get('alpha', 16),
+        lora_dropout=config.get('lora', {}).get('dropout', 0.05),
+        target_modules=config.get('lora', {}).get('target_modules', [
+            'q_proj', 'v_proj', 'k_proj', 'o_proj'
+        ]),
+        bias='none',
+        task_type='CAUSAL_LM'
+    )
+
+
+def load_tokenized_dataset(dataset_path, tokenizer):
+    """加载并分词数据集（兼容 JSONLBuilder 的 text 字段与 messages 字段）"""
+    dataset = load_dataset('json', data_files=dataset_path, split='train')
+    text_column = 'text' if 'text' in dataset.column_names else 'messages'
     
-    # 数据预处理
     def preprocess_function(examples):
         return tokenizer(
-            examples['messages'],
+            examples[text_column],
             truncation=True,
             padding='max_length',
             max_length=512
         )
     
-    tokenized_dataset = dataset.map(preprocess_function, batched=True, remove_columns=['messages'])
-    data_collator = DataCollatorForLanguageModeling(tokenizer=tokenizer, mlm=False)
+    return dataset.map(preprocess_function, batched=True, remove_columns=[text_column])
+
+
+def split_dataset(tokenized_dataset, config):
+    """按 data.validation_split 划分验证集（数据过少时不划分）"""
+    validation_split = config.get('data', {}).get('validation_split', 0)
+    eval_size = int(len(tokenized_dataset) * validation_split)
     
-    # 加载模型
-    logger.info(f"加载基础模型: {args.base_model}")
-    model = AutoModelForCausalLM.from_pretrained(
-        args.base_model,
-        torch_dtype=torch.bfloat16,
-        device_map='auto',
-        trust_remote_code=True
-    )
+    if eval_size < 1 or len(tokenized_dataset) - eval_size < 1:
+        return tokenized_dataset, None
     
-    # LoRA 配置
-    lora_config = LoraConfig(
-        r=config.get('lora', {}).get('rank', 8),
-        lora_alpha=config.get('lora', {}).get('alpha', 16),
-        lora_dropout=config.get('lora', {}).get('dropout', 0.05),
-        target_modules=config.get('lora', {}).get('target_modules', [
-            'q_proj', 'v_proj', 'k_proj', 'o_proj'
-        ]),
-        bias='none',
-        task_type='CAUSAL_LM'
+    split = tokenized_dataset.train_test_split(
+        test_size=eval_size,
+        seed=config.get('training', {}).get('seed', 42)
     )
+    return split['train'], split['test']
+
+
+def build_callbacks(config, eval_dataset, progress_file=None):
+    """有验证集时启用早停，指定进度文件时输出结构化进度事件"""
+    callbacks = []
     
-    model = get_peft_model(model, lora_config)
-    model.print_trainable_parameters()
+    if progress_file:
+        callbacks.append(ProgressEventCallback(progress_file))
+    
+    if eval_dataset is not None:
+        callbacks.append(EarlyStoppingCallback(
+            early_stopping_patience=config.get('training', {}).get('early_stopping_patience', 2),
+            early_stopping_threshold=config.get('training', {}).get('early_stopping_threshold', 0.0)
+        ))
+    
+    return callbacks
+
+
+def build_training_args(args, config, output_dir, train_size=0, with_eval=False):
+    """构建训练参数（with_eval 时按步评估并保留验证损失最优的 Adapter）"""
+    batch_size = args.batch_size or config.get('training', {}).get('batch_size', 4)
+    gradient_accumulation_steps = config.get('training', {}).get('gradient_accumulation_steps', 1)
     
-    # 训练参数
-    training_args = TrainingArguments(
-        output_dir=args.output,
+    eval_kwargs = {}
+    if with_eval:
+        # 小数据集一个 epoch 可能不足 eval_steps 步，评估间隔不超过一个 epoch
+        steps_per_epoch = max(1, math.ceil(train_size / (batch_size * gradient_accumulation_steps)))
+        eval_steps = max(1, min(config.get('training', {}).get('eval_steps', 100), steps_per_epoch))
+        # transformers 4.41 起 evaluation_strategy 更名为 eval_strategy
+        strategy_key = ('eval_strategy' if 'eval_strategy' in inspect.signature(TrainingArguments).parameters
+                        else 'evaluation_strategy')
+        eval_kwargs = {
+            strategy_key: 'steps',
+            'eval_steps': eval_steps,
+            'save_steps': eval_steps,
+            'load_best_model_at_end': True,
+            'metric_for_best_model': 'eval_loss',
+            'greater_is_better': False
+        }
+    
+    training_args = dict(
+        output_dir=output_dir,
         num_train_epochs=args.epochs or config.get('training', {}).get('num_epochs', 3),
-        per_device_train_batch_size=args.batch_size or config.get('training', {}).get('batch_size', 4),
-        gradient_accumulation_steps=config.get('training', {}).get('gradient_accumulation_steps', 1),
+        per_device_train_batch_size=batch_size,
+        gradient_accumulation_steps=gradient_accumulation_steps,
         learning_rate=args.learning_rate or config.get('training', {}).get('learning_rate', 2e-4),
         weight_decay=config.get('training', {}).get('weight_decay', 0.01),
         warmup_steps=config.get('training', {}).get('warmup_steps', 100),
@@ -142,29 +419,211 @@ def main():
         save_steps=config.get('training', {}).get('save_steps', 500),
         save_total_limit=config.get('training', {}).get('save_total_limit', 3),
         fp16=True,
-        logging_dir=f'{args.output}/logs',
+        logging_dir=f'{output_dir}/logs',
         report_to='none'
     )
+    training_args.update(eval_kwargs)
+    return TrainingArguments(**training_args)
+
+
+def load_base_model(base_model):
+    """加载 tokenizer 与基础模型"""
+    logger.info(f"加载 tokenizer: {base_model}")
+    tokenizer = AutoTokenizer.from_pretrained(base_model, trust_remote_code=True)
+    
+    logger.info(f"加载基础模型: {base_model}")
+    model = AutoModelForCausalLM.from_pretrained(
+        base_model,
+        torch_dtype=torch.bfloat16,
+        device_map='auto',
+        trust_remote_code=True
+    )
+    return tokenizer, model
+
+
+def collect_metrics(trainer, train_result, num_examples):
+    """汇总训练指标（含早停时的实际训练轮数与最优验证损失）"""
+    metrics = dict(train_result.metrics)
+    metrics['num_examples'] = num_examples
+    metrics['epochs_trained'] = trainer.state.epoch
+    if trainer.state.best_metric is not None:
+        metrics['best_eval_loss'] = trainer.state.best_metric
+    return metrics
+
+
+def run_batch(args, config):
+    """
+    批量训练：基础模型只加载一次，依次为每位老人挂载独立的 LoRA Adapter，
+    训练完成后保存并卸载，输出每位老人的 Adapter 目录和指标
+
+    清单格式：{"jobs": [{"task_id": ..., "dataset": ..., "output": ..., "progress_file": ...}, ...]}
+    """
+    with open(args.batch_manifest, 'r', encoding='utf-8') as f:
+        jobs = json.load(f)['jobs']
+    
+    logger.info(f"批量训练 {len(jobs)} 个 Adapter")
+    
+    tokenizer, base_model = load_base_model(args.base_model)
+    lora_config = build_lora_config(config)
+    data_collator = DataCollatorForLanguageModeling(tokenizer=tokenizer, mlm=False)
+    
+    model = None
+    previous_adapter = None
+    results = []
+    
+    for job in jobs:
+        adapter_name = re.sub(r'[^0-9A-Za-z_]', '_', job['task_id'])
+        output_dir = job['output']
+        job_result = {'task_id': job['task_id'], 'output': output_dir, 'success': False}
+        
+        try:
+            logger.info(f"任务 {job['task_id']} 开始训练，数据集: {job['dataset']}")
+            tokenized_dataset = load_tokenized_dataset(job['dataset'], tokenizer)
+            train_dataset, eval_dataset = split_dataset(tokenized_dataset, config)
+            
+            # 原地切换 Adapter：先挂载新 Adapter，再卸载上一个，避免重复加载基础模型
+            # 指定 init_adapter 时新 Adapter 从群体 Adapter 权重初始化
+            if model is None:
+                if args.init_adapter:
+                    model = PeftModel.from_pretrained(
+                        base_model, args.init_adapter, adapter_name=adapter_name, is_trainable=True
+                    )
+                else:
+                    model = get_peft_model(base_model, lora_config, adapter_name=adapter_name)
+            else:
+                if args.init_adapter:
+                    model.load_adapter(args.init_adapter, adapter_name=adapter_name, is_trainable=True)
+                else:
+                    model.add_adapter(adapter_name, lora_config)
+                model.set_adapter(adapter_name)
+                model.base_model.delete_adapter(previous_adapter)
+            previous_adapter = adapter_name
+            model.print_trainable_parameters()
+            
+            trainer = AsyncCheckpointTrainer(
+                model=model,
+                args=build_training_args(args, config, output_dir, len(train_dataset), eval_dataset is not None),
+                train_dataset=train_dataset,
+                eval_dataset=eval_dataset,
+                data_collator=data_collator,
+                callbacks=build_callbacks(config, eval_dataset, job.get('progress_file'))
+            )
+            train_result = trainer.train(
+                resume_from_checkpoint=find_resume_checkpoint(output_dir, not args.no_resume)
+            )
+            
+            # 非 default 名称的 Adapter 会保存到子目录，这里移回任务输出目录
+            model.save_pretrained(output_dir, selected_adapters=[adapter_name])
+            adapter_subdir = Path(output_dir) / adapter_name
+            if adapter_subdir.is_dir():
+                for item in adapter_subdir.iterdir():
+                    shutil.move(str(item), str(Path(output_dir) / item.name))
+                adapter_subdir.rmdir()
+            tokenizer.save_pretrained(output_dir)
+            remove_checkpoints(output_dir)
+            
+            metrics = collect_metrics(trainer, train_result, len(tokenized_dataset))
+            with open(Path(output_dir) / 'metrics.json', 'w', encoding='utf-8') as f:
+                json.dump(metrics, f, ensure_ascii=False, indent=2)
+            
+            job_result.update({'success': True, 'metrics': metrics})
+            logger.info(f"任务 {job['task_id']} 训练完成，Adapter 已保存到: {output_dir}")
+        
+        except Exception as e:
+            logger.exception(f"任务 {job['task_id']} 训练失败: {e}")
+            job_result['error'] = str(e)
+        
+        finally:
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        
+        results.append(job_result)
+    
+    summary_path = Path(args.batch_manifest).with_suffix('.results.json')
+    with open(summary_path, 'w', encoding='utf-8') as f:
+        json.dump({'results': results}, f, ensure_ascii=False, indent=2)
+    
+    logger.info(f"批量训练结束: {sum(r['success'] for r in results)}/{len(results)} 成功，汇总: {summary_path}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='训练 Chat-Beta LoRA 模型')
+    parser.add_argument('--task_id', help='任务 ID')
+    parser.add_argument('--dataset', help='SFT 数据集路径')
+    parser.add_argument('--output', help='输出模型路径')
+    parser.add_argument('--batch_manifest', help='批量训练清单（JSON），指定后忽略 task_id/dataset/output')
+    parser.add_argument('--base_model', default='Qwen/Qwen2.5-7B-Instruct', help='基础模型')
+    parser.add_argument('--init_adapter', help='用于热启动的群体 Adapter 目录')
+    parser.add_argument('--no_resume', action='store_true', help='不从已有检查点恢复，重新开始训练')
+    parser.add_argument('--progress_file', help='结构化进度事件输出文件（JSON Lines）')
+    parser.add_argument('--config', default='configs/lora_config.yaml', help='配置文件路径')
+    parser.add_argument('--epochs', type=int, default=3, help='训练轮数')
+    parser.add_argument('--batch_size', type=int, default=4, help='批次大小')
+    parser.add_argument('--learning_rate', type=float, default=2e-4, help='学习率')
+    
+    args = parser.parse_args()
+    
+    if not args.batch_manifest and not (args.task_id and args.dataset and args.output):
+        parser.error('单任务模式需要 --task_id、--dataset 和 --output')
+    
+    # 加载配置
+    if os.path.exists(args.config):
+        config = load_config(args.config)
+    else:
+        logger.warning(f"配置文件不存在: {args.config}, 使用默认配置")
+        config = {}
+    
+    if args.batch_manifest:
+        results = run_batch(args, config)
+        sys.exit(0 if all(r['success'] for r in results) else 1)
+    
+    logger.info(f"任务 {args.task_id} 开始训练")
+    logger.info(f"数据集: {args.dataset}")
+    logger.info(f"输出路径: {args.output}")
+    
+    tokenizer, model = load_base_model(args.base_model)
+    
+    # 加载数据集
+    logger.info("加载数据集...")
+    tokenized_dataset = load_tokenized_dataset(args.dataset, tokenizer)
+    train_dataset, eval_dataset = split_dataset(tokenized_dataset, config)
+    data_collator = DataCollatorForLanguageModeling(tokenizer=tokenizer, mlm=False)
+    
+    if args.init_adapter:
+        logger.info(f"从群体 Adapter 热启动: {args.init_adapter}")
+        model = PeftModel.from_pretrained(model, args.init_adapter, is_trainable=True)
+    else:
+        model = get_peft_model(model, build_lora_config(config))
+    model.print_trainable_parameters()
     
     # 创建 Trainer
-    trainer = Trainer(
+    trainer = AsyncCheckpointTrainer(
         model=model,
-        args=training_args,
-        train_dataset=tokenized_dataset,
-        data_collator=data_collator
+        args=build_training_args(args, config, args.output, len(train_dataset), eval_dataset is not None),
+        train_dataset=train_dataset,
+        eval_dataset=eval_dataset,
+        data_collator=data_collator,
+        callbacks=build_callbacks(config, eval_dataset, args.progress_file)
     )
     
-    # 开始训练
+    # 开始训练（输出目录已有检查点时自动恢复）
     logger.info("开始训练...")
-    trainer.train()
+    train_result = trainer.train(
+        resume_from_checkpoint=find_resume_checkpoint(args.output, not args.no_resume)
+    )
+    
+    with open(Path(args.output) / 'metrics.json', 'w', encoding='utf-8') as f:
+        json.dump(collect_metrics(trainer, train_result, len(tokenized_dataset)), f, ensure_ascii=False, indent=2)
     
     # 保存模型
     logger.info("保存模型...")
     model.save_pretrained(args.output)
     tokenizer.save_pretrained(args.output)
+    remove_checkpoints(args.output)
     
     logger.info(f"训练完成，模型已保存到: {args.output}")
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
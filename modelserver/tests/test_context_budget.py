@@ -0,0 +1,47 @@
+"""
+聊天上下文预算：按 drop_block_turns 对齐丢弃起点时不丢掉放得下的历史
+
+用法: python -m pytest tests/test_context_budget.py
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from core.context_budget import ContextBudget, MESSAGE_OVERHEAD_TOKENS  # noqa: E402
+
+
+def make_budget(budget_tokens: int, drop_block_turns: int) -> ContextBudget:
+    budget = ContextBudget()
+    budget.budget_tokens = budget_tokens
+    budget.drop_block_turns = drop_block_turns
+    # 不加载分词器，按字符估算（英文约 4 字符一个 token）
+    budget.counter._loaded = True
+    budget._modelfile_system_tokens = 0
+    return budget
+
+
+def turn(size_tokens: int):
+    content = 'a' * (4 * (size_tokens - MESSAGE_OVERHEAD_TOKENS))
+    return [{'role': 'user', 'content': content}]
+
+
+def test_alignment_keeps_recent_turns_when_rounding_would_empty_history():
+    # 4 轮中只有最早一轮放不下；对齐到 4 会丢掉全部历史
+    budget = make_budget(budget_tokens=100, drop_block_turns=4)
+    history = turn(60) + turn(20) + turn(20) + turn(20)
+    window = budget.fit(history, 'hi')
+
+    assert window.dropped_turns == 1
+    assert window.kept_turns == 3
+    assert window.prompt_tokens <= budget.budget_tokens
+
+
+def test_alignment_rounds_dropped_turns_to_block():
+    budget = make_budget(budget_tokens=100, drop_block_turns=2)
+    history = turn(60) + turn(10) + turn(10) + turn(10) + turn(10)
+    window = budget.fit(history, 'hi')
+
+    # 只需丢弃 1 轮，对齐后丢弃 2 轮，仍保留最近的轮次
+    assert window.dropped_turns == 2
+    assert window.kept_turns == 3
@@ -1,9 +1,15 @@
 """
 工具函数模块
-包含日志、JSONL构建、System Prompt生成等工具
+包含日志、JSONL构建、System Prompt生成、微批处理、缓存、请求截止时间等工具
 """
 from .logger import logger
 from .jsonl_builder import JSONLBuilder
 from .system_prompt import SystemPromptGenerator
+from .micro_batcher import MicroBatcher
+from .ttl_cache import TTLCache
+from .single_flight import SingleFlight, SharedStream, normalize_messages, request_key
+from .hot_reload import HotReloadFile
+from .deadline import RequestAborted, deadline_after, run_until_disconnected
 
-__all__ = ['logger', 'JSONLBuilder', 'SystemPromptGenerator']
+__all__ = ['logger', 'JSONLBuilder', 'SystemPromptGenerator', 'MicroBatcher', 'TTLCache', 'SingleFlight', 'SharedStream',
+           'request_key', 'normalize_messages', 'HotReloadFile', 'RequestAborted', 'deadline_after', 'run_until_disconnected']
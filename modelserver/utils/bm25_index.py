@@ -0,0 +1,246 @@
+"""
+分段式 BM25 索引（中文字符 n-gram）
+文档按字符一元/二元组切分（英文与数字按词），词项用稳定的 64 位哈希表示。
+每次追加文档写入一个不可变的段（排好序的词项、倒排表、词频、文档长度），
+段文件以内存映射方式打开，查询时对每个段做二分查找与向量化打分；段数过多时合并为一个
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .logger import logger
+
+# 中日韩文字逐字切分，英文与数字按词切分
+_TOKEN = re.compile(r'[\u3400-\u9fff\uf900-\ufaff]|[a-z0-9]+')
+
+
+def term_hash(term: str) -> int:
+    """词项的稳定 64 位哈希（跨进程一致）"""
+    return int.from_bytes(hashlib.blake2b(term.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    切分为一元与二元组
+
+    :param text: 文本
+    :return: 词项列表（可重复）
+    """
+    tokens = _TOKEN.findall((text or '').lower())
+    return tokens + [a + b for a, b in zip(tokens, tokens[1:])]
+
+
+class Segment:
+    """不可变的索引段（内存映射）"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.terms = self._map('terms.npy')
+        self.offsets = self._map('offsets.npy')
+        self.postings = self._map('postings.npy')
+        self.tfs = self._map('tfs.npy')
+        self.doc_len = self._map('doc_len.npy')
+        self.total_len = float(self.doc_len.sum())
+        with open(path / 'docs.json', 'r', encoding='utf-8') as f:
+            self.docs: List[Dict[str, Any]] = json.load(f)
+
+    def _map(self, name: str) -> np.ndarray:
+        # 以普通 ndarray 视图访问内存映射，避免 np.memmap 子类在每次切片时的额外开销
+        return np.load(self.path / name, mmap_mode='r').view(np.ndarray)
+
+    @staticmethod
+    def write(path: Path, docs: List[Dict[str, Any]], fields: Sequence[str]):
+        """
+        把一批文档写成段
+
+        :param path: 段目录
+        :param docs: 文档（原样保存在 docs.json）
+        :param fields: 参与检索的字段
+        """
+        hashes: Dict[str, int] = {}
+        term_ids, doc_ids, tfs, doc_len = [], [], [], []
+        for local, doc in enumerate(docs):
+            counts = Counter(tokenize("\n".join(str(doc.get(field) or '') for field in fields)))
+            doc_len.append(sum(counts.values()))
+            for term, tf in counts.items():
+                h = hashes.get(term)
+                if h is None:
+                    h = hashes[term] = term_hash(term)
+                term_ids.append(h)
+                doc_ids.append(local)
+                tfs.append(tf)
+
+        term_arr = np.asarray(term_ids, dtype=np.uint64)
+        doc_arr = np.asarray(doc_ids, dtype=np.int32)
+        order = np.lexsort((doc_arr, term_arr))
+        term_arr, doc_arr = term_arr[order], doc_arr[order]
+        terms, starts = np.unique(term_arr, return_index=True)
+
+        tmp = path.with_name(path.name + '.tmp')
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        np.save(tmp / 'terms.npy', terms)
+        np.save(tmp / 'offsets.npy', np.append(starts, len(term_arr)).astype(np.int64))
+        np.save(tmp / 'postings.npy', doc_arr)
+        np.save(tmp / 'tfs.npy', np.asarray(tfs, dtype=np.float32)[order])
+        np.save(tmp / 'doc_len.npy', np.asarray(doc_len, dtype=np.int32))
+        with open(tmp / 'docs.json', 'w', encoding='utf-8') as f:
+            json.dump(docs, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def lookup(self, query_terms: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        在段中查找查询词项
+
+        :param query_terms: 查询词项哈希（已去重）
+        :return: (是否存在, 在 terms 中的位置)
+        """
+        if not len(self.terms):
+            return np.zeros(len(query_terms), dtype=bool), np.zeros(len(query_terms), dtype=np.int64)
+        idx = np.minimum(np.searchsorted(self.terms, query_terms), len(self.terms) - 1)
+        return self.terms[idx] == query_terms, idx
+
+
+class SegmentedBM25Index:
+    """分段式 BM25 索引"""
+
+    def __init__(self, path: Path, fields: Sequence[str], k1: float = 1.2, b: float = 0.75,
+                 max_segments: int = 8):
+        """
+        打开（或新建）索引目录
+
+        :param path: 索引目录
+        :param fields: 参与检索的文档字段
+        :param k1: BM25 词频饱和参数
+        :param b: BM25 文档长度归一化参数
+        :param max_segments: 段数超过该值时合并
+        """
+        self.path = Path(path)
+        self.fields = tuple(fields)
+        self.k1 = k1
+        self.b = b
+        self.max_segments = max_segments
+        self.manifest: Dict[str, Any] = {'segments': [], 'next_segment': 0, 'meta': {}}
+        self.segments: List[Segment] = []
+        self._write_lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        manifest_path = self.path / 'manifest.json'
+        if manifest_path.exists():
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                self.manifest = json.load(f)
+        self.segments = [Segment(self.path / name) for name in self.manifest['segments']]
+
+    def _commit(self, manifest: Dict[str, Any]):
+        """原子写入清单并切换到新的段列表（查询方要么看到旧列表，要么看到新列表）"""
+        tmp = self.path / 'manifest.json.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp, self.path / 'manifest.json')
+        segments = [Segment(self.path / name) for name in manifest['segments']]
+        obsolete = set(self.manifest['segments']) - set(manifest['segments'])
+        self.manifest, self.segments = manifest, segments
+        for name in obsolete:
+            shutil.rmtree(self.path / name, ignore_errors=True)
+
+    @property
+    def meta(self) -> Dict[str, Any]:
+        """调用方保存的附加信息（如增量同步的水位）"""
+        return self.manifest.get('meta', {})
+
+    @property
+    def doc_count(self) -> int:
+        return sum(len(segment.docs) for segment in self.segments)
+
+    def add_documents(self, docs: List[Dict[str, Any]], meta: Optional[Dict[str, Any]] = None):
+        """
+        追加文档（写入一个新段）
+
+        :param docs: 文档
+        :param meta: 同时更新的附加信息
+        """
+        with self._write_lock:
+            manifest = json.loads(json.dumps(self.manifest))
+            if meta:
+                manifest['meta'] = {**manifest.get('meta', {}), **meta}
+            self.path.mkdir(parents=True, exist_ok=True)
+            if docs:
+                name = f"seg_{manifest['next_segment']:05d}"
+                Segment.write(self.path / name, docs, self.fields)
+                manifest['segments'].append(name)
+                manifest['next_segment'] += 1
+            self._commit(manifest)
+
+        if len(self.segments) > self.max_segments:
+            self.compact()
+
+    def compact(self):
+        """把所有段合并为一个"""
+        with self._write_lock:
+            docs = [doc for segment in self.segments for doc in segment.docs]
+            manifest = json.loads(json.dumps(self.manifest))
+            name = f"seg_{manifest['next_segment']:05d}"
+            Segment.write(self.path / name, docs, self.fields)
+            manifest['segments'] = [name]
+            manifest['next_segment'] += 1
+            self._commit(manifest)
+        logger.info(f"BM25 索引已合并: {self.path}（{len(docs)} 篇文档）")
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[float, Dict[str, Any]]]:
+        """
+        检索
+
+        :param query: 查询文本
+        :param top_k: 返回的文档数
+        :return: [(得分, 文档)]，按得分降序
+        """
+        segments = self.segments
+        terms = tokenize(query)
+        if not segments or not terms:
+            return []
+
+        query_terms = np.unique(np.asarray([term_hash(t) for t in set(terms)], dtype=np.uint64))
+        lookups = [segment.lookup(query_terms) for segment in segments]
+
+        # 全局统计：文档数、平均长度、各词项的文档频率
+        n_docs = sum(len(segment.doc_len) for segment in segments)
+        avgdl = max(sum(segment.total_len for segment in segments) / max(n_docs, 1), 1.0)
+        df = np.zeros(len(query_terms))
+        for segment, (hit, idx) in zip(segments, lookups):
+            df[hit] += segment.offsets[idx[hit] + 1] - segment.offsets[idx[hit]]
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+
+        candidates: List[Tuple[float, Dict[str, Any]]] = []
+        for segment, (hit, idx) in zip(segments, lookups):
+            if not hit.any():
+                continue
+            scores = np.zeros(len(segment.doc_len))
+            norm = self.k1 * (1 - self.b + self.b * segment.doc_len / avgdl)
+            for j in np.flatnonzero(hit):
+                start, end = segment.offsets[idx[j]], segment.offsets[idx[j] + 1]
+                docs, tf = segment.postings[start:end], segment.tfs[start:end]
+                scores[docs] += idf[j] * tf * (self.k1 + 1) / (tf + norm[docs])
+
+            k = min(top_k, len(scores))
+            best = np.argpartition(-scores, k - 1)[:k]
+            candidates.extend((float(scores[i]), segment.docs[i]) for i in best if scores[i] > 0)
+
+        candidates.sort(key=lambda item: -item[0])
+        return candidates[:top_k]
+
+    def clear(self):
+        """删除整个索引"""
+        with self._write_lock:
+            shutil.rmtree(self.path, ignore_errors=True)
+            self.manifest = {'segments': [], 'next_segment': 0, 'meta': {}}
+            self.segments = []
+
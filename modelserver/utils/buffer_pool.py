@@ -0,0 +1,108 @@
+"""
+可复用的上传缓冲区
+按块把上传内容读入复用的 bytearray，解码时直接从内存视图读取，
+避免整包 bytes 拼接与 base64 解码带来的额外拷贝
+"""
+import io
+import threading
+from typing import List
+
+
+class UploadTooLargeError(ValueError):
+    """上传内容超过大小限制"""
+
+
+class BufferPool:
+    """bytearray 缓冲池"""
+
+    def __init__(self, max_buffers: int = 8, initial_size: int = 1024 * 1024,
+                 max_size: int = 10 * 1024 * 1024):
+        """
+        初始化缓冲池
+
+        :param max_buffers: 池中最多保留的缓冲区数量
+        :param initial_size: 新缓冲区的初始容量（字节）
+        :param max_size: 单次上传允许的最大字节数
+        """
+        self.max_buffers = max_buffers
+        self.initial_size = initial_size
+        self.max_size = max_size
+        self._buffers: List[bytearray] = []
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bytearray:
+        """取出一个缓冲区（池空时新建）"""
+        with self._lock:
+            if self._buffers:
+                return self._buffers.pop()
+        return bytearray(self.initial_size)
+
+    def release(self, buffer: bytearray):
+        """
+        归还缓冲区（调用前必须释放所有指向它的 memoryview）
+
+        :param buffer: 缓冲区
+        """
+        with self._lock:
+            if len(self._buffers) < self.max_buffers:
+                self._buffers.append(buffer)
+
+    def write(self, buffer: bytearray, offset: int, chunk: bytes) -> int:
+        """
+        把一个数据块写入缓冲区指定位置，容量不足时扩容
+
+        :param buffer: 缓冲区
+        :param offset: 写入位置
+        :param chunk: 数据块
+        :return: 写入后的数据长度
+        """
+        end = offset + len(chunk)
+        if end > self.max_size:
+            raise UploadTooLargeError(f"上传内容超过 {self.max_size // 1024 // 1024}MB 限制")
+
+        if end > len(buffer):
+            buffer.extend(bytes(max(end - len(buffer), len(buffer))))
+        buffer[offset:end] = chunk
+        return end
+
+
+class BufferReader(io.RawIOBase):
+    """只读、可 seek 的内存视图文件对象，供图片解码器直接读取缓冲区"""
+
+    def __init__(self, data):
+        super().__init__()
+        self._view = memoryview(data)
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, target) -> int:
+        size = min(len(target), len(self._view) - self._pos)
+        if size <= 0:
+            return 0
+        target[:size] = self._view[self._pos:self._pos + size]
+        self._pos += size
+        return size
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        elif whence == io.SEEK_END:
+            self._pos = len(self._view) + offset
+        self._pos = max(0, self._pos)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+    def close(self):
+        # 释放 memoryview，缓冲区才能被扩容或复用
+        if not self.closed:
+            self._view.release()
+        super().close()
@@ -0,0 +1,75 @@
+"""
+请求截止时间与客户端断开检测
+把耗时的处理（如等待模型生成）放在独立任务中执行，期间定期检查客户端是否已断开、
+是否已超过客户端给出的截止时间；任一条件满足即取消该任务，
+取消沿调用链传到上游请求（关闭与 Ollama 的连接），后端随即停止生成
+"""
+import asyncio
+import time
+from typing import Any, Awaitable, Optional
+
+from prometheus_client import Counter
+
+REQUESTS_ABORTED = Counter(
+    'afs_requests_aborted_total',
+    '中止的请求数（disconnect 客户端断开 / deadline 超过截止时间）',
+    ['reason']
+)
+
+
+class RequestAborted(Exception):
+    """请求被中止（客户端已断开或已超过截止时间）"""
+
+    def __init__(self, reason: str):
+        super().__init__("客户端已断开" if reason == 'disconnect' else "已超过请求截止时间")
+        self.reason = reason
+
+
+def deadline_after(timeout_ms: Optional[float]) -> Optional[float]:
+    """
+    把客户端给出的剩余时长换算为截止时刻
+
+    :param timeout_ms: 剩余时长（毫秒，None 或 <= 0 表示不限）
+    :return: time.monotonic() 时刻（不限时为 None）
+    """
+    if not timeout_ms or timeout_ms <= 0:
+        return None
+    return time.monotonic() + timeout_ms / 1000
+
+
+async def run_until_disconnected(request: Any, awaitable: Awaitable[Any],
+                                 deadline: Optional[float] = None, poll_interval: float = 0.25) -> Any:
+    """
+    执行处理，客户端断开或超过截止时间时取消
+
+    :param request: Starlette 请求（用于 is_disconnected 检查）
+    :param awaitable: 要执行的协程
+    :param deadline: 截止时刻（time.monotonic()，None 表示不限）
+    :param poll_interval: 检查客户端连接的间隔（秒）
+    :return: 处理结果
+    :raises RequestAborted: 客户端已断开或已超过截止时间
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            timeout = poll_interval
+            if deadline is not None:
+                timeout = min(timeout, max(0.0, deadline - time.monotonic()))
+            done, _ = await asyncio.wait({task}, timeout=timeout)
+            if done:
+                return task.result()
+
+            if deadline is not None and time.monotonic() >= deadline:
+                reason = 'deadline'
+            elif await request.is_disconnected():
+                reason = 'disconnect'
+            else:
+                continue
+
+            REQUESTS_ABORTED.labels(reason=reason).inc()
+            raise RequestAborted(reason)
+    finally:
+        if not task.done():
+            task.cancel()
+            # 等待取消完成，确保上游连接在返回前已经关闭
+            await asyncio.gather(task, return_exceptions=True)
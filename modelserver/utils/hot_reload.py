@@ -0,0 +1,92 @@
+"""
+可热加载的 YAML 数据文件
+首次访问时加载并编译为不可变对象；之后按间隔检查文件修改时间，
+变化时重新编译并整体替换引用，编译失败则继续使用旧版本；
+手动重新加载（strict）时编译失败直接抛出异常，调用方可以把错误返回给操作人员
+"""
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Generic, Optional, TypeVar
+
+import yaml
+
+from .logger import logger
+
+T = TypeVar('T')
+
+
+class HotReloadFile(Generic[T]):
+    """可热加载的 YAML 数据文件"""
+
+    def __init__(self, path: Path, build: Callable[[Dict[str, Any]], T], name: str,
+                 reload_check_seconds: float = 5):
+        """
+        初始化（首次访问 current 时加载）
+
+        :param path: 文件路径
+        :param build: 把 YAML 解析结果编译为不可变对象的函数（校验失败时抛出异常）
+        :param name: 名称（用于日志）
+        :param reload_check_seconds: 检查文件变化的间隔（秒）
+        """
+        self.path = Path(path)
+        self.build = build
+        self.name = name
+        self.reload_check_seconds = reload_check_seconds
+
+        self._current: Optional[T] = None
+        self._mtime = 0.0
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def current(self) -> T:
+        """当前版本（按间隔检查文件是否变化，变化时自动重新加载）"""
+        now = time.monotonic()
+        if self._current is None or now - self._last_check >= self.reload_check_seconds:
+            self._last_check = now
+            try:
+                changed = os.stat(self.path).st_mtime != self._mtime
+            except OSError:
+                changed = self._current is None
+            if changed:
+                self.reload()
+        return self._current
+
+    def reload(self, strict: bool = False) -> T:
+        """
+        重新加载文件；新内容校验失败时保留旧版本
+
+        :param strict: 校验失败时是否抛出异常（否则记录日志并返回旧版本）
+        :return: 当前版本
+        :raises ValueError: YAML 语法错误或内容校验失败（首次加载或 strict 时）
+        :raises OSError: 文件无法读取（首次加载或 strict 时）
+        """
+        with self._lock:
+            mtime = None
+            try:
+                mtime = os.stat(self.path).st_mtime
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    try:
+                        raw = yaml.safe_load(f) or {}
+                    except yaml.YAMLError as e:
+                        raise ValueError(f"YAML 语法错误: {e}") from e
+                if not isinstance(raw, dict):
+                    raise ValueError("文件顶层必须是映射")
+                compiled = self.build(raw)
+            except Exception as e:
+                # 记下失败的修改时间，同一份错误内容不会在每次检查时重复加载、重复记录日志
+                if mtime is not None:
+                    self._mtime = mtime
+                if strict or self._current is None:
+                    raise
+                logger.error(f"{self.name}重新加载失败，继续使用版本 "
+                             f"{getattr(self._current, 'version', None)}: {e}")
+                return self._current
+
+            # 整体替换引用，读取方要么看到旧版本，要么看到新版本
+            self._current = compiled
+            self._mtime = mtime
+            logger.info(f"{self.name}已加载: {self.path}（版本 {getattr(compiled, 'version', None)}）")
+            return compiled
@@ -0,0 +1,87 @@
+"""
+图片压缩包读取
+逐个读取 zip / tar(.gz) 中的图片成员，供批量病害检测按需取用，
+任意时刻内存中只保留正在处理的图片
+"""
+import tarfile
+import zipfile
+from pathlib import PurePosixPath
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+from .buffer_pool import UploadTooLargeError
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.bmp'}
+
+ARCHIVE_EXTENSIONS = {
+    '.zip': 'zip',
+    '.tar': 'tar',
+    '.tgz': 'tar',
+    '.gz': 'tar'
+}
+
+ARCHIVE_CONTENT_TYPES = {
+    'application/zip': 'zip',
+    'application/x-zip-compressed': 'zip',
+    'application/x-tar': 'tar',
+    'application/gzip': 'tar',
+    'application/x-gzip': 'tar',
+    'application/x-gtar': 'tar'
+}
+
+# (成员路径, 图片字节, 读取错误)
+ArchiveImage = Tuple[str, Optional[bytes], Optional[Exception]]
+
+
+def archive_kind(filename: Optional[str]) -> Optional[str]:
+    """
+    根据文件名判断压缩包类型
+
+    :param filename: 文件名
+    :return: 'zip'、'tar'，非压缩包返回 None
+    """
+    if not filename:
+        return None
+    return ARCHIVE_EXTENSIONS.get(PurePosixPath(filename.lower()).suffix)
+
+
+def is_image_member(name: str) -> bool:
+    """是否为需要检测的图片（跳过隐藏文件与 macOS 附带的元数据目录）"""
+    path = PurePosixPath(name)
+    if any(part.startswith('.') or part == '__MACOSX' for part in path.parts):
+        return False
+    return path.suffix.lower() in IMAGE_EXTENSIONS
+
+
+def iter_archive_images(fileobj: BinaryIO, kind: str, max_member_size: int) -> Iterator[ArchiveImage]:
+    """
+    逐个读取压缩包中的图片（同步生成器，应在线程池中推进）
+
+    :param fileobj: 压缩包文件对象（zip 需可 seek，tar 按流式读取）
+    :param kind: 'zip' 或 'tar'
+    :param max_member_size: 单张图片的最大字节数，超出时返回错误而不读取
+    :return: (成员路径, 图片字节, 错误) 迭代器
+    """
+    too_large = f"图片超过 {max_member_size // 1024 // 1024}MB 限制"
+
+    try:
+        if kind == 'zip':
+            with zipfile.ZipFile(fileobj) as archive:
+                for info in archive.infolist():
+                    if info.is_dir() or not is_image_member(info.filename):
+                        continue
+                    if info.file_size > max_member_size:
+                        yield info.filename, None, UploadTooLargeError(too_large)
+                        continue
+                    yield info.filename, archive.read(info), None
+        else:
+            # 流式模式：不需要 seek，也不会把整个 tar 展开到内存
+            with tarfile.open(fileobj=fileobj, mode='r|*') as archive:
+                for member in archive:
+                    if not member.isfile() or not is_image_member(member.name):
+                        continue
+                    if member.size > max_member_size:
+                        yield member.name, None, UploadTooLargeError(too_large)
+                        continue
+                    yield member.name, archive.extractfile(member).read(), None
+    except (zipfile.BadZipFile, tarfile.TarError, EOFError) as e:
+        raise ValueError(f"压缩包格式错误: {e}")
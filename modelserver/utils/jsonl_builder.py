@@ -4,6 +4,8 @@ JSONL 数据集构建器
 """
 import json
 import os
+import random
+import re
 from pathlib import Path
 from typing import List, Dict, Any, Optional
 from datetime import datetime
@@ -49,7 +51,7 @@ class JSONLBuilder:
         :param elder_id: 老人 ID
         :return: 记忆数据列表
         """
-        if not self.db:
+        if self.db is None:
             self.connect()
         
         try:
@@ -66,7 +68,7 @@ class JSONLBuilder:
             for answer in answers:
                 question_id = answer.get('questionId')
                 if question_id:
-                    question = self.db.questions.findOne({'_id': question_id})
+                    question = self.db.questions.find_one({'_id': question_id})
                     if question:
                         memories.append({
                             'question': question.get('questionText', ''),
@@ -80,6 +82,41 @@ class JSONLBuilder:
             logger.error(f"拉取老人记忆数据失败: {e}")
             return []
     
+    def fetch_memories_since(self, elder_id: str, after_id: Optional[str] = None,
+                             limit: int = 5000) -> List[Dict[str, Any]]:
+        """
+        按 _id 顺序增量拉取老人的问答（用于检索索引）
+        
+        :param elder_id: 老人 ID
+        :param after_id: 上次拉取到的最后一条回答 _id（为空时从头拉取）
+        :param limit: 单次最多拉取的条数
+        :return: 问答列表，每条包含 id、question、answer、category
+        """
+        from bson import ObjectId
+        
+        if self.db is None:
+            self.connect()
+        
+        query = {'elderId': elder_id, 'answer': {'$exists': True, '$ne': ''}}
+        if after_id:
+            query['_id'] = {'$gt': ObjectId(after_id)}
+        answers = list(self.db.answers.find(query).sort('_id', 1).limit(limit))
+        
+        # 一次查询关联所有问题
+        question_ids = list({a['questionId'] for a in answers if a.get('questionId')})
+        questions = {q['_id']: q for q in self.db.questions.find({'_id': {'$in': question_ids}})} if question_ids else {}
+        
+        memories = []
+        for answer in answers:
+            question = questions.get(answer.get('questionId'), {})
+            memories.append({
+                'id': str(answer['_id']),
+                'question': question.get('questionText', ''),
+                'answer': answer.get('answer', ''),
+                'category': question.get('category', 'general')
+            })
+        return memories
+    
     def format_to_chat_template(self, memories: List[Dict[str, Any]], 
                                 elder_name: str = "长辈") -> List[str]:
         """
@@ -153,6 +190,64 @@ class JSONLBuilder:
         logger.info(f"JSONL 数据集已生成: {jsonl_file} ({len(formatted_texts)} 条数据)")
         return str(jsonl_file)
     
+    def build_population_jsonl(self, elder_ids: List[str] = None, output_dir: str = None,
+                               max_per_elder: int = 200) -> Optional[str]:
+        """
+        汇总多位老人的回答构建群体数据集（匿名化），用于训练群体 Adapter
+        
+        匿名化处理：统一使用通用称呼、不写入老人 ID 与时间、屏蔽手机号和身份证号，
+        并打乱样本顺序
+        
+        :param elder_ids: 参与汇总的老人 ID 列表（默认所有有回答的老人）
+        :param output_dir: 输出目录，默认从配置读取
+        :param max_per_elder: 每位老人最多取用的样本数（避免个别老人主导群体风格）
+        :return: 生成的 JSONL 文件路径
+        """
+        if self.db is None:
+            self.connect()
+        
+        if not output_dir:
+            output_dir = config.get_paths().get('jsonl_output', '/app/data/jsonl')
+        
+        output_path = Path(output_dir)
+        output_path.mkdir(parents=True, exist_ok=True)
+        
+        if not elder_ids:
+            elder_ids = [eid for eid in self.db.answers.distinct('elderId') if eid]
+        
+        logger.info(f"开始构建群体数据集，共 {len(elder_ids)} 位老人...")
+        
+        formatted_texts = []
+        for elder_id in elder_ids:
+            memories = self.fetch_elder_memories(elder_id)
+            if len(memories) > max_per_elder:
+                memories = random.sample(memories, max_per_elder)
+            
+            for memory in memories:
+                memory['answer'] = self._anonymize(memory.get('answer', ''))
+            formatted_texts.extend(self.format_to_chat_template(memories))
+        
+        if not formatted_texts:
+            logger.warning("没有可用于群体数据集的记忆数据")
+            return None
+        
+        random.shuffle(formatted_texts)
+        
+        jsonl_file = output_path / "population_training.jsonl"
+        with open(jsonl_file, 'w', encoding='utf-8') as f:
+            for text in formatted_texts:
+                f.write(json.dumps({"text": text}, ensure_ascii=False) + '\n')
+        
+        logger.info(f"群体数据集已生成: {jsonl_file} ({len(formatted_texts)} 条数据)")
+        return str(jsonl_file)
+    
+    @staticmethod
+    def _anonymize(text: str) -> str:
+        """屏蔽文本中的身份证号与手机号"""
+        text = re.sub(r'\d{17}[\dXx]', '[身份证号]', text)
+        text = re.sub(r'1[3-9]\d{9}', '[手机号]', text)
+        return text
+    
     def export_jsonl(self, elder_id: str, output_path: str = None) -> Optional[str]:
         """
         导出老人的 JSONL 数据集（API 调用接口）
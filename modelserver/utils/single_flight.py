@@ -0,0 +1,183 @@
+"""
+异步单飞（single-flight）
+同一个键的并发请求只执行一次计算，其余请求等待并共享同一结果；
+计算在独立任务中运行，发起者被取消（如客户端断开）不会影响其他等待者；
+可选在所有等待者都离开后取消计算本身，不再为无人接收的结果消耗算力。
+流式计算（如逐 token 生成）同样可以合并：后加入的请求先补发已产生的分片，再继续接收新分片
+"""
+import asyncio
+import hashlib
+import json
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional
+
+
+def request_key(*parts: Any) -> str:
+    """
+    把请求参数转换为合并键（规范化 JSON 的哈希，字典键顺序不影响结果）
+
+    :param parts: 可 JSON 序列化的请求参数
+    :return: 十六进制哈希
+    """
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def normalize_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    只保留影响生成的消息字段（用于计算合并键）
+
+    内容按原样参与合并键：首尾空白不同的提示分词结果可能不同，不能共享同一份输出
+    """
+    return [
+        {'role': m.get('role'), 'content': m.get('content') or '', 'images': m.get('images')}
+        for m in messages
+    ]
+
+
+class SharedStream:
+    """一次流式计算的输出，可被多个订阅者各自从头读取"""
+
+    def __init__(self):
+        self.chunks: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._changed = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.subscribers = 0
+        self.on_abandoned: Optional[Callable[[], None]] = None
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def publish(self, chunk: Any):
+        """追加一个分片"""
+        self.chunks.append(chunk)
+        self._notify()
+
+    def finish(self, error: Optional[BaseException] = None):
+        """结束（error 不为空时订阅者读完已有分片后收到该异常）"""
+        self.done = True
+        self.error = error
+        self._notify()
+
+    async def subscribe(self) -> AsyncIterator[Any]:
+        """从第一个分片开始读取，直到计算结束"""
+        position = 0
+        self.subscribers += 1
+        try:
+            while True:
+                changed = self._changed
+                while position < len(self.chunks):
+                    yield self.chunks[position]
+                    position += 1
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await changed.wait()
+        finally:
+            self.subscribers -= 1
+            if not self.subscribers and not self.done and self.on_abandoned is not None:
+                self.on_abandoned()
+
+
+class SingleFlight:
+    """按键合并并发计算"""
+
+    def __init__(self, cancel_abandoned: bool = False):
+        """
+        :param cancel_abandoned: 所有等待者（订阅者）都已离开时是否取消进行中的计算
+        """
+        self.cancel_abandoned = cancel_abandoned
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self._streams: Dict[Hashable, SharedStream] = {}
+        self._waiting: Dict[asyncio.Task, int] = {}
+        self.joined = 0  # 加入已有计算（未重复执行）的请求数
+        self.abandoned = 0  # 因无人等待而取消的计算数
+
+    @property
+    def active(self) -> int:
+        """正在进行的计算数"""
+        return len(self._calls) + len(self._streams)
+
+    def in_flight(self, key: Hashable) -> bool:
+        """该键是否有正在进行的计算"""
+        return key in self._calls or key in self._streams
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        执行或加入一次计算
+
+        :param key: 合并键
+        :param func: 无参协程函数，只在没有进行中的同键计算时调用
+        :return: 计算结果（异常同样共享给所有等待者）
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._calls[key] = task
+            task.add_done_callback(lambda done, k=key: self._forget(k, done))
+        else:
+            self.joined += 1
+
+        self._waiting[task] = self._waiting.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._waiting[task] -= 1
+            if not self._waiting[task]:
+                del self._waiting[task]
+                if self.cancel_abandoned and not task.done():
+                    self.abandoned += 1
+                    # 立即移除，取消完成前到达的相同请求重新开始计算，而不是加入正在取消的计算
+                    if self._calls.get(key) is task:
+                        del self._calls[key]
+                    task.cancel()
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # 所有等待者都已取消时避免“异常未被获取”的警告
+        if not task.cancelled():
+            task.exception()
+
+    def stream(self, key: Hashable, func: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        """
+        执行或加入一次流式计算
+
+        :param key: 合并键
+        :param func: 无参函数，返回异步迭代器；只在没有进行中的同键计算时调用
+        :return: 从第一个分片开始的异步迭代器（异常在读完已有分片后抛出）
+        """
+        shared = self._streams.get(key)
+        if shared is None:
+            shared = SharedStream()
+            self._streams[key] = shared
+            shared.task = asyncio.ensure_future(self._produce(key, shared, func))
+            if self.cancel_abandoned:
+                shared.on_abandoned = lambda: self._abandon_stream(key, shared)
+        else:
+            self.joined += 1
+        return shared.subscribe()
+
+    def _abandon_stream(self, key: Hashable, shared: SharedStream):
+        self.abandoned += 1
+        # 同 do()：取消完成前到达的相同请求开始新的计算
+        if self._streams.get(key) is shared:
+            del self._streams[key]
+        shared.task.cancel()
+
+    async def _produce(self, key: Hashable, shared: SharedStream, func: Callable[[], AsyncIterator[Any]]):
+        error = None
+        try:
+            async for chunk in func():
+                shared.publish(chunk)
+        except BaseException as e:
+            error = e
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        finally:
+            if self._streams.get(key) is shared:
+                del self._streams[key]
+            shared.finish(error)
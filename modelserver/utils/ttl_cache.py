@@ -0,0 +1,110 @@
+"""
+LRU + TTL 缓存
+线程安全、容量有界，条目超过存活时间后惰性淘汰，并统计命中率
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Tuple
+
+
+class TTLCache:
+    """LRU + TTL 缓存"""
+
+    def __init__(self, max_size: int = 1024, ttl_seconds: float = 3600):
+        """
+        初始化缓存
+
+        :param max_size: 最大条目数（超出时淘汰最久未使用的条目）
+        :param ttl_seconds: 条目存活时间（秒，<= 0 表示不过期）
+        """
+        self.max_size = max(1, max_size)
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _expired(self, stored_at: float, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - stored_at > self.ttl_seconds
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        读取条目（命中时刷新 LRU 顺序）
+
+        :param key: 键
+        :param default: 未命中时的返回值
+        :return: 缓存值
+        """
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or self._expired(item[0], now):
+                if item is not None:
+                    del self._data[key]
+                    self.evictions += 1
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key: Hashable, value: Any):
+        """
+        写入条目
+
+        :param key: 键
+        :param value: 值
+        """
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """删除并返回条目"""
+        with self._lock:
+            item = self._data.pop(key, None)
+        return item[1] if item is not None else default
+
+    def items(self) -> List[Tuple[Hashable, Any]]:
+        """返回未过期条目的快照（不影响 LRU 顺序与命中统计）"""
+        now = time.monotonic()
+        with self._lock:
+            return [(k, v) for k, (stored_at, v) in self._data.items() if not self._expired(stored_at, now)]
+
+    def purge_expired(self) -> int:
+        """主动清理过期条目，返回清理数量"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [k for k, (stored_at, _) in self._data.items() if self._expired(stored_at, now)]
+            for k in expired:
+                del self._data[k]
+            self.evictions += len(expired)
+        return len(expired)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        """命中率等统计信息"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0
+            }